@@ -0,0 +1,115 @@
+import re
+from typing import Any, Callable, List, Optional, Tuple
+
+SCRATCH_TOKEN_BUDGET = 6000
+KEEP_RECENT_STEPS = 2
+OBSERVATION_TOKENS = 200
+COMPACT_BLOCK_STEPS = 2
+
+_CJK = re.compile(r'[　-〿㐀-䶿一-鿿＀-￯]')
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数：中文字符按 1 个 token，其余字符按 4 个字符 1 个 token。"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, limit: int, count_tokens: Callable[[str], int] = estimate_tokens) -> str:
+    """保留 text 开头不超过 limit 个 token 的部分，并注明省略的字数。"""
+    if count_tokens(text) <= limit:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= limit:
+            low = middle
+        else:
+            high = middle - 1
+    return f"{text[:low]}...(省略{len(text) - low}字)"
+
+
+class ScratchStep:
+    """
+    一轮思考的记录：思考内容、各工具调用及其观察结果，或最终答案。
+    render 的格式与原来直接拼接的 agent_scratch 一致。
+    """
+
+    def __init__(self, thought: str,
+                 records: Optional[List[Tuple[Any, Any]]] = None,
+                 final_answer: Optional[str] = None):
+        self.thought = thought
+        self.records = records or []
+        self.final_answer = final_answer
+
+    def render(self, observation_tokens: Optional[int] = None,
+               count_tokens: Callable[[str], int] = estimate_tokens) -> str:
+        """observation_tokens 为 None 时原样输出，为 0 时省略观察结果，否则截断到该 token 数。"""
+        if self.final_answer is not None:
+            return f"\n思考: {self.thought}\n最终结果: {self.final_answer}\n"
+
+        text = f"\n思考: {self.thought}\n"
+        for action, observation in self.records:
+            observation = str(observation)
+            if observation_tokens == 0:
+                observation = f"(已省略{len(observation)}字)"
+            elif observation_tokens is not None:
+                observation = truncate_to_tokens(observation, observation_tokens, count_tokens)
+            text += f"行动: {action}\n观察: {observation}\n"
+        return text
+
+
+class Scratchpad:
+    """
+    按 token 预算管理 agent 的思考进程。
+    最近 keep_recent 轮保持原样；超出预算时，从最早的未压缩轮次开始，每次压缩 block_steps 轮：
+    先把观察结果截断到 observation_tokens，仍超出预算时再省略较早轮次的观察结果。
+    没有发生压缩的轮次之间，新内容只在末尾追加，提示词前缀逐字节一致，便于命中服务端的前缀缓存。
+    压缩会改写被压缩轮次及其之后的前缀：每轮最多被改写两次（级别 1 截断观察，级别 2 省略观察），
+    且只在超出预算时按 block_steps 成批进行，使前缀失效的次数有限但并非为零。
+    """
+
+    def __init__(self, token_budget: int = SCRATCH_TOKEN_BUDGET,
+                 keep_recent: int = KEEP_RECENT_STEPS,
+                 observation_tokens: int = OBSERVATION_TOKENS,
+                 block_steps: int = COMPACT_BLOCK_STEPS,
+                 count_tokens: Callable[[str], int] = estimate_tokens):
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.observation_tokens = observation_tokens
+        self.block_steps = max(1, block_steps)
+        self.count_tokens = count_tokens
+
+        self.steps: List[ScratchStep] = []
+        # 每轮当前的 (文本, token 数, 压缩级别)，级别 0 原样、1 截断观察、2 省略观察
+        self._entries: List[List[Any]] = []
+
+    def add(self, step: ScratchStep) -> None:
+        self.steps.append(step)
+        text = step.render()
+        self._entries.append([text, self.count_tokens(text), 0])
+        self._compact()
+
+    def tokens(self) -> int:
+        return sum(entry[1] for entry in self._entries)
+
+    def render(self) -> str:
+        return ''.join(entry[0] for entry in self._entries)
+
+    def full_text(self) -> str:
+        """未经压缩的完整思考进程，用于日志与调试。"""
+        return ''.join(step.render() for step in self.steps)
+
+    def _compact(self) -> None:
+        compactable = len(self._entries) - self.keep_recent
+        for level, limit in ((1, self.observation_tokens), (2, 0)):
+            while self.tokens() > self.token_budget:
+                pending = [i for i in range(compactable) if self._entries[i][2] < level]
+                if not pending:
+                    break
+                for i in pending[:self.block_steps]:
+                    text = self.steps[i].render(limit, self.count_tokens)
+                    self._entries[i] = [text, self.count_tokens(text), level]
+
+    def __str__(self) -> str:
+        return self.render()
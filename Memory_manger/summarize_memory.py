@@ -2,12 +2,18 @@
 import copy
 import sys
 import json
-from openai import OpenAI
 import os
-import httpx
 from Model_manager.API_service import CustomLLM
 
-llm_client = CustomLLM()
+_llm_client = None
+
+
+def _get_llm_client():
+    """第一次生成总结时才创建客户端，导入本模块不连接模型服务。"""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = CustomLLM()
+    return _llm_client
 
 
 def summarize_content_prompt(content, user_name, boot_name, language='cn'):
@@ -29,6 +35,7 @@ def summarize_memory(memory_file_path,
                      language='cn'):
     boot_name = 'AI'
     gen_prompt_num = 1
+    llm_client = _get_llm_client()
     memory = json.loads(open(memory_file_path, 'r', encoding='utf8').read())
 
     all_prompts, all_his_prompts, all_person_prompts = [], [], []
@@ -1,7 +1,13 @@
-import json
+import asyncio
 import os
-import httpx
-from openai import OpenAI
+import time
+import weakref
+
+from openai import AsyncOpenAI, OpenAI
+
+from Model_manager import http_pool
+from Model_manager.response_cache import default_response_cache
+from until import tracing
 
 
 # 配置 OpenAI 服务
@@ -14,43 +20,195 @@ class CustomLLM:
     def __init__(self,
                  model: str = model_name,
                  api_key: str = API_KEY,
-                 base_url: str = BASE_URL):
+                 base_url: str = BASE_URL,
+                 cache=None):
 
         self.api_key = api_key
         self.model_name = model
         self.base_url = base_url
+        self.temperature = 0.2
+        # 响应缓存默认关闭，可传入 ResponseCache 或设置 LLM_RESPONSE_CACHE 环境变量开启
+        self.cache = cache if cache is not None else default_response_cache()
 
+        # 连接池由同一服务地址的所有实例共享，重试与退避由 http_pool 统一处理
         self.client = OpenAI(
             api_key=self.api_key,
             base_url=self.base_url,
-            http_client=httpx.Client(verify=False)
+            http_client=http_pool.get_client(self.base_url, verify=False),
+            timeout=http_pool.default_timeout(),
+            max_retries=0
         )
+        # 异步客户端的连接池绑定在事件循环上，按循环分别创建
+        self._async_clients = weakref.WeakKeyDictionary()
 
         self.max_retry_time = 3
+        self.retry_policy = http_pool.RetryPolicy(max_attempts=self.max_retry_time)
+
+    @staticmethod
+    def _build_messages(sys_prompt, user_input):
+        return [{"role": "system", "content": sys_prompt},
+                {'role': 'user', 'content': user_input}]
+
+    def _cache_key(self, messages, use_cache=True):
+        if self.cache is None or not use_cache:
+            return None
+        return self.cache.make_key(self.model_name, self.temperature, messages)
+
+    @staticmethod
+    def _cacheable(response_content, validate):
+        """只缓存非空、且通过调用方校验（如能解析为 agent 需要的 JSON）的响应。"""
+        return bool(response_content) and (validate is None or validate(response_content))
+
+    @staticmethod
+    def _parse_completion(completion):
+        return completion.choices[0].message.content
+
+    @staticmethod
+    def _record_usage(span, usage):
+        if usage is not None:
+            span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+
+    def _get_async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=http_pool.get_async_client(self.base_url, verify=False),
+                timeout=http_pool.default_timeout(),
+                max_retries=0
+            )
+            self._async_clients[loop] = client
+        return client
 
-    def chat(self, sys_prompt='', user_input=''):
-        cur_retry_time = 0
-        response_content = {}
-        while cur_retry_time < self.max_retry_time:
-            cur_retry_time += 1
+    def chat(self, sys_prompt='', user_input='', validate=None, use_cache=True):
+        """
+        validate(响应文本) 返回 False 的响应不写入缓存；use_cache=False 时既不读也不写缓存，
+        用于调用方因响应无效而以相同提示词重试的情况。
+        """
+        with tracing.span("llm.chat", model=self.model_name) as span:
+            messages = self._build_messages(sys_prompt, user_input)
+            cache_key = self._cache_key(messages, use_cache)
+            if cache_key:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    span.set(cached=True)
+                    return cached
+
+            response_content = {}
             try:
-                messages = [{"role": "system", "content": sys_prompt},
-                            {'role': 'user', 'content': user_input}]
+                completion = http_pool.call_with_retry(
+                    self.base_url,
+                    lambda: self.client.chat.completions.create(
+                        model=self.model_name,
+                        temperature=self.temperature,
+                        messages=messages
+                    ),
+                    self.retry_policy, verify=False)
+                response_content = self._parse_completion(completion)
+                self._record_usage(span, completion.usage)
+                if cache_key and self._cacheable(response_content, validate):
+                    self.cache.set(cache_key, response_content)
+
+            except Exception as e:
+                print(e)
+                span.set(error=str(e))
 
-                completion = self.client.chat.completions.create(
-                    model=self.model_name,
-                    temperature=0.2,
-                    messages=messages
-                )
+            return response_content
 
-                result = json.loads(completion.model_dump_json())
-                response_content = result['choices'][0]['message']['content']
-                return response_content
+    async def achat(self, sys_prompt='', user_input='', validate=None, use_cache=True):
+        """chat 的异步版本，等待模型响应时不阻塞事件循环。"""
+        with tracing.span("llm.chat", model=self.model_name) as span:
+            messages = self._build_messages(sys_prompt, user_input)
+            cache_key = self._cache_key(messages, use_cache)
+            if cache_key:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    span.set(cached=True)
+                    return cached
+
+            client = self._get_async_client()
+            response_content = {}
+            try:
+                completion = await http_pool.acall_with_retry(
+                    self.base_url,
+                    lambda: client.chat.completions.create(
+                        model=self.model_name,
+                        temperature=self.temperature,
+                        messages=messages
+                    ),
+                    self.retry_policy, verify=False)
+                response_content = self._parse_completion(completion)
+                self._record_usage(span, completion.usage)
+                if cache_key and self._cacheable(response_content, validate):
+                    self.cache.set(cache_key, response_content)
 
             except Exception as e:
                 print(e)
+                span.set(error=str(e))
+
+            return response_content
 
-        return response_content
+    async def achat_stream(self, sys_prompt='', user_input='', validate=None, use_cache=True):
+        """
+        流式版本的 achat，逐段产出模型输出的文本。
+        只有在尚未产出任何内容时才会退避重试；缓存命中时一次性产出完整响应，
+        流结束后完整文本通过 validate 校验才写入缓存。
+        """
+        # 生成器会在多次 yield 之间交出控制权，span 不设为当前 span，避免调用方的操作被记在它下面
+        span = tracing.start_span("llm.chat", model=self.model_name, stream=True)
+        messages = self._build_messages(sys_prompt, user_input)
+        cache_key = self._cache_key(messages, use_cache)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                span.set(cached=True)
+                tracing.end_span(span)
+                yield cached
+                return
 
+        client = self._get_async_client()
+        limiter = http_pool.get_pool(self.base_url, verify=False).async_limiter()
+        start = time.time()
+        chunks = []
+        completed = False
+        error = None
+        try:
+            for attempt in range(self.retry_policy.max_attempts):
+                try:
+                    async with limiter:
+                        stream = await client.chat.completions.create(
+                            model=self.model_name,
+                            temperature=self.temperature,
+                            messages=messages,
+                            stream=True,
+                            stream_options={"include_usage": True}
+                        )
+                        async for chunk in stream:
+                            self._record_usage(span, getattr(chunk, 'usage', None))
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta.content
+                            if delta:
+                                if not chunks:
+                                    span.set(time_to_first_token=time.time() - start)
+                                chunks.append(delta)
+                                yield delta
+                    completed = True
+                    error = None
+                    break
 
+                except Exception as e:
+                    print(e)
+                    error = e
+                    if chunks or attempt + 1 >= self.retry_policy.max_attempts or not self.retry_policy.is_retryable(e):
+                        break
+                    span.incr("retries")
+                    await asyncio.sleep(self.retry_policy.delay(attempt, e))
+        finally:
+            tracing.end_span(span, error)
 
+        response_content = ''.join(chunks)
+        if cache_key and completed and self._cacheable(response_content, validate):
+            self.cache.set(cache_key, response_content)
@@ -1,28 +1,174 @@
+import asyncio
+import json
+import os
 import socket
-import requests
+import time
+
+from Model_manager import http_pool
+from Model_manager.load_balancer import EndpointBalancer
+from Model_manager.response_cache import default_response_cache
+from until import tracing
+
+# 多个网关副本以逗号分隔
+LOCAL_LLM_URLS = os.getenv('LOCAL_LLM_URLS', "http://10.2.98.108:1220/llm").split(',')
+# 这些状态说明副本本身不可用，需要暂时剔除；429/504 只是繁忙，换一个副本即可
+EJECT_STATUS = {500, 502, 503}
 
 
 class LocalLLM:
-    def __init__(self, llm_url: str = "http://10.2.98.108:1220/llm"):
-        self.url = llm_url
+    def __init__(self, llm_url=LOCAL_LLM_URLS, cache=None, balancer=None):
+        """llm_url 可以是单个地址或多个副本地址的列表，请求按进行中请求数最少的原则分配到各副本。"""
+        urls = [llm_url] if isinstance(llm_url, str) else list(llm_url)
+        self.url = urls[0]
+        self.balancer = balancer or EndpointBalancer(urls)
+        self.retry_policy = http_pool.RetryPolicy(max_attempts=max(3, len(urls)))
+        # 副本内不重试，失败后换一个副本
+        self._single_attempt = http_pool.RetryPolicy(max_attempts=1)
+        # 响应缓存默认关闭，可传入 ResponseCache 或设置 LLM_RESPONSE_CACHE 环境变量开启
+        self.cache = cache if cache is not None else default_response_cache()
+
+    def _cache_key(self, sys_prompt, user_prompt, use_cache=True):
+        if self.cache is None or not use_cache:
+            return None
+        messages = [{"role": "system", "content": sys_prompt}, {'role': 'user', 'content': user_prompt}]
+        return self.cache.make_key(f"local:{self.url}", None, messages)
+
+    @staticmethod
+    def _cacheable(result, validate):
+        """只缓存非空、且通过调用方校验的响应；服务返回的非字符串结果按 JSON 文本校验。"""
+        if not result:
+            return False
+        if validate is None:
+            return True
+        return validate(result if isinstance(result, str) else json.dumps(result, ensure_ascii=False))
+
+    def _should_retry(self, endpoint, error):
+        """处理一次失败的请求，返回是否应当换一个副本重试。"""
+        status = http_pool.RetryPolicy.status_of(error)
+        if status is None or status in EJECT_STATUS:
+            self.balancer.mark_failure(endpoint)
+        return self.retry_policy.is_retryable(error)
+
+    def _next_round(self, tried, attempt, error):
+        """所有副本都尝试过一遍后才退避等待，否则立即换副本重试。"""
+        if len(tried) < len(self.balancer.endpoints):
+            return 0.0
+        tried.clear()
+        return self.retry_policy.delay(attempt, error)
+
+    def _post(self, payload):
+        tried = set()
+        error = None
+        for attempt in range(self.retry_policy.max_attempts):
+            with self.balancer.lease(tried) as endpoint:
+                tried.add(endpoint.url)
+                tracing.current_span().set(endpoint=endpoint.url)
+                try:
+                    ans = http_pool.post_json(endpoint.url, payload, self._single_attempt)
+                except Exception as e:
+                    error = e
+                    if not self._should_retry(endpoint, e):
+                        raise
+                else:
+                    if ans.get('success', True):
+                        return ans
+                    error = RuntimeError(ans.get('error'))
+            if attempt + 1 < self.retry_policy.max_attempts:
+                tracing.current_span().incr("retries")
+            delay = self._next_round(tried, attempt, error)
+            if delay:
+                time.sleep(delay)
+        raise error
+
+    async def _apost(self, payload):
+        tried = set()
+        error = None
+        for attempt in range(self.retry_policy.max_attempts):
+            with self.balancer.lease(tried) as endpoint:
+                tried.add(endpoint.url)
+                tracing.current_span().set(endpoint=endpoint.url)
+                try:
+                    ans = await http_pool.apost_json(endpoint.url, payload, self._single_attempt)
+                except Exception as e:
+                    error = e
+                    if not self._should_retry(endpoint, e):
+                        raise
+                else:
+                    if ans.get('success', True):
+                        return ans
+                    error = RuntimeError(ans.get('error'))
+            if attempt + 1 < self.retry_policy.max_attempts:
+                tracing.current_span().incr("retries")
+            delay = self._next_round(tried, attempt, error)
+            if delay:
+                await asyncio.sleep(delay)
+        raise error
 
     def chat(self,
              sys_prompt: str = '',
-             user_prompt: str = ''):
+             user_prompt: str = '',
+             validate=None,
+             use_cache: bool = True):
+        """validate 与 use_cache 的含义同 CustomLLM.chat：未通过校验的响应不缓存，重试时不读写缓存。"""
 
-        payload = {"sys_prompt": sys_prompt,
-                   'user_input': user_prompt}
+        with tracing.span("llm.chat", model=f"local:{self.url}") as span:
+            cache_key = self._cache_key(sys_prompt, user_prompt, use_cache)
+            if cache_key:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    span.set(cached=True)
+                    return cached
 
-        headers = {"Content-Type": "application/json"}
-        try:
-            response = requests.post(self.url,
-                                     json=payload,
-                                     headers=headers)
-            ans = response.json()
-            return ans['result']
-        except requests.RequestException as e:
-            print(f"请求错误: {e}")
-        return None
+            payload = {"sys_prompt": sys_prompt,
+                       'user_input': user_prompt}
+
+            try:
+                ans = self._post(payload)
+                if cache_key and self._cacheable(ans.get('result'), validate):
+                    self.cache.set(cache_key, ans['result'])
+                return ans['result']
+            except Exception as e:
+                print(f"请求错误: {e}")
+                span.set(error=str(e))
+            return None
+
+    async def achat(self,
+                    sys_prompt: str = '',
+                    user_prompt: str = '',
+                    validate=None,
+                    use_cache: bool = True):
+        """chat 的异步版本。"""
+
+        with tracing.span("llm.chat", model=f"local:{self.url}") as span:
+            cache_key = self._cache_key(sys_prompt, user_prompt, use_cache)
+            if cache_key:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    span.set(cached=True)
+                    return cached
+
+            payload = {"sys_prompt": sys_prompt,
+                       'user_input': user_prompt}
+
+            try:
+                ans = await self._apost(payload)
+                if cache_key and self._cacheable(ans.get('result'), validate):
+                    self.cache.set(cache_key, ans['result'])
+                return ans['result']
+            except Exception as e:
+                print(f"请求错误: {e}")
+                span.set(error=str(e))
+            return None
+
+    async def achat_stream(self,
+                           sys_prompt: str = '',
+                           user_prompt: str = '',
+                           validate=None,
+                           use_cache: bool = True):
+        """本地服务不支持流式输出，完整响应作为一段产出，调用方可以与 CustomLLM 统一处理。"""
+        result = await self.achat(sys_prompt, user_prompt, validate, use_cache)
+        if result:
+            yield result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
 
 
 if __name__ == '__main__':
@@ -33,4 +179,3 @@ if __name__ == '__main__':
     print(f"本机IP地址：{ip_address}")
     lm = LocalLLM()
     print(lm.chat("You are a helpful assistant.","Tell me a joke."))
-
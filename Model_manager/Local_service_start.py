@@ -1,38 +1,66 @@
-from flask import Flask, request, Response
-from gevent import monkey, pywsgi
-import logging
-from API_service import CustomLLM
 import json
+import logging
+import os
+import sys
+import time
+
+from flask import Flask, request, Response
+from gevent import lock, monkey, pywsgi
+
+# 以脚本方式从 Model_manager 目录启动时，保证可以按包路径导入项目模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Model_manager import http_pool
+from Model_manager.API_service import CustomLLM
+from Model_manager.gateway import GatewayRejected, InferenceGateway, prometheus_text
+from until import tracing
 
 monkey.patch_all(thread=False)
+# threading 未被 patch，模型调用的并发限制改用 gevent 信号量，等待时只挂起当前 greenlet
+http_pool.set_semaphore_factory(lock.BoundedSemaphore)
 
 
 def start_server(http_id, port):
     logging.basicConfig(level=logging.INFO)
 
-    llm = CustomLLM()  # 假设 CustomLLM 已定义
+    llm = CustomLLM()  # 设置 LLM_RESPONSE_CACHE 环境变量即可让网关共享响应缓存
+    gateway = InferenceGateway(llm)
     logging.info('服务已启动')
     app = Flask(__name__)
 
+    def json_response(data, status=200):
+        return Response(json.dumps(data, ensure_ascii=False), status=status, content_type="application/json")
+
     @app.route("/")
     def index():
         return "Getting Started"
 
+    @app.route("/stats", methods=["GET"])
+    def stats():
+        return json_response(gateway.metrics())
+
+    # Prometheus 默认抓取 /metrics：网关指标，开启 AGENT_TRACE 时再附上各 span 的指标；JSON 格式见 /stats
+    @app.route("/metrics", methods=["GET"])
+    def prometheus_metrics():
+        text = prometheus_text(gateway.metrics()) + tracing.tracer.prometheus_text()
+        return Response(text, content_type="text/plain; version=0.0.4")
+
     @app.route("/llm", methods=["GET", "POST"])
     def generate():
         response = {
             "success": False,
         }
+        status = 200
 
         try:
             if request.content_type == "application/json":
                 arg_dict = request.get_json()
-                logging.info(f"Received data: {arg_dict}")
+                logging.debug(f"Received data: {arg_dict}")
 
                 sys_prompt = arg_dict.get("sys_prompt")
                 user_input = arg_dict.get("user_input")
 
-                result = llm.chat(sys_prompt, user_input)
+                start = time.time()
+                result = gateway.submit(sys_prompt, user_input, arg_dict.get("timeout"))
 
                 response = {
                     "success": True,
@@ -40,13 +68,22 @@ def start_server(http_id, port):
                     "sys_prompt": sys_prompt,
                     "user_input": user_input
                 }
-                logging.info(f"Response: {response}")
+                logging.info(f"Served /llm in {time.time() - start:.2f}s")
+                logging.debug(f"Response: {response}")
             else:
                 response = {
                     "success": False,
                     "error": "Invalid input format"
                 }
 
+        except GatewayRejected as e:
+            logging.warning(f"Request rejected: {e}")
+            response = {
+                "success": False,
+                "error": str(e)
+            }
+            status = e.status
+
         except Exception as e:
             logging.error(f"An error occurred: {str(e)}")
             response = {
@@ -54,7 +91,7 @@ def start_server(http_id, port):
                 "error": str(e)
             }
 
-        return Response(json.dumps(response, ensure_ascii=False), content_type="application/json")
+        return json_response(response, status)
 
     server = pywsgi.WSGIServer((http_id, port), app)
     server.serve_forever()
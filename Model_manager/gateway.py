@@ -0,0 +1,206 @@
+"""
+推理网关的准入控制，由 Local_service_start 在 gevent 服务中使用。
+本模块不做 monkey patch，只依赖 gevent 的 greenlet、队列和 AsyncResult，可以单独导入测试。
+"""
+import logging
+import math
+import os
+import time
+from collections import deque
+
+import gevent
+from gevent.event import AsyncResult
+from gevent.queue import Empty, Queue
+
+MAX_IN_FLIGHT = int(os.getenv('GATEWAY_MAX_IN_FLIGHT', 8))
+MAX_QUEUE = int(os.getenv('GATEWAY_MAX_QUEUE', 64))
+QUEUE_TIMEOUT = float(os.getenv('GATEWAY_QUEUE_TIMEOUT', 30))
+BATCH_SIZE = int(os.getenv('GATEWAY_BATCH_SIZE', 8))
+BATCH_WINDOW = float(os.getenv('GATEWAY_BATCH_WINDOW', 0.01))
+LATENCY_WINDOW = 1000
+
+
+class GatewayRejected(Exception):
+    """请求未被执行：参数无效（400）、队列已满（429）、等待超过截止时间（504）或上游调用失败（502）。"""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_timeout(value):
+    """客户端传入的排队超时：None 表示使用默认值，其余必须是正的有限秒数，否则返回 400。"""
+    if value is None:
+        return None
+    try:
+        if isinstance(value, bool):
+            raise ValueError(value)
+        timeout = float(value)
+    except (TypeError, ValueError):
+        raise GatewayRejected(f"timeout 必须是秒数: {value!r}", 400)
+    if not math.isfinite(timeout) or timeout <= 0:
+        raise GatewayRejected(f"timeout 必须大于 0: {value!r}", 400)
+    return timeout
+
+
+def _failed(output):
+    """CustomLLM.chat 出错时不抛出异常，而是返回空字典。"""
+    return output is None or (isinstance(output, dict) and not output)
+
+
+class InferenceGateway:
+    """
+    模型调用的准入控制：
+    - 固定数量的 worker 执行上游调用，超出的请求排队，队列满时直接拒绝；
+    - 客户端最多等到截止时间，超时返回 504，此时仍在排队的请求不再执行；
+    - 相同的并发请求只调用一次上游，结果共享；
+    - 上游提供 chat_batch([(sys_prompt, user_input), ...]) 时，同一时间窗口内排队的请求合并为一次批量调用。
+    """
+
+    def __init__(self, llm,
+                 max_in_flight=MAX_IN_FLIGHT,
+                 max_queue=MAX_QUEUE,
+                 queue_timeout=QUEUE_TIMEOUT,
+                 batch_size=BATCH_SIZE,
+                 batch_window=BATCH_WINDOW):
+        self.llm = llm
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self._chat_batch = getattr(llm, 'chat_batch', None) if batch_size > 1 else None
+
+        self.queue = Queue()
+        self.in_flight = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {
+            "requests": 0,
+            "completed": 0,
+            "errors": 0,
+            "deduplicated": 0,
+            "batches": 0,
+            "rejected_queue_full": 0,
+            "rejected_deadline": 0,
+        }
+        self._pending = {}
+        self._workers = [gevent.spawn(self._worker) for _ in range(max_in_flight)]
+
+    def submit(self, sys_prompt, user_input, timeout=None):
+        """提交一次调用并等待结果；timeout 为等待的上限（秒），无效时抛出 400 的 GatewayRejected。"""
+        timeout = parse_timeout(timeout)
+        start = time.time()
+        deadline = start + (self.queue_timeout if timeout is None else timeout)
+        self.counters["requests"] += 1
+        key = (sys_prompt, user_input)
+
+        result = self._pending.get(key)
+        if result is not None:
+            self.counters["deduplicated"] += 1
+        else:
+            if self.queue.qsize() >= self.max_queue:
+                self.counters["rejected_queue_full"] += 1
+                raise GatewayRejected("请求队列已满", 429)
+            result = AsyncResult()
+            self._pending[key] = result
+            self.queue.put((key, deadline, result))
+
+        # 所有 worker 都在等待较慢的上游调用时，不能等到请求出队才发现已经超时
+        try:
+            output = result.get(timeout=max(0.0, deadline - time.time()))
+        except gevent.Timeout:
+            self.counters["rejected_deadline"] += 1
+            raise GatewayRejected("等待超时", 504)
+        except GatewayRejected as e:
+            if e.status == 504:
+                self.counters["rejected_deadline"] += 1
+            raise
+        self.latencies.append(time.time() - start)
+        return output
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        if self._chat_batch is None:
+            return batch
+        window_end = time.time() + self.batch_window
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get(timeout=max(0.0, window_end - time.time())))
+            except Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while True:
+            live = []
+            for key, deadline, result in self._next_batch():
+                if time.time() > deadline:
+                    # 等待方在 submit 中计数
+                    self._pending.pop(key, None)
+                    result.set_exception(GatewayRejected("排队超时", 504))
+                else:
+                    live.append((key, result))
+            if live:
+                self._dispatch(live)
+
+    def _dispatch(self, live):
+        keys = [key for key, _ in live]
+        self.in_flight += 1
+        try:
+            if len(live) > 1:
+                self.counters["batches"] += 1
+                outputs = self._chat_batch(keys)
+            else:
+                outputs = [self.llm.chat(*keys[0])]
+        except Exception as e:
+            logging.error(f"上游调用出错: {e}")
+            self.counters["errors"] += len(live)
+            for key, result in live:
+                self._pending.pop(key, None)
+                result.set_exception(e)
+            return
+        finally:
+            self.in_flight -= 1
+
+        for (key, result), output in zip(live, outputs):
+            self._pending.pop(key, None)
+            if _failed(output):
+                self.counters["errors"] += 1
+                result.set_exception(GatewayRejected("上游调用失败", 502))
+            else:
+                self.counters["completed"] += 1
+                result.set(output)
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {
+            "queue_depth": self.queue.qsize(),
+            "in_flight": self.in_flight,
+            "latency_p50": percentile(0.50),
+            "latency_p95": percentile(0.95),
+            "latency_p99": percentile(0.99),
+            **self.counters,
+        }
+
+
+def prometheus_text(metrics):
+    """把 InferenceGateway.metrics() 转为 Prometheus 文本格式：队列和延迟为 gauge，计数为 counter。"""
+    lines = [
+        "# TYPE llm_gateway_queue_depth gauge",
+        f"llm_gateway_queue_depth {metrics['queue_depth']}",
+        "# TYPE llm_gateway_in_flight gauge",
+        f"llm_gateway_in_flight {metrics['in_flight']}",
+        "# TYPE llm_gateway_latency_seconds gauge",
+    ]
+    for quantile, name in (("0.5", "latency_p50"), ("0.95", "latency_p95"), ("0.99", "latency_p99")):
+        lines.append(f'llm_gateway_latency_seconds{{quantile="{quantile}"}} {metrics[name]}')
+    for name in ("requests", "completed", "errors", "deduplicated", "batches",
+                 "rejected_queue_full", "rejected_deadline"):
+        lines.append(f"# TYPE llm_gateway_{name}_total counter")
+        lines.append(f"llm_gateway_{name}_total {metrics[name]}")
+    return '\n'.join(lines) + '\n'
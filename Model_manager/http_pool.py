@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+
+from until import tracing
+
+try:
+    import openai
+    _RETRYABLE_ERRORS = (httpx.TransportError, openai.APIConnectionError)
+except ImportError:
+    _RETRYABLE_ERRORS = (httpx.TransportError,)
+
+# 所有模型调用共用的连接池参数，可通过环境变量调整
+CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', 10))
+READ_TIMEOUT = float(os.getenv('LLM_READ_TIMEOUT', 300))
+MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', 32))
+MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+MAX_ATTEMPTS = 3
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+# 同步调用的并发限制所用的信号量类型；gevent 服务未 patch threading 时应替换为 gevent.lock.BoundedSemaphore
+_semaphore_factory = threading.BoundedSemaphore
+
+
+def set_semaphore_factory(factory):
+    """替换之后新建连接池所用的同步信号量类型，需在创建任何客户端之前调用。"""
+    global _semaphore_factory
+    _semaphore_factory = factory
+
+
+def default_timeout():
+    return httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+def _endpoint_of(url):
+    parts = urlsplit(url or '')
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class RetryPolicy:
+    """指数退避加随机抖动（full jitter），优先遵循服务端返回的 Retry-After。"""
+
+    def __init__(self, max_attempts=MAX_ATTEMPTS, base_delay=0.5, max_delay=8.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @staticmethod
+    def status_of(error):
+        status = getattr(error, 'status_code', None)
+        if status is None:
+            status = getattr(getattr(error, 'response', None), 'status_code', None)
+        return status
+
+    def is_retryable(self, error):
+        if isinstance(error, _RETRYABLE_ERRORS):
+            return True
+        return self.status_of(error) in RETRY_STATUS
+
+    def delay(self, attempt, error=None):
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        retry_after = headers.get('retry-after')
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class EndpointPool:
+    """
+    单个服务地址（scheme://host:port）共享的连接池与并发限制。
+    同步客户端在线程间共享；异步客户端和信号量绑定在事件循环上，按循环分别创建。
+    """
+
+    def __init__(self, endpoint, verify=True, max_concurrency=MAX_CONCURRENCY):
+        self.endpoint = endpoint
+        self.verify = verify
+        self.max_concurrency = max_concurrency
+        self.limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+
+        self._lock = threading.Lock()
+        self._client = None
+        self._semaphore = _semaphore_factory(max_concurrency)
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_semaphores = weakref.WeakKeyDictionary()
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(verify=self.verify, timeout=default_timeout(), limits=self.limits)
+            return self._client
+
+    def async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(verify=self.verify, timeout=default_timeout(), limits=self.limits)
+            self._async_clients[loop] = client
+        return client
+
+    def limiter(self):
+        return self._semaphore
+
+    def async_limiter(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._async_semaphores[loop] = semaphore
+        return semaphore
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(url, verify=True):
+    key = (_endpoint_of(url), verify)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = EndpointPool(key[0], verify)
+            _pools[key] = pool
+        return pool
+
+
+def get_client(url, verify=True):
+    """返回 url 所在服务共享的 httpx.Client。"""
+    return get_pool(url, verify).client()
+
+
+def get_async_client(url, verify=True):
+    """返回 url 所在服务在当前事件循环中共享的 httpx.AsyncClient。"""
+    return get_pool(url, verify).async_client()
+
+
+def call_with_retry(url, fn, policy=None, verify=True):
+    """
+    在并发限制内调用 fn()，遇到连接错误、超时、429 或 5xx 时退避重试，重试次数用尽后抛出最后一次的异常。
+    等待重试期间不占用并发名额。
+    """
+    policy = policy or RetryPolicy()
+    limiter = get_pool(url, verify).limiter()
+    for attempt in range(policy.max_attempts):
+        try:
+            with limiter:
+                return fn()
+        except Exception as e:
+            if attempt + 1 >= policy.max_attempts or not policy.is_retryable(e):
+                raise
+            delay = policy.delay(attempt, e)
+            logging.warning(f"请求 {_endpoint_of(url)} 失败，{delay:.2f}s 后重试: {e}")
+            tracing.current_span().incr("retries")
+            time.sleep(delay)
+
+
+async def acall_with_retry(url, fn, policy=None, verify=True):
+    """call_with_retry 的异步版本，fn 返回协程。"""
+    policy = policy or RetryPolicy()
+    limiter = get_pool(url, verify).async_limiter()
+    for attempt in range(policy.max_attempts):
+        try:
+            async with limiter:
+                return await fn()
+        except Exception as e:
+            if attempt + 1 >= policy.max_attempts or not policy.is_retryable(e):
+                raise
+            delay = policy.delay(attempt, e)
+            logging.warning(f"请求 {_endpoint_of(url)} 失败，{delay:.2f}s 后重试: {e}")
+            tracing.current_span().incr("retries")
+            await asyncio.sleep(delay)
+
+
+def post_json(url, payload, policy=None):
+    """通过共享连接池 POST JSON，非 2xx 响应视为错误（429/5xx 会重试），返回解析后的 JSON。"""
+    def send():
+        response = get_client(url).post(url, json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    return call_with_retry(url, send, policy)
+
+
+async def apost_json(url, payload, policy=None):
+    """post_json 的异步版本。"""
+    async def send():
+        response = await get_async_client(url).post(url, json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    return await acall_with_retry(url, send, policy)
@@ -0,0 +1,125 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from Model_manager import http_pool
+
+HEALTH_INTERVAL = 10
+EJECT_SECONDS = 30
+HEALTH_TIMEOUT = 3
+
+
+class Endpoint:
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    def healthy(self, now):
+        return self.ejected_until <= now
+
+    def __repr__(self):
+        return f"Endpoint({self.url}, outstanding={self.outstanding}, failures={self.failures})"
+
+
+def http_probe(url):
+    """默认的健康检查：请求服务根路径，返回 2xx 视为健康。"""
+    parts = urlsplit(url)
+    response = http_pool.get_client(url).get(f"{parts.scheme}://{parts.netloc}/", timeout=HEALTH_TIMEOUT)
+    return response.is_success
+
+
+class EndpointBalancer:
+    """
+    多副本之间的负载均衡：选择未被剔除且进行中请求最少的副本。
+    调用失败的副本被暂时剔除 eject_seconds 秒，后台线程定期探测各副本，恢复的副本重新加入。
+    所有副本都被剔除时退回在全部副本中选择，避免完全不可用。
+    probe(url) -> bool 可以替换，便于用本地替身服务测试路由。
+    """
+
+    def __init__(self, urls, probe=http_probe, health_interval=HEALTH_INTERVAL, eject_seconds=EJECT_SECONDS):
+        if isinstance(urls, str):
+            urls = [urls]
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.probe = probe
+        self.health_interval = health_interval
+        self.eject_seconds = eject_seconds
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread = None
+
+    def choose(self, exclude=()):
+        """选择一个副本并计入进行中请求，调用方需要在结束后 release。"""
+        self._ensure_health_checks()
+        now = time.time()
+        with self._lock:
+            candidates = [e for e in self.endpoints if e.url not in exclude and e.healthy(now)]
+            if not candidates:
+                candidates = [e for e in self.endpoints if e.url not in exclude] or self.endpoints
+            least = min(e.outstanding for e in candidates)
+            endpoint = random.choice([e for e in candidates if e.outstanding == least])
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint):
+        with self._lock:
+            endpoint.outstanding -= 1
+
+    @contextmanager
+    def lease(self, exclude=()):
+        endpoint = self.choose(exclude)
+        try:
+            yield endpoint
+        finally:
+            self.release(endpoint)
+
+    def mark_success(self, endpoint):
+        with self._lock:
+            endpoint.failures = 0
+            endpoint.ejected_until = 0.0
+
+    def mark_failure(self, endpoint):
+        with self._lock:
+            endpoint.failures += 1
+            endpoint.ejected_until = time.time() + self.eject_seconds
+        logging.warning(f"副本 {endpoint.url} 调用失败，暂时剔除 {self.eject_seconds}s")
+
+    def check_health(self):
+        """探测所有副本一次。"""
+        for endpoint in self.endpoints:
+            try:
+                healthy = self.probe(endpoint.url)
+            except Exception:
+                healthy = False
+            if healthy:
+                if endpoint.failures:
+                    logging.info(f"副本 {endpoint.url} 已恢复")
+                self.mark_success(endpoint)
+            elif endpoint.healthy(time.time()):
+                self.mark_failure(endpoint)
+
+    def _ensure_health_checks(self):
+        if self._health_thread is not None or not self.health_interval or len(self.endpoints) < 2:
+            return
+        with self._lock:
+            if self._health_thread is None:
+                self._health_thread = threading.Thread(target=self._health_loop, name='llm-health', daemon=True)
+                self._health_thread.start()
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            self.check_health()
+
+    def close(self):
+        self._stop.set()
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            return [{"url": e.url, "outstanding": e.outstanding, "failures": e.failures, "healthy": e.healthy(now)}
+                    for e in self.endpoints]
@@ -0,0 +1,58 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from until.disk_cache import DiskCache
+
+# 设置该环境变量（缓存文件路径）即可为所有 LLM 调用开启响应缓存
+RESPONSE_CACHE_ENV = 'LLM_RESPONSE_CACHE'
+RESPONSE_CACHE_TTL = 7 * 24 * 3600
+
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+
+class ResponseCache:
+    """
+    LLM 响应缓存，键为 (模型, 温度, 规范化后的消息) 的哈希，存储在本地 SQLite 中，支持 TTL 与容量淘汰。
+    """
+
+    def __init__(self, path, ttl=RESPONSE_CACHE_TTL, max_bytes=256 * 1024 * 1024):
+        self.store = DiskCache(path, max_bytes=max_bytes, ttl=ttl)
+
+    @staticmethod
+    def _normalize(content):
+        lines = (content or '').replace('\r\n', '\n').split('\n')
+        return '\n'.join(line.rstrip() for line in lines).strip()
+
+    def make_key(self, model, temperature, messages):
+        payload = {
+            "model": model,
+            "temperature": temperature,
+            "messages": [{"role": m["role"], "content": self._normalize(m["content"])} for m in messages],
+        }
+        return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        value = self.store.get(key)
+        logging.info(f"LLM 响应缓存{'命中' if value is not None else '未命中'}: {key[:12]}")
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, response):
+        self.store.set(key, response.encode('utf-8'))
+
+    def stats(self):
+        return self.store.stats()
+
+
+def default_response_cache():
+    """按环境变量返回进程内共享的 ResponseCache，未配置时返回 None（默认不缓存）。"""
+    path = os.getenv(RESPONSE_CACHE_ENV)
+    if not path:
+        return None
+    with _shared_caches_lock:
+        if path not in _shared_caches:
+            _shared_caches[path] = ResponseCache(path)
+        return _shared_caches[path]
@@ -1,15 +1,28 @@
 import concurrent.futures
+import contextvars
+import hashlib
+import math
 import os
-import pickle
-import uuid
+import threading
 
+import faiss
+import numpy as np
 from langchain.retrievers.multi_vector import MultiVectorRetriever
-from langchain.storage import InMemoryByteStore
+from langchain.storage import InMemoryStore
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.embeddings import HuggingFaceBgeEmbeddings
 from langchain_community.vectorstores import FAISS
 
-from .file_process import process_path
+from until import tracing
+from .embedding_cache import EMBEDDING_CACHE_PATH, CachedEmbeddings, embed_queries
+from .file_process import BATCH_SIZE, iter_document_batches
+from .index_store import (INDEX_DIR, META_FILE, build_embedding_model, embedding_config_of, file_sha256,
+                          load_manifest, load_meta, load_vector_stores, migrate_pickle_cache, remove_shards,
+                          save_manifest, write_meta, write_shard)
+from .shard_merge import merge_top_k
+
+DOCUMENT_KEY = "doc_id"
 
 
 class RAGService:
@@ -18,128 +31,343 @@ class RAGService:
                  device='cpu',
                  chunk_size=1000, chunk_overlap=200,
                  embedding_cls=HuggingFaceBgeEmbeddings,
-                 text_splitter_cls=RecursiveCharacterTextSplitter):
+                 text_splitter_cls=RecursiveCharacterTextSplitter,
+                 embedding_cache_path=EMBEDDING_CACHE_PATH,
+                 batch_size=BATCH_SIZE):
 
         model_config = {"device": device}
         embedding_config = {"normalize_embeddings": True}
         self.embedding_model = embedding_cls(
             model_name=model_path, model_kwargs=model_config, encode_kwargs=embedding_config
         )
+        if embedding_cache_path:
+            self.embedding_model = CachedEmbeddings(self.embedding_model, embedding_cache_path)
         self.text_splitter = text_splitter_cls(
             chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True
         )
+        self.batch_size = batch_size
+        self.splitter_config = {
+            "splitter": text_splitter_cls.__name__, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap
+        }
 
-    def load_and_split_documents(self, input_paths, chunk_nums):
-        documents = []
-
-        for path in input_paths:
-            try:
-                if path.endswith(('.csv', '.xlsx', '.txt', '.json')):
-                    doc = process_path(path, self.text_splitter, chunk_nums)
-                    documents.extend(doc)
-                else:
-                    print(f"Unsupported path type for path: {path}")
-
-            except Exception as e:
-                print(f"Failed to process path {path}: {e}")
-
-        return documents
-
-    def initialize_document_vector(self, document):
-        vector_store = FAISS.from_documents(document, embedding=self.embedding_model)
+    def initialize_document_vector(self, document, ids=None):
+        vector_store = FAISS.from_documents(document, embedding=self.embedding_model, ids=ids)
         return vector_store
 
-    def initialize_vector_store(self, input_paths, chunk_nums=None):
+    @staticmethod
+    def _assign_ids(document, prefix, start=0):
+        """为切片分配稳定 id，并写入 metadata['doc_id']，随索引一起持久化."""
+        ids = [f"{prefix}-{i}" for i in range(start, start + len(document))]
+        for doc, doc_id in zip(document, ids):
+            doc.metadata[DOCUMENT_KEY] = doc_id
+        return ids
+
+    def _index_settings(self, chunk_nums):
+        """影响切分与向量化结果的参数，任一变化都需要全量重建."""
+        return {**self.splitter_config, "chunk_nums": chunk_nums,
+                "embedding": embedding_config_of(self.embedding_model)}
+
+    def initialize_vector_store(self, input_paths, chunk_nums=None, index_dir=INDEX_DIR):
+        """
+        按文件内容哈希增量更新向量库，只对新增、修改的文件重新切分和向量化，并移除已删除文件的切片。
+        返回本次变更报告: {"added": [...], "modified": [...], "removed": [...], "unchanged": [...]}
+        """
         if isinstance(input_paths, str):
             input_paths = [input_paths]
 
-        document = self.load_and_split_documents(input_paths, chunk_nums)
-
-        cache_dir = 'cache'
-        if not os.path.exists(cache_dir):
-            os.makedirs(cache_dir)
-        doc_file_path = os.path.join(cache_dir, 'document.pkl')
-        with open(doc_file_path, 'wb') as f:
-            pickle.dump(document, f)
+        current = {}
+        for path in input_paths:
+            if path.endswith(('.csv', '.xlsx', '.txt', '.json')):
+                current[os.path.abspath(path)] = file_sha256(path)
+            else:
+                print(f"Unsupported path type for path: {path}")
+
+        settings = self._index_settings(chunk_nums)
+        manifest = load_manifest(index_dir)
+        indexed = manifest["files"] if manifest and manifest["settings"] == settings else {}
+
+        report = {
+            "added": [p for p in current if p not in indexed],
+            "modified": [p for p in current if p in indexed and indexed[p]["hash"] != current[p]],
+            "removed": [p for p in indexed if p not in current],
+            "unchanged": [p for p in current if p in indexed and indexed[p]["hash"] == current[p]],
+        }
+        print("Vector store update: " + ", ".join(f"{key} {len(paths)}" for key, paths in report.items()))
+        if indexed and not (report["added"] or report["modified"] or report["removed"]):
+            return report
+
+        os.makedirs(index_dir, exist_ok=True)
+        meta_path = os.path.join(index_dir, META_FILE)
+        old_shards = load_meta(index_dir)["shards"] if os.path.exists(meta_path) else []
         try:
             if not chunk_nums:
-                vector_store = self.initialize_document_vector(document)
-
+                files, shards = self._update_single_index(index_dir, indexed, current, report)
             else:
                 print("Initializing vector store with %s parts...",
                       chunk_nums if chunk_nums else "all documents as one part")
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    vector_store = list(executor.map(self.initialize_document_vector, document))
+                files, shards = self._update_sharded_index(index_dir, indexed, current, report, chunk_nums)
 
-            file_path = os.path.join(cache_dir, 'vectors_store.pkl')
-            with open(file_path, 'wb') as f:
-                pickle.dump(vector_store, f)
+            meta = write_meta(index_dir, shards, bool(chunk_nums), settings["embedding"])
+            save_manifest(index_dir, meta["version"], settings, files)
+            remove_shards(index_dir, [name for name in old_shards if name not in shards])
         except Exception as e:
             print(f"Failed to initialize vector store: {e}")
             raise
 
+        if isinstance(self.embedding_model, CachedEmbeddings):
+            print(f"Embedding cache: {self.embedding_model.stats()}")
+
+        # 重建完成后丢弃旧的检索器并预加载新的索引
+        searcher_registry.invalidate(index_dir)
+        searcher_registry.warm(index_dir, embedding_model=self.embedding_model)
+        return report
+
+    def _update_single_index(self, index_dir, indexed, current, report):
+        """单索引模式：在已有索引上删除过期切片、追加新切片."""
+        vector_store = None
+        if indexed:
+            vector_store, _, _ = load_vector_stores(index_dir, self.embedding_model, mmap=False)
+            stale_ids = [doc_id for path in report["modified"] + report["removed"] for doc_id in indexed[path]["ids"]]
+            if stale_ids:
+                vector_store.delete(stale_ids)
+
+        # 文件按批流式切分后直接写入索引，失败的文件回滚已写入的切片，不写入 manifest，下次重建时重试
+        files = {path: indexed[path] for path in report["unchanged"]}
+        for path in report["added"] + report["modified"]:
+            prefix = _file_key(path, current[path])
+            ids = []
+            try:
+                for _, batch in iter_document_batches(path, self.text_splitter, batch_size=self.batch_size):
+                    if not batch:
+                        continue
+                    batch_ids = self._assign_ids(batch, prefix, len(ids))
+                    if vector_store is None:
+                        vector_store = self.initialize_document_vector(batch, batch_ids)
+                    else:
+                        vector_store.add_documents(batch, ids=batch_ids)
+                    ids.extend(batch_ids)
+            except Exception as e:
+                print(f"Failed to process path {path}: {e}")
+                if ids:
+                    vector_store.delete(ids)
+                continue
+            files[path] = {"hash": current[path], "ids": ids}
+
+        if vector_store is None:
+            raise ValueError("No documents to index")
+        write_shard(vector_store, index_dir, 'shard_0')
+        return files, ['shard_0']
+
+    def _update_sharded_index(self, index_dir, indexed, current, report, chunk_nums):
+        """分片模式：每个文件对应 chunk_nums 个分片，只为新增、修改的文件构建分片，不同文件并行处理."""
+
+        def build(path):
+            prefix = _file_key(path, current[path])
+            vector_stores = {}
+            counts = {}
+            try:
+                for part, batch in iter_document_batches(path, self.text_splitter, chunk_nums, self.batch_size):
+                    if not batch:
+                        continue
+                    name = f"{prefix}_{part}"
+                    batch_ids = self._assign_ids(batch, name, counts.get(name, 0))
+                    counts[name] = counts.get(name, 0) + len(batch)
+                    if name in vector_stores:
+                        vector_stores[name].add_documents(batch, ids=batch_ids)
+                    else:
+                        vector_stores[name] = self.initialize_document_vector(batch, batch_ids)
+            except Exception as e:
+                print(f"Failed to process path {path}: {e}")
+                return path, None
 
-class SimilaritySearcher:
-    def __init__(self,
-                 document_path='cache/document.pkl',
-                 vectors_single_path='cache/vectors_store.pkl'):
+            for name, vector_store in vector_stores.items():
+                write_shard(vector_store, index_dir, name)
+            return path, list(vector_stores)
+
+        files = {path: indexed[path] for path in report["unchanged"]}
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            for path, names in executor.map(build, report["added"] + report["modified"]):
+                if names is not None:
+                    files[path] = {"hash": current[path], "shards": names}
+
+        shards = [name for path in current if path in files for name in files[path]["shards"]]
+        if not shards:
+            raise ValueError("No documents to index")
+        return files, shards
 
-        with open(document_path, 'rb') as f:
-            self.document = pickle.load(f)
-        with open(vectors_single_path, 'rb') as f:
-            self.vector_store = pickle.load(f)
 
-        self.byte_store = InMemoryByteStore()
-        self.document_key = "doc_id"
+def _file_key(path, file_hash):
+    """由路径和内容哈希生成稳定的切片/分片 id 前缀，相同内容的不同文件也不会冲突."""
+    path_hash = hashlib.sha1(path.encode('utf-8')).hexdigest()[:8]
+    return f"{file_hash[:16]}{path_hash}"
 
+
+class SimilaritySearcher:
+    def __init__(self,
+                 index_dir=INDEX_DIR,
+                 embedding_model=None,
+                 mmap=True,
+                 legacy_vectors_path='cache/vectors_store.pkl',
+                 embedding_cache_path=EMBEDDING_CACHE_PATH,
+                 merge_shards=False):
+
+        # 兼容旧版 pickle 缓存：首次加载时迁移为原生索引格式
+        if not os.path.exists(os.path.join(index_dir, META_FILE)) and os.path.exists(legacy_vectors_path):
+            migrate_pickle_cache(legacy_vectors_path, index_dir)
+
+        if embedding_model is None:
+            embedding_model = build_embedding_model(load_meta(index_dir)["embedding"])
+            if embedding_cache_path:
+                embedding_model = CachedEmbeddings(embedding_model, embedding_cache_path)
+
+        self.vector_store, self.document, self.embedding_model = load_vector_stores(
+            index_dir, embedding_model=embedding_model, mmap=mmap
+        )
+        if merge_shards and isinstance(self.vector_store, list):
+            self.vector_store, self.document = self._merge_shards(self.vector_store, self.document)
+
+        # 分片并行检索使用的线程池（faiss 检索时会释放 GIL）
+        self._shard_executor = None
+        if isinstance(self.vector_store, list) and len(self.vector_store) > 1:
+            self._shard_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(len(self.vector_store), os.cpu_count() or 4)
+            )
+
+        # docstore 只在加载时按索引中持久化的 id 填充一次，检索时仅按 top-k 命中的 id 读取
+        sharded = isinstance(self.vector_store, list)
+        vector_stores = self.vector_store if sharded else [self.vector_store]
+        documents = self.document if sharded else [self.document]
+        self.document_key = DOCUMENT_KEY
         self.multi_retriever = MultiVectorRetriever(
-            vectorstore=self.vector_store,
-            byte_store=self.byte_store,
+            vectorstore=vector_stores[0],
+            docstore=InMemoryStore(),
             id_key=self.document_key,
         )
+        self.multi_retriever.docstore.mset([
+            (vector_store.index_to_docstore_id[i], doc)
+            for vector_store, docs in zip(vector_stores, documents)
+            for i, doc in enumerate(docs)
+        ])
+
+    @staticmethod
+    def _merge_shards(vector_stores, documents):
+        """加载时把所有分片合并为一个内存索引，分片较多、单片较小时一次检索更快."""
+        first = vector_stores[0]
+        merged = FAISS(
+            embedding_function=first.embedding_function,
+            index=faiss.clone_index(first.index),
+            docstore=InMemoryDocstore({first.index_to_docstore_id[i]: doc for i, doc in enumerate(documents[0])}),
+            index_to_docstore_id=dict(first.index_to_docstore_id),
+        )
+        for vector_store in vector_stores[1:]:
+            merged.merge_from(vector_store)
+        return merged, [doc for docs in documents for doc in docs]
+
+    @staticmethod
+    def _relevance_score(distance):
+        """与 LangChain FAISS 默认（欧氏距离）的相关度换算一致."""
+        return 1.0 - distance / math.sqrt(2)
+
+    def _search_batch(self, vector_store, query_vectors, k):
+        """对一组 query 向量做一次矩阵检索，返回每个 query 的 [(Document, score)]."""
+        with tracing.span("faiss.search", queries=len(query_vectors), k=k, ntotal=vector_store.index.ntotal):
+            distances, indices = vector_store.index.search(query_vectors, k)
+        results = []
+        for row_distances, row_indices in zip(distances, indices):
+            hits = [(vector_store.index_to_docstore_id[index], self._relevance_score(float(distance)))
+                    for distance, index in zip(row_distances, row_indices) if index != -1]
+            docs = self.multi_retriever.docstore.mget([doc_id for doc_id, _ in hits])
+            results.append([(doc, score) for doc, (_, score) in zip(docs, hits) if doc is not None])
+        return results
 
-    def retrieve_similar_documents(self, query, vector_store, document, chunk_nums=None):
-        """检索与 query 相关的相似文档."""
+    def process_queries(self, queries, chunk_nums=None, k=3):
+        """
+        处理多个 query，复用初始化好的向量存储。
+        所有 query 一次批量向量化，每个向量库只做一次矩阵检索；分片索引并行检索后按相似度合并全局 top-k。
+        是否分片由加载的索引决定，chunk_nums 仅为兼容旧调用保留。
+        """
+        if isinstance(queries, str):
+            queries = [queries]
+        if not queries:
+            return []
 
-        try:
-            document_ids = [str(uuid.uuid4()) for _ in document]
-            self.multi_retriever.docstore.mset(list(zip(document_ids, document)))
+        with tracing.span("retrieval.query", queries=len(queries), k=k):
+            return self._process_queries(queries, k)
 
-            if chunk_nums:
-                similar_chunks = vector_store.similarity_search_with_relevance_scores(query, k=3)
-                return [{"content": doc[0].page_content.replace('\n', ', '), "score": doc[1]} for doc in similar_chunks]
-            return vector_store.similarity_search(query, k=3)
+    def _process_queries(self, queries, k):
+        try:
+            query_vectors = np.asarray(embed_queries(self.embedding_model, queries), dtype=np.float32)
         except Exception as e:
-            print(f"Error during similarity search for query '{query}': {e}")
-            return []
-
-    def process_single_query(self, query, chunk_nums):
-        """处理单个 query 并返回相似文档."""
+            print(f"Error during embedding queries {queries}: {e}")
+            return ['' for _ in queries]
 
         # 从单个 vector_store 检索
-        if not chunk_nums:
-            context = self.retrieve_similar_documents(query, self.vector_store, self.document)
-            return "\n------------\n".join(doc.page_content.replace('\n', ', ') for doc in context)
-
-        # 从多个 vector_store 检索，按照相似度排序并返回结果
-        context_list = []
-        for vector, doc in zip(self.vector_store, self.document):
-            context = self.retrieve_similar_documents(query, vector, doc, chunk_nums)
-            context_list.extend(context)
-        sorted_list = sorted(context_list, key=lambda x: x['score'], reverse=True)
-        return "\n------------\n".join(doc['content'] for doc in sorted_list)
-
-    def process_queries(self, queries, chunk_nums=None):
-        """处理多个 query，复用初始化好的向量存储."""
-        if isinstance(queries, str):
-            queries = [queries]
+        if not isinstance(self.vector_store, list):
+            hits = self._search_batch(self.vector_store, query_vectors, k)
+            return ["\n------------\n".join(doc.page_content.replace('\n', ', ') for doc, _ in row) for row in hits]
 
-        results = []
-        for query in queries:
-            result = self.process_single_query(query, chunk_nums)
-            # print(f"Performing similarity search result of the  {query} :\n {result}")
-            results.append(result)
-        return results
+        # 从多个 vector_store 并行检索，用大小为 k 的堆合并各分片结果
+        def search(vector_store):
+            return self._search_batch(vector_store, query_vectors, k)
+
+        # 每个分片在调用方上下文的副本中检索，线程池中的 span 仍挂在本次检索之下
+        contexts = [contextvars.copy_context() for _ in self.vector_store]
+        if self._shard_executor is not None:
+            shard_hits = self._shard_executor.map(lambda context, store: context.run(search, store),
+                                                  contexts, self.vector_store)
+        else:
+            shard_hits = map(lambda context, store: context.run(search, store), contexts, self.vector_store)
+
+        return ["\n------------\n".join(contents) for contents in merge_top_k(shard_hits, len(queries), k)]
+
+
+class SearcherRegistry:
+    """进程级的 SimilaritySearcher 缓存.
+
+    每个索引目录只加载一次，之后仅在 meta.json 的版本戳发生变化时重新加载，可在多线程间共享。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._searchers = {}
+
+    @staticmethod
+    def _stamp(index_dir):
+        meta_path = os.path.join(index_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        return os.stat(meta_path).st_mtime_ns, load_meta(index_dir).get("version")
+
+    def get(self, index_dir=INDEX_DIR, embedding_model=None):
+        """返回已加载的检索器，索引重建后自动重新加载."""
+        key = os.path.abspath(index_dir)
+        with self._lock:
+            stamp = self._stamp(key)
+            entry = self._searchers.get(key)
+            if entry is not None and stamp is not None and entry[0] == stamp:
+                return entry[1]
+
+            # 重新加载时复用已有的 embedding 模型，避免重复加载模型权重
+            if embedding_model is None and entry is not None:
+                embedding_model = entry[1].embedding_model
+            searcher = SimilaritySearcher(key, embedding_model=embedding_model)
+            self._searchers[key] = (self._stamp(key), searcher)
+            return searcher
+
+    def warm(self, index_dir=INDEX_DIR, embedding_model=None):
+        """预先加载索引，避免首次检索时才读取磁盘."""
+        return self.get(index_dir, embedding_model)
+
+    def invalidate(self, index_dir=None):
+        """丢弃指定索引目录的检索器；不传参数时清空全部."""
+        with self._lock:
+            if index_dir is None:
+                self._searchers.clear()
+            else:
+                self._searchers.pop(os.path.abspath(index_dir), None)
+
+
+searcher_registry = SearcherRegistry()
 
 
 def retriever_tool(query: list):
@@ -147,7 +375,7 @@ def retriever_tool(query: list):
     '''query:问题列表
     若模型无法通过已有知识回答用户问题时,优先考虑采用此工具而不是搜索引擎,从本地知识库中回答用户问题,需要提供用户问题参数
     """
-    searcher = SimilaritySearcher()
+    searcher = searcher_registry.get()
     res = searcher.process_queries(query)
     return res
 
@@ -159,6 +387,6 @@ if __name__ == '__main__':
     rag.initialize_vector_store(files_paths, chunk_nums=3)
 
 
-    searcher = SimilaritySearcher()
+    searcher = searcher_registry.get()
     res = searcher.process_queries(questions, chunk_nums=3)
     print(res)
@@ -1,12 +1,14 @@
-from .Rag_tool import retriever_tool, RAGService
-from .add_sum import add
-from .exponential import exponential
-from .multiply import multiply
-from .tool_manager import ToolManager
-from .split_query import split_query
+import importlib
+
+from .tool_manager import ToolManager, ToolEntry, ToolPolicy, TOOL_MODULES
+
+# 工具函数与 RAGService 在第一次访问时才导入，导入包本身不加载 LangChain / FAISS / 模型客户端
+_LAZY_ATTRS = dict(TOOL_MODULES, RAGService="Tools_manager.Rag_tool")
 
 __all__ = [
     "ToolManager",
+    "ToolEntry",
+    "ToolPolicy",
     "multiply",
     "add",
     "exponential",
@@ -14,3 +16,11 @@ __all__ = [
     "split_query",
     'RAGService'
 ]
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        value = getattr(importlib.import_module(_LAZY_ATTRS[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,88 @@
+import hashlib
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+from until import tracing
+from until.disk_cache import DiskCache
+
+EMBEDDING_CACHE_PATH = 'cache/embeddings.sqlite'
+
+
+def embed_queries(embeddings, texts):
+    """
+    批量计算 query 向量。BGE 模型直接以一个批次调用 encode（与 embed_query 相同的检索指令和预处理），
+    其他模型退回逐条 embed_query。
+    """
+    if hasattr(embeddings, 'embed_queries'):
+        return embeddings.embed_queries(texts)
+
+    client = getattr(embeddings, 'client', None)
+    instruction = getattr(embeddings, 'query_instruction', None)
+    if client is not None and instruction is not None:
+        texts = [instruction + text.replace("\n", " ") for text in texts]
+        return client.encode(texts, **embeddings.encode_kwargs).tolist()
+    return [embeddings.embed_query(text) for text in texts]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    在 embedding 模型外加一层磁盘缓存，按 (模型路径, 是否归一化, 文本哈希) 复用已计算的向量。
+    文档向量与 query 向量分开缓存（BGE 会为 query 添加检索指令）。
+    """
+
+    def __init__(self, base_embeddings, cache_path=EMBEDDING_CACHE_PATH, max_bytes=512 * 1024 * 1024):
+        self.base_embeddings = base_embeddings
+        self.cache = DiskCache(cache_path, max_bytes=max_bytes)
+
+        encode_kwargs = getattr(base_embeddings, 'encode_kwargs', {}) or {}
+        self.namespace = '|'.join([
+            str(getattr(base_embeddings, 'model_name', type(base_embeddings).__name__)),
+            str(encode_kwargs.get('normalize_embeddings', False)),
+        ])
+
+    def _key(self, kind, text):
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return f"{self.namespace}|{kind}|{digest}"
+
+    @staticmethod
+    def _dumps(vector):
+        return array('f', vector).tobytes()
+
+    @staticmethod
+    def _loads(data):
+        vector = array('f')
+        vector.frombytes(data)
+        return vector.tolist()
+
+    def _cached(self, kind, texts, compute):
+        """读取缓存，未命中的文本去重后交给 compute 一次批量计算并写回."""
+        with tracing.span("embedding.batch", kind=kind, texts=len(texts)) as span:
+            keys = [self._key(kind, text) for text in texts]
+            cached = self.cache.get_many(keys)
+            span.set(cache_hits=len(cached))
+
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in cached:
+                    missing.setdefault(key, text)
+            if missing:
+                vectors = compute(list(missing.values()))
+                computed = {key: self._dumps(vector) for key, vector in zip(missing, vectors)}
+                self.cache.set_many(computed)
+                cached.update(computed)
+            span.set(computed=len(missing))
+
+            return [self._loads(cached[key]) for key in keys]
+
+    def embed_documents(self, texts):
+        return self._cached('doc', texts, self.base_embeddings.embed_documents)
+
+    def embed_query(self, text):
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts):
+        return self._cached('query', texts, lambda missing: embed_queries(self.base_embeddings, missing))
+
+    def stats(self):
+        return self.cache.stats()
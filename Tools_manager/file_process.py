@@ -1,4 +1,5 @@
 import json
+import os
 
 import pandas as pd
 from langchain.schema import Document
@@ -48,100 +49,119 @@ def structure_headers(df, start_row=1, start_col=1):
     return flat_headers, header_end_row
 
 
-def load_xlsx_file(path, text_splitter, num_part=None):
-    """处理 xlsx 文件，将其转换为 csv 后处理"""
+BATCH_SIZE = 1000
+TXT_BLOCK_CHARS = 1 << 20
+
+
+def convert_xlsx_to_csv(path):
+    """将 xlsx 转换为同名 csv，返回 csv 路径"""
     df = pd.read_excel(path, header=None)
     headers, end_row = structure_headers(df)
     new_df = df.iloc[end_row + 1:, :]
     new_df.columns = headers
     csv_path = path.replace('xlsx', 'csv')
     new_df.to_csv(csv_path, index=False)
-    return load_csv_file(path, text_splitter, num_part)
+    return csv_path
 
 
-def load_csv_file(path, text_splitter, num_part=None):
+def iter_csv_documents(path):
+    """逐行产出 csv 文档，不会一次性读入整个文件"""
     loader = CSVLoader(file_path=path, encoding='utf-8')
-    tables = loader.load()
+    yield from loader.lazy_load()
 
-    if not num_part:
-        return text_splitter.split_documents(tables)
-    else:
-        total_length = len(tables)
 
+def iter_txt_documents(path):
+    """按行累积到 TXT_BLOCK_CHARS 后产出一个文档，小文件与整体读入的结果一致"""
+    with open(path, 'r', encoding='utf-8') as file:
+        block = []
+        block_chars = 0
+        for line in file:
+            block.append(line)
+            block_chars += len(line)
+            if block_chars >= TXT_BLOCK_CHARS:
+                yield Document(page_content=''.join(block), metadata={"source": path})
+                block, block_chars = [], 0
+        if block:
+            yield Document(page_content=''.join(block), metadata={"source": path})
+
+
+def iter_json_documents(path):
+    """json 需要整体解析，但文档按条产出，不再额外保留文档列表"""
+    with open(path, 'r', encoding='utf-8') as file:
+        json_data = json.load(file)
+    for item in json_data:
+        yield Document(page_content=json.dumps(item), metadata={"source": path})
+
+
+SOURCE_ITERATORS = {
+    '.csv': iter_csv_documents,
+    '.txt': iter_txt_documents,
+    '.json': iter_json_documents,
+}
+
+
+def iter_document_batches(path, text_splitter, num_part=None, batch_size=BATCH_SIZE):
+    """
+    流式读取并切分文件，每次产出 (part_index, 切分后的文档列表)，每批最多包含 batch_size 条原始文档，
+    峰值内存只与 batch_size 有关。
+    指定 num_part 时按原始文档数等分为 num_part 段（最后一段包含余数），与旧的 num_part 语义一致；
+    为此会先流式扫描一遍文件计数。
+    """
+    if path.endswith('.xlsx'):
+        path = convert_xlsx_to_csv(path)
+    iter_source = SOURCE_ITERATORS[os.path.splitext(path)[1]]
+
+    part_size = None
+    if num_part:
+        total_length = sum(1 for _ in iter_source(path))
         part_size = total_length // num_part
-        parts = []
-
-        start = 0
-        for i in range(num_part):
-            end = start + part_size if i < num_part - 1 else total_length
-            parts.append(tables[start:end])
-            start = end
 
+    batch = []
+    current_part = 0
+    for index, document in enumerate(iter_source(path)):
+        part = 0
+        if num_part:
+            part = min(index // part_size, num_part - 1) if part_size else num_part - 1
+        if batch and (part != current_part or len(batch) >= batch_size):
+            yield current_part, text_splitter.split_documents(batch)
+            batch = []
+        current_part = part
+        batch.append(document)
+    if batch:
+        yield current_part, text_splitter.split_documents(batch)
+
+
+def _collect(path, text_splitter, num_part=None):
+    """把流式结果收集为列表，保持 process_path 原有的返回格式"""
+    if not num_part:
         split_docs = []
-        for part in parts:
-            part_split = text_splitter.split_documents(part)
-            split_docs.append(part_split)
-
+        for _, batch in iter_document_batches(path, text_splitter):
+            split_docs.extend(batch)
         return split_docs
 
+    split_docs = [[] for _ in range(num_part)]
+    for part, batch in iter_document_batches(path, text_splitter, num_part):
+        split_docs[part].extend(batch)
+    return split_docs
 
-def load_txt_file(path, text_splitter, num_part=None):
-    """处理 txt 文件"""
 
-    with open(path, 'r', encoding='utf-8') as file:
-        text = file.read()
-    text_document = Document(page_content=text, metadata={"source": path})
-    if not num_part:
-        return text_splitter.split_documents([text_document])
-    else:
-        total_length = len([text_document])
+def load_xlsx_file(path, text_splitter, num_part=None):
+    """处理 xlsx 文件，将其转换为 csv 后处理"""
+    return _collect(path, text_splitter, num_part)
 
-        part_size = total_length // num_part
-        parts = []
 
-        start = 0
-        for i in range(num_part):
-            end = start + part_size if i < num_part - 1 else total_length
-            parts.append([text_document][start:end])
-            start = end
+def load_csv_file(path, text_splitter, num_part=None):
+    return _collect(path, text_splitter, num_part)
 
-        split_docs = []
-        for part in parts:
-            part_split = text_splitter.split_documents(part)
-            split_docs.append(part_split)
 
-        return split_docs
+def load_txt_file(path, text_splitter, num_part=None):
+    """处理 txt 文件"""
+    return _collect(path, text_splitter, num_part)
 
 
 def load_json_file(path, text_splitter, num_part=None):
     """处理 json 文件"""
-
-    documents = []
-    with open(path, 'r', encoding='utf-8') as file:
-        json_data = json.load(file)
-    for item in json_data:
-        json_document = Document(page_content=json.dumps(item), metadata={"source": path})
-        documents.extend(text_splitter.split_documents([json_document]))
-    if not num_part:
-        return documents
-    else:
-        total_length = len(documents)
-
-        part_size = total_length // num_part
-        parts = []
-
-        start = 0
-        for i in range(num_part):
-            end = start + part_size if i < num_part - 1 else total_length
-            parts.append(documents[start:end])
-            start = end
-
-        split_docs = []
-        for part in parts:
-            part_split = text_splitter.split_documents(part)
-            split_docs.append(part_split)
-
-        return split_docs
+    return _collect(path, text_splitter, num_part)
 
 
 def process_path(path, text_splitter, num_part):
@@ -0,0 +1,191 @@
+import hashlib
+import importlib
+import json
+import os
+import pickle
+import time
+
+import faiss
+from langchain.schema import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+INDEX_DIR = 'cache/index'
+META_FILE = 'meta.json'
+MANIFEST_FILE = 'manifest.json'
+INDEX_FORMAT = 1
+
+
+def _atomic_write(path, write_fn):
+    """先写临时文件再替换，避免读取方看到写了一半的文件."""
+    tmp_path = f"{path}.tmp"
+    write_fn(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_json(path, data):
+    def write(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    _atomic_write(path, write)
+
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def embedding_config_of(embedding_model):
+    """提取 embedding 模型的构造参数，用于加载索引时重建同样的模型（缓存包装层会被剥离）."""
+    embedding_model = getattr(embedding_model, 'base_embeddings', embedding_model)
+    cls = type(embedding_model)
+    return {
+        "class": f"{cls.__module__}.{cls.__qualname__}",
+        "model_name": getattr(embedding_model, 'model_name', None),
+        "model_kwargs": getattr(embedding_model, 'model_kwargs', {}),
+        "encode_kwargs": getattr(embedding_model, 'encode_kwargs', {}),
+    }
+
+
+def build_embedding_model(config):
+    """根据 meta.json 中记录的参数重建 embedding 模型."""
+    module_name, _, cls_name = config["class"].rpartition('.')
+    cls = getattr(importlib.import_module(module_name), cls_name)
+    return cls(model_name=config["model_name"],
+               model_kwargs=config["model_kwargs"],
+               encode_kwargs=config["encode_kwargs"])
+
+
+def write_shard(vector_store, index_dir, name):
+    """原生 FAISS 索引写入 <name>.faiss，文档与 id 映射写入 <name>.docs.json."""
+    _atomic_write(os.path.join(index_dir, f'{name}.faiss'),
+                  lambda tmp_path: faiss.write_index(vector_store.index, tmp_path))
+
+    ids = [vector_store.index_to_docstore_id[i] for i in range(vector_store.index.ntotal)]
+    docs = []
+    for doc_id in ids:
+        doc = vector_store.docstore.search(doc_id)
+        docs.append({"page_content": doc.page_content, "metadata": doc.metadata})
+    _write_json(os.path.join(index_dir, f'{name}.docs.json'), {"ids": ids, "docs": docs})
+
+
+def _read_index(path, mmap=True):
+    """以只读内存映射方式加载索引，多个进程可共享同一份页缓存；不支持时退回普通加载."""
+    if mmap:
+        flags = faiss.IO_FLAG_READ_ONLY | faiss.IO_FLAG_MMAP | getattr(faiss, 'IO_FLAG_MMAP_IFC', 0)
+        try:
+            return faiss.read_index(path, flags)
+        except RuntimeError as e:
+            print(f"Memory-mapped loading not supported for {path}, falling back: {e}")
+    return faiss.read_index(path)
+
+
+def load_shard(index_dir, name, embedding_model, mmap=True):
+    index = _read_index(os.path.join(index_dir, f'{name}.faiss'), mmap)
+    data = _read_json(os.path.join(index_dir, f'{name}.docs.json'))
+
+    documents = [Document(page_content=doc["page_content"], metadata=doc["metadata"]) for doc in data["docs"]]
+    vector_store = FAISS(
+        embedding_function=embedding_model,
+        index=index,
+        docstore=InMemoryDocstore(dict(zip(data["ids"], documents))),
+        index_to_docstore_id=dict(enumerate(data["ids"])),
+    )
+    return vector_store, documents
+
+
+def save_vector_stores(vector_store, index_dir=INDEX_DIR, embedding_config=None):
+    """保存单个向量库或分片向量库列表，最后写入 meta.json 作为版本戳."""
+    sharded = isinstance(vector_store, list)
+    stores = vector_store if sharded else [vector_store]
+    os.makedirs(index_dir, exist_ok=True)
+
+    shards = []
+    for i, store in enumerate(stores):
+        name = f'shard_{i}'
+        write_shard(store, index_dir, name)
+        shards.append(name)
+
+    if embedding_config is None and stores:
+        embedding_config = embedding_config_of(stores[0].embedding_function)
+    return write_meta(index_dir, shards, sharded, embedding_config)
+
+
+def write_meta(index_dir, shards, sharded, embedding_config):
+    """写入 meta.json；它是索引的提交点，检索端据此判断是否需要重新加载."""
+    meta = {
+        "format": INDEX_FORMAT,
+        "version": time.time_ns(),
+        "sharded": sharded,
+        "shards": shards,
+        "embedding": embedding_config,
+    }
+    _write_json(os.path.join(index_dir, META_FILE), meta)
+    return meta
+
+
+def load_meta(index_dir=INDEX_DIR):
+    return _read_json(os.path.join(index_dir, META_FILE))
+
+
+def remove_shards(index_dir, names):
+    """删除不再被 meta.json 引用的分片文件."""
+    for name in names:
+        for suffix in ('.faiss', '.docs.json'):
+            path = os.path.join(index_dir, f'{name}{suffix}')
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def file_sha256(path, block_size=1 << 20):
+    """按块计算文件内容哈希."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(index_dir=INDEX_DIR):
+    """
+    读取增量索引的 manifest；文件缺失或与当前 meta.json 版本不一致时返回 None，
+    调用方应当按全量重建处理。
+    """
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path) or not os.path.exists(os.path.join(index_dir, META_FILE)):
+        return None
+    manifest = _read_json(manifest_path)
+    if manifest.get("version") != load_meta(index_dir).get("version"):
+        return None
+    return manifest
+
+
+def save_manifest(index_dir, version, settings, files):
+    _write_json(os.path.join(index_dir, MANIFEST_FILE),
+                {"version": version, "settings": settings, "files": files})
+
+
+def load_vector_stores(index_dir=INDEX_DIR, embedding_model=None, mmap=True):
+    """
+    加载原生格式的索引。
+    返回 (vector_store, document, embedding_model)，分片模式下前两者为列表。
+    """
+    meta = load_meta(index_dir)
+    if embedding_model is None:
+        embedding_model = build_embedding_model(meta["embedding"])
+
+    shards = [load_shard(index_dir, name, embedding_model, mmap) for name in meta["shards"]]
+    vector_stores = [store for store, _ in shards]
+    documents = [docs for _, docs in shards]
+    if meta["sharded"]:
+        return vector_stores, documents, embedding_model
+    return vector_stores[0], documents[0], embedding_model
+
+
+def migrate_pickle_cache(vectors_single_path='cache/vectors_store.pkl', index_dir=INDEX_DIR):
+    """将旧版 pickle 缓存（cache/vectors_store.pkl）转换为原生索引格式，文档从各向量库的 docstore 中恢复."""
+    with open(vectors_single_path, 'rb') as f:
+        vector_store = pickle.load(f)
+    print(f"Migrating {vectors_single_path} to {index_dir}")
+    return save_vector_stores(vector_store, index_dir)
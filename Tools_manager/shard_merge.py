@@ -0,0 +1,22 @@
+import heapq
+
+
+def merge_top_k(shard_hits, query_count, k):
+    """
+    合并各分片的检索结果：shard_hits 按分片给出每个 query 的 [(Document, score)]，
+    每个 query 用大小为 k 的堆保留全局得分最高的 k 条，按得分从高到低返回各条的文本。
+    得分相同时先出现的分片（及分片内靠前的结果）排在前面。
+    """
+    heaps = [[] for _ in range(query_count)]
+    seq = 0
+    for hits in shard_hits:
+        for heap, row in zip(heaps, hits):
+            for doc, score in row:
+                item = (score, -seq, doc.page_content.replace('\n', ', '))
+                seq += 1
+                if len(heap) < k:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+
+    return [[content for _, _, content in sorted(heap, reverse=True)] for heap in heaps]
@@ -1,4 +1,13 @@
-from Model_manager.API_service import CustomLLM
+_llm = None
+
+
+def _get_llm():
+    """各次调用共用一个客户端（底层连接池由 http_pool 管理）；回放时本函数被替换，不导入也不创建真实客户端。"""
+    global _llm
+    if _llm is None:
+        from Model_manager.API_service import CustomLLM
+        _llm = CustomLLM()
+    return _llm
 
 
 def split_query(query, data_str):
@@ -9,7 +18,7 @@ def split_query(query, data_str):
     指标随时间的变化趋势；指标的月度季节性变化；指标的周期性变化；指标同比或环比增幅和下降情况；指标异常值数据（前几名或后几名）；各部分指标占总指标的比例；同一指标在不同时间的变化；同一指标在不同地区的变化；同一指标在不同类别或领域的变化；不同指标在同一时间地区的比较。
     注意不要照搬已有角度，应契合已有数据内容，确保已有数据能回答该问题。仅输出问题。
     '''
-    llm = CustomLLM()
+    llm = _get_llm()
     input_str = prompt_template.format(query)
     response = llm.chat(input_str, '数据如下：\n' + data_str)
     return response
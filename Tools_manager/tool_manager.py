@@ -1,25 +1,146 @@
+import ast
+import builtins
+import importlib
+import importlib.util
 import inspect
+import sys
 
-from .Rag_tool import retriever_tool
-from .add_sum import add
-from .exponential import exponential
-from .multiply import multiply
-from .split_query import split_query
+# 工具名 -> 所在模块；模块只在工具第一次被调用时导入
+TOOL_MODULES = {
+    "retriever_tool": "Tools_manager.Rag_tool",
+    "split_query": "Tools_manager.split_query",
+    "multiply": "Tools_manager.multiply",
+    "add": "Tools_manager.add_sum",
+    "exponential": "Tools_manager.exponential",
+}
+
+
+class ToolPolicy:
+    """
+    工具的执行策略，由 until.tool_runner 执行：
+    mode 为 inline（不限时，只用于瞬间完成的工具）、thread（线程池，超时后放弃等待）或 process（子进程，超时后终止进程）；
+    timeout 为秒数，None 表示不限；max_result_chars 为观察结果的最大字数，超出部分截断。
+    cacheable 表示相同参数的结果在一次 agent 执行内可以复用（见 until.tool_cache）；
+    item_arg 为列表参数名，工具对该列表逐项返回结果时，已缓存的项不再重复计算。
+    """
+    MODES = ('inline', 'thread', 'process')
+
+    def __init__(self, mode='thread', timeout=None, max_result_chars=None, cacheable=False, item_arg=None):
+        if mode not in self.MODES:
+            raise ValueError(f"未知的执行方式: {mode}")
+        self.mode = mode
+        self.timeout = timeout
+        self.max_result_chars = max_result_chars
+        self.cacheable = cacheable
+        self.item_arg = item_arg
+
+    def __repr__(self):
+        return (f"ToolPolicy(mode={self.mode!r}, timeout={self.timeout}, max_result_chars={self.max_result_chars}, "
+                f"cacheable={self.cacheable}, item_arg={self.item_arg!r})")
+
+
+DEFAULT_TOOL_POLICY = ToolPolicy('thread', timeout=60, max_result_chars=6000)
+
+# 检索和 split_query 主要在等待 IO，放在线程池；幂运算可能因参数过大长时间占用 CPU，放在可终止的子进程中。
+# 检索按 query 列表逐项返回结果，重复的子问题直接复用；split_query 对相同的问题和数据复用上次拆分的结果
+TOOL_POLICIES = {
+    "retriever_tool": ToolPolicy('thread', timeout=60, max_result_chars=6000, cacheable=True, item_arg='query'),
+    "split_query": ToolPolicy('thread', timeout=120, max_result_chars=3000, cacheable=True),
+    "multiply": ToolPolicy('inline', max_result_chars=1000),
+    "add": ToolPolicy('inline', max_result_chars=1000),
+    "exponential": ToolPolicy('process', timeout=5, max_result_chars=1000),
+}
+
+
+def _annotation_text(node):
+    """内置类型注解（如 list、int）不导入模块即可得到与 str(annotation) 相同的文本，其他注解返回 None。"""
+    if node is None:
+        return "unknown"
+    if isinstance(node, ast.Name) and isinstance(getattr(builtins, node.id, None), type):
+        return str(getattr(builtins, node.id))
+    return None
+
+
+class ToolEntry:
+    """
+    延迟解析的工具：描述从模块源码的语法树中读取，与导入后用 inspect 得到的完全一致；
+    第一次调用时才导入模块（及其依赖的 LangChain、FAISS、模型客户端等）。
+    """
+
+    def __init__(self, name, module, policy=DEFAULT_TOOL_POLICY):
+        self.name = name
+        self.__name__ = name
+        self.module = module
+        self.policy = policy
+        self._func = None
+        self._node = None
+
+    def _function_node(self):
+        if self._node is None:
+            spec = importlib.util.find_spec(self.module)
+            with open(spec.origin, 'r', encoding='utf-8') as f:
+                tree = ast.parse(f.read())
+            for node in tree.body:
+                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == self.name:
+                    self._node = node
+                    break
+            else:
+                raise AttributeError(f"{self.module} 中没有函数 {self.name}")
+        return self._node
+
+    @property
+    def loaded(self):
+        return self._func is not None
+
+    def resolve(self):
+        if self._func is None:
+            self._func = getattr(importlib.import_module(self.module), self.name)
+        return self._func
+
+    @property
+    def is_coroutine(self):
+        return isinstance(self._function_node(), ast.AsyncFunctionDef)
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def description(self):
+        """与 ToolManager.get_function_info(函数) 的输出相同；遇到无法静态确定的注解时才导入模块。"""
+        if self._func is not None:
+            return ToolManager.get_function_info(self._func)
+
+        node = self._function_node()
+        arguments = node.args.posonlyargs + node.args.args + [node.args.vararg] + node.args.kwonlyargs + [node.args.kwarg]
+        params = [(arg.arg, _annotation_text(arg.annotation)) for arg in arguments if arg is not None]
+        return_type = _annotation_text(node.returns)
+        if return_type is None or any(annotation is None for _, annotation in params):
+            return ToolManager.get_function_info(self.resolve())
+
+        # Python 3.13 起编译器会去掉 __doc__ 的公共缩进
+        doc = ast.get_docstring(node, clean=sys.version_info >= (3, 13))
+        description = doc.strip() if doc else "No description provided"
+        args_info = {name: {'name': name.replace('_', ' ').title(), 'type': annotation}
+                     for name, annotation in params}
+        args_format = ', '.join([f"{name}: {info['type']}" for name, info in args_info.items()])
+        return f"{self.name}({args_format}) -> {return_type} - {description}, args: {args_info}"
 
 
 class ToolManager:
     def __init__(self):
-        self.ALL_TOOLS = [
-            retriever_tool, split_query, multiply, add, exponential
-        ]
+        self.ALL_TOOLS = [ToolEntry(name, module, TOOL_POLICIES.get(name, DEFAULT_TOOL_POLICY))
+                          for name, module in TOOL_MODULES.items()]
 
     def get_tool_map(self):
-        """动态生成工具映射字典，将函数名映射到相应的函数。"""
-        return {tool.__name__: tool for tool in self.ALL_TOOLS}
+        """动态生成工具映射字典，将函数名映射到相应的函数；异步工具直接解析，以便调用方识别协程函数。"""
+        return {tool.name: tool.resolve() if tool.is_coroutine else tool for tool in self.ALL_TOOLS}
+
+    def get_policies(self):
+        """工具名 -> ToolPolicy。"""
+        return {tool.name: tool.policy for tool in self.ALL_TOOLS}
 
     def get_tools(self):
         """返回所有工具的名称、描述和参数信息的列表。"""
-        tools_des = [self.get_function_info(tool) for tool in self.ALL_TOOLS]
+        tools_des = [tool.description() for tool in self.ALL_TOOLS]
         return '\n'.join(tools_des)
 
     @staticmethod
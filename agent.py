@@ -1,14 +1,18 @@
 # -*- coding: UTF-8 -*-
+import asyncio
 import json
 import logging
 import os
+import queue
+import threading
 import time
-from typing import Any, Dict, Optional, Union
-from Model_manager.API_service import CustomLLM
-from Model_manager.Local_service import LocalLLM
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from Memory_manger.scratchpad import SCRATCH_TOKEN_BUDGET, Scratchpad, ScratchStep
 from Tools_manager import ToolManager
-from Tools_manager.Rag_tool import RAGService
-from until.table_data_preprocess import preprocess_table, get_all_file_paths
+from Tools_manager.tool_manager import DEFAULT_TOOL_POLICY
+from until import replay, tool_cache, tracing
+from until.tool_runner import ToolTimeout, cap_result, default_runner
+from until.action_stream import ANSWER_RESET, ActionStreamParser
 
 os.makedirs('log', exist_ok=True)
 log_file_path = os.path.join('log', 'agent_executor.log')
@@ -20,22 +24,73 @@ logging.basicConfig(level=logging.INFO,
 # logging.StreamHandler()
 
 
+_background_loop = None
+_background_loop_lock = threading.Lock()
+
+
+def _get_background_loop():
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(target=_background_loop.run_forever, name='agent-loop', daemon=True).start()
+    return _background_loop
+
+
+def run_sync(coro):
+    """
+    在后台常驻的事件循环中执行协程并等待结果。
+    同步接口共用同一个循环，异步客户端的连接池可以在多次调用之间复用。
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_background_loop()).result()
+
+
+def _is_agent_response(text: str) -> bool:
+    """模型响应能解析为 JSON 对象时才值得写入响应缓存，否则重试时会从缓存读回同一个无效响应。"""
+    try:
+        return isinstance(json.loads(text), dict)
+    except (TypeError, ValueError):
+        return False
+
+
 class AgentExecutor:
-    def __init__(self, local=False):
+    def __init__(self, local=False, stream=True, scratch_token_budget=SCRATCH_TOKEN_BUDGET,
+                 record_path=replay.RECORD_PATH, memoize_tools=True, llm=None):
 
-        if local:
+        # 只导入实际使用的模型客户端（openai / httpx 的导入耗时不算在 agent 模块的导入里）；
+        # llm 可以直接传入任何实现了 achat / achat_stream 的客户端，如测试与回放中的替身
+        if llm is not None:
+            self.llm = llm
+        elif local:
+            from Model_manager.Local_service import LocalLLM
             self.llm = LocalLLM()
         else:
+            from Model_manager.API_service import CustomLLM
             self.llm = CustomLLM()
 
         self.tool_manager = ToolManager()
         self.action_des = self.tool_manager.get_tools()
         self.tools_map = self.tool_manager.get_tool_map()
+        # 各工具的执行方式、超时和结果大小上限
+        self.tool_policies = self.tool_manager.get_policies()
+        self.tool_runner = default_runner
+        # 一次执行内复用 cacheable 工具相同参数（或列表参数中相同项）的结果
+        self.memoize_tools = memoize_tools
 
         self.prompt_template = open('Prompt/table_system_prompt.txt', 'r', encoding='utf-8').read()
         self.user_prompt = open('Prompt/human_prompt.txt', 'r', encoding='utf-8').read()
 
         self.agent_scratch = ""
+        # 思考进程的 token 预算，超出后压缩较早轮次的观察结果
+        self.scratch_token_budget = scratch_token_budget
+        # 流式调用模型："行动" 解析完整后立即开始执行工具，Final Answer 逐段输出
+        self.stream = stream
+        # 最近一次执行的耗时统计（秒，从开始执行算起）
+        self.last_run_stats = {}
+        # 录制 LLM 请求/响应与工具调用，供 until.replay 回放
+        self.recorder = None
+        if record_path:
+            replay.enable_recording(self, record_path)
 
     def init_agent_scratch(self) -> None:
         """初始化思考过程记录。"""
@@ -49,8 +104,12 @@ class AgentExecutor:
         返回:
             Optional[Dict[str, Any]]: 模型响应字典，如果出错则返回 None。
         """
+        return run_sync(self.ainvoke_llm(query))
+
+    async def ainvoke_llm(self, query: str, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+        """invoke_llm 的异步版本。use_cache=False 时不读写响应缓存（上一轮响应无效、以相同提示词重试时）。"""
         try:
-            response = self.llm.chat(query, self.user_prompt)
+            response = await self.llm.achat(query, self.user_prompt, validate=_is_agent_response, use_cache=use_cache)
             return response if isinstance(response, dict) else json.loads(response)
         except json.JSONDecodeError as e:
             logging.error(f"解析模型响应出错: {e}")
@@ -58,11 +117,62 @@ class AgentExecutor:
             logging.error(f"调用模型时出错: {e}")
         return None
 
+    async def ainvoke_llm_stream(self, query: str,
+                                 stats: Dict[str, float],
+                                 on_answer: Optional[Callable[[str], None]] = None,
+                                 use_cache: bool = True
+                                 ) -> Tuple[Optional[Dict[str, Any]], Optional[List["asyncio.Task"]]]:
+        """
+        流式调用 LLM。"行动" 的值在语法上完整时立即开始执行工具，不等待模型输出剩余文本；
+        Final Answer 的 answer 字段逐段交给 on_answer。
+        返回 (模型响应字典, 已经开始执行的工具任务)，出错时响应为 None；
+        此时若已经输出过部分答案，再调用 on_answer(ANSWER_RESET) 撤回，下一轮会重新输出。
+        """
+        parser = ActionStreamParser()
+        tasks = None
+        try:
+            async for delta in self.llm.achat_stream(query, self.user_prompt,
+                                                     validate=_is_agent_response, use_cache=use_cache):
+                for event, value in parser.feed(delta):
+                    elapsed = time.time() - stats["start"]
+                    if event == "action":
+                        stats.setdefault("time_to_first_action", elapsed)
+                        tasks = self._dispatch_actions(value)
+                    elif event == "answer":
+                        stats.setdefault("time_to_first_answer_token", elapsed)
+                        if on_answer:
+                            on_answer(value)
+            response = parser.result()
+            if isinstance(response, dict):
+                return response, tasks
+            logging.error(f"模型响应不是 JSON 对象: {response}")
+        except json.JSONDecodeError as e:
+            logging.error(f"解析模型响应出错: {e}")
+        except Exception as e:
+            logging.error(f"调用模型时出错: {e}")
+
+        for task in tasks or []:
+            task.cancel()
+        if parser.answer_streamed:
+            stats.pop("time_to_first_answer_token", None)
+            if on_answer:
+                on_answer(ANSWER_RESET)
+        return None, None
+
+    def _dispatch_actions(self, action_info: Union[Dict[str, Any], List[Dict[str, Any]]]
+                          ) -> Optional[List["asyncio.Task"]]:
+        """为流式解析出的 "行动" 创建工具任务；包含 Final Answer 时不执行任何工具。"""
+        actions = self._parse_actions(action_info) or [{}]
+        if any(action.get("name", "") == "Final Answer" for action in actions):
+            return None
+        return [asyncio.create_task(self.aexecute_action(action.get("name", ""), action.get("args", {})))
+                for action in actions]
+
     def agent_execute(self, query: str,
                       table_des: str = '',
                       max_request_time: int = 10) -> Optional[str]:
         """
-        Agent 执行主循环逻辑。
+        Agent 执行主循环逻辑，aagent_execute 的同步封装。
         参数:
             query (str): 用户问题。
             table_des (str, optional): 表格描述，默认为空字符串。
@@ -70,32 +180,135 @@ class AgentExecutor:
         返回:
             Optional[str]: 最终答案，如果执行失败则返回 None。
         """
-        self.init_agent_scratch()
+        return run_sync(self.aagent_execute(query, table_des, max_request_time))
+
+    async def aagent_execute(self, query: str,
+                             table_des: str = '',
+                             max_request_time: int = 10) -> Optional[str]:
+        """
+        Agent 执行主循环的异步版本，思考过程保存在本次调用内，同一个实例可以在一个事件循环中并发执行多次。
+        参数与返回值同 agent_execute。
+        """
+        return await self._arun(query, table_des, max_request_time)
+
+    def agent_execute_stream(self, query: str,
+                             table_des: str = '',
+                             max_request_time: int = 10) -> Iterator[str]:
+        """
+        同 agent_execute，但以迭代器的形式逐段返回最终答案，适合在页面上逐步渲染。
+        某一轮的响应在输出部分答案后解析失败时产出 ANSWER_RESET，调用方应丢弃此前收到的文本；
+        最后一个 ANSWER_RESET 之后的各段拼接后与 agent_execute 的返回值一致。执行失败时最后产出的是 ANSWER_RESET 或不产出任何内容。
+        """
+        chunks = queue.Queue()
+        done = object()
+        future = asyncio.run_coroutine_threadsafe(
+            self._arun(query, table_des, max_request_time, on_answer=chunks.put), _get_background_loop())
+        future.add_done_callback(lambda _: chunks.put(done))
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is done:
+                    break
+                yield chunk
+            future.result()
+        finally:
+            future.cancel()
+
+    async def aagent_execute_stream(self, query: str,
+                                    table_des: str = '',
+                                    max_request_time: int = 10) -> AsyncIterator[str]:
+        """agent_execute_stream 的异步版本。"""
+        chunks = asyncio.Queue()
+        done = object()
+        task = asyncio.create_task(self._arun(query, table_des, max_request_time, on_answer=chunks.put_nowait))
+        task.add_done_callback(lambda _: chunks.put_nowait(done))
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is done:
+                    break
+                yield chunk
+            await task
+        finally:
+            task.cancel()
+
+    async def _arun(self, query: str,
+                    table_des: str = '',
+                    max_request_time: int = 10,
+                    on_answer: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """Agent 执行主循环，on_answer 用于接收逐段输出的最终答案。每次执行记录为一个 agent.run span。"""
+        with tracing.span("agent.run", max_request_time=max_request_time):
+            run = self.recorder.start_run(query, table_des, max_request_time) if self.recorder else None
+            answer = None
+            try:
+                answer = await self._arun_rounds(query, table_des, max_request_time, on_answer)
+                return answer
+            finally:
+                if run is not None:
+                    self.recorder.end_run(run, answer)
+                if tracing.TRACE_ENABLED:
+                    tracing.tracer.dump_prometheus()
+
+    async def _arun_rounds(self, query: str,
+                           table_des: str,
+                           max_request_time: int,
+                           on_answer: Optional[Callable[[str], None]]) -> Optional[str]:
+        scratchpad = Scratchpad(self.scratch_token_budget)
+        cache = tool_cache.ToolCache() if self.memoize_tools else None
+        cache_token = tool_cache.current.set(cache)
         prompt = self.prompt_template.format(Tools=self.action_des, question=query, DATA_DESC=table_des)
+        # 思考进程之前的部分在各轮之间保持不变
+        prompt_prefix, _, prompt_suffix = prompt.partition('[agent_scratch]')
 
-        logging.info(f"系统提示:\n{prompt}")
+        logging.debug(f"系统提示:\n{prompt}")
         start_time = time.time()
+        stats = {"start": start_time}
+        rounds = 0
+        # 上一轮响应无效时提示词不变，重试需要绕过响应缓存
+        retrying = False
 
-        for attempt in range(max_request_time):
-            logging.info(f"第 {attempt + 1} 轮: 开始调用模型")
+        try:
+            for attempt in range(max_request_time):
+                logging.info(f"第 {attempt + 1} 轮: 开始调用模型")
+                rounds = attempt + 1
 
-            cot_prompt = prompt.replace('[agent_scratch]', self.agent_scratch)
-            logging.info(f'cot_prompt: {cot_prompt}')
-            start_time_2 = time.time()
-            response = self.invoke_llm(cot_prompt)
-            logging.info(f"调用模型耗时: {time.time() - start_time_2:.2f}s")
-            logging.info(f'response: {response}')
+                cot_prompt = prompt_prefix + scratchpad.render() + prompt_suffix
+                logging.info(f"思考进程 token 数: {scratchpad.tokens()}")
+                logging.debug(f'cot_prompt: {cot_prompt}')
+                start_time_2 = time.time()
+                if self.stream:
+                    response, tasks = await self.ainvoke_llm_stream(cot_prompt, stats, on_answer,
+                                                                    use_cache=not retrying)
+                else:
+                    response, tasks = await self.ainvoke_llm(cot_prompt, use_cache=not retrying), None
+                logging.info(f"调用模型耗时: {time.time() - start_time_2:.2f}s")
+                logging.debug(f'response: {response}')
 
-            if not response:
-                logging.warning("模型响应为空，继续下一轮...")
-                continue
+                retrying = not response
+                if not response:
+                    logging.warning("模型响应为空，继续下一轮...")
+                    continue
 
-            final_answer = self._handle_response(response)
-            if final_answer:
-                elapsed_time = time.time() - start_time
-                logging.info(f"最终答案: {final_answer}\n总耗时: {elapsed_time:.2f}s")
-                print(f"最终答案: {final_answer}\n总耗时: {elapsed_time:.2f}s")
-                return final_answer
+                final_answer, step = await self._handle_response(response, tasks)
+                scratchpad.add(step)
+                if final_answer:
+                    if on_answer and "time_to_first_answer_token" not in stats:
+                        stats["time_to_first_answer_token"] = time.time() - start_time
+                        on_answer(final_answer)
+                    elapsed_time = time.time() - start_time
+                    logging.info(f"最终答案: {final_answer}\n总耗时: {elapsed_time:.2f}s")
+                    print(f"最终答案: {final_answer}\n总耗时: {elapsed_time:.2f}s")
+                    return final_answer
+        finally:
+            self.agent_scratch = scratchpad.full_text()
+            stats.pop("start")
+            stats["total"] = time.time() - start_time
+            self.last_run_stats = stats
+            if cache is not None:
+                stats.update(tool_cache_hits=cache.hits, tool_cache_misses=cache.misses)
+            tool_cache.current.reset(cache_token)
+            tracing.current_span().set(rounds=rounds, scratch_tokens=scratchpad.tokens(), **stats)
+            logging.info(f"耗时统计: {stats}")
 
         logging.error(f"任务执行失败! 总耗时: {time.time() - start_time:.2f}s。")
         return None
@@ -115,34 +328,104 @@ class AgentExecutor:
             logging.error(f"未找到对应的工具函数: {tool_name}")
             return f"未找到对应的工具函数: {tool_name}"
 
-        try:
-            return func(**tool_args)
-        except Exception as e:
-            logging.error(f"执行工具函数时出错: {e}")
-            return str(e)
+        policy = self.tool_policies.get(tool_name, DEFAULT_TOOL_POLICY)
+        with tracing.span("tool.call", tool=tool_name,
+                          mode=self.tool_runner.effective_mode(func, policy)) as span:
+            try:
+                cache = tool_cache.current.get()
+                if cache is not None and policy.cacheable:
+                    result = cache.call(tool_name, tool_args, policy,
+                                        lambda args: self.tool_runner.run(tool_name, func, args, policy, cap=False))
+                    result = cap_result(result, policy.max_result_chars)
+                else:
+                    result = self.tool_runner.run(tool_name, func, tool_args, policy)
+            except ToolTimeout as e:
+                logging.warning(str(e))
+                result = str(e)
+                span.set(error=result, timeout=policy.timeout)
+            except Exception as e:
+                logging.error(f"执行工具函数时出错: {e}")
+                result = str(e)
+                span.set(error=result)
+            span.set(result_size=len(str(result)))
+            return result
 
-    def _handle_response(self, response: Dict[str, Any]) -> Optional[str]:
-        """处理模型响应，判断是否为最终答案，并更新思考过程。"""
+    async def aexecute_action(self, tool_name: str,
+                              tool_args: Dict[str, Any]) -> Union[Any, str]:
+        """execute_action 的异步版本，按工具的执行策略在线程池或子进程中执行，不阻塞事件循环。"""
+        func = self.tools_map.get(tool_name)
+        if not func:
+            logging.error(f"未找到对应的工具函数: {tool_name}")
+            return f"未找到对应的工具函数: {tool_name}"
+
+        policy = self.tool_policies.get(tool_name, DEFAULT_TOOL_POLICY)
+        with tracing.span("tool.call", tool=tool_name,
+                          mode=self.tool_runner.effective_mode(func, policy)) as span:
+            try:
+                cache = tool_cache.current.get()
+                if cache is not None and policy.cacheable:
+                    result = await cache.acall(tool_name, tool_args, policy,
+                                               lambda args: self.tool_runner.arun(tool_name, func, args, policy,
+                                                                                  cap=False))
+                    result = cap_result(result, policy.max_result_chars)
+                else:
+                    result = await self.tool_runner.arun(tool_name, func, tool_args, policy)
+            except ToolTimeout as e:
+                logging.warning(str(e))
+                result = str(e)
+                span.set(error=result, timeout=policy.timeout)
+            except Exception as e:
+                logging.error(f"执行工具函数时出错: {e}")
+                result = str(e)
+                span.set(error=result)
+            span.set(result_size=len(str(result)))
+            return result
+
+    @staticmethod
+    def _parse_actions(action_info: Union[Dict[str, Any], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """"行动" 可以是单个 action，也可以是多个 action 组成的列表，统一转换为列表。"""
+        if isinstance(action_info, dict):
+            return [action_info] if action_info else []
+        if isinstance(action_info, list):
+            return [action for action in action_info if isinstance(action, dict)]
+        return []
+
+    async def _handle_response(self, response: Dict[str, Any],
+                               tasks: Optional[List["asyncio.Task"]] = None) -> Tuple[Optional[str], ScratchStep]:
+        """
+        处理模型响应，判断是否为最终答案，返回 (最终答案, 本轮思考记录)。
+        同一轮中的多个工具调用并发执行，观察结果按 action 在响应中的顺序写入思考过程。
+        tasks 为流式解析时已经开始执行的工具任务，与 actions 一一对应。
+        """
         thoughts = response.get("思考", "")
-        action_info = response.get("行动", {})
-        tool_name = action_info.get("name", "")
-        tool_args = action_info.get("args", {})
+        actions = self._parse_actions(response.get("行动", {})) or [{}]
 
-        if tool_name == "Final Answer":
-            final_answer = tool_args.get("answer", "")
-            self.agent_scratch += f"\n思考: {thoughts}\n最终结果: {final_answer}\n"
-            return final_answer
+        for action_info in actions:
+            if action_info.get("name", "") == "Final Answer":
+                final_answer = action_info.get("args", {}).get("answer", "")
+                return final_answer, ScratchStep(thoughts, final_answer=final_answer)
 
-        # 执行工具函数并更新思考过程
-        call_result = self.execute_action(tool_name, tool_args)
-        agent_scratch = f"\n思考: {thoughts}\n行动: {action_info}\n观察: {call_result}\n"
-        self.agent_scratch += agent_scratch
+        # 并发执行工具函数并记录思考过程
+        if tasks is None or len(tasks) != len(actions):
+            for task in tasks or []:
+                task.cancel()
+            tasks = [self.aexecute_action(action_info.get("name", ""), action_info.get("args", {}))
+                     for action_info in actions]
+        call_results = await asyncio.gather(*tasks)
+        step = ScratchStep(thoughts, list(zip(actions, call_results)))
 
-        logging.info(agent_scratch)
-        return None
+        logging.info(step.render())
+        # 缓存命中只写入日志，不进入提示词
+        cache = tool_cache.current.get()
+        for note in cache.drain_notes() if cache else []:
+            logging.info(f"缓存: {note}")
+        return None, step
 
 
 if __name__ == '__main__':
+    from Tools_manager.Rag_tool import RAGService
+    from until.table_data_preprocess import preprocess_table, get_all_file_paths
+
     file_path = 'data'
     des = preprocess_table(file_path)
 
@@ -0,0 +1,31 @@
+import zlib
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class HashEmbeddings(Embeddings):
+    """
+    基准测试用的 embedding 替身：把字符二元组哈希到固定维度并归一化。
+    不需要模型文件，结果确定，相同文本得到相同向量，字面相近的文本向量也相近。
+    构造参数与 HuggingFaceBgeEmbeddings 一致，可以直接传给 RAGService 并由 meta.json 重建。
+    """
+
+    def __init__(self, model_name='hash-256', model_kwargs=None, encode_kwargs=None, dim=256):
+        self.model_name = model_name
+        self.model_kwargs = model_kwargs or {}
+        self.encode_kwargs = encode_kwargs or {}
+        self.dim = dim
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for i in range(max(len(text) - 1, 1)):
+            vector[zlib.crc32(text[i:i + 2].encode('utf-8')) % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
@@ -0,0 +1,93 @@
+"""
+测量启动时的导入耗时：在子进程中运行 python -X importtime，汇总每个模块的累计耗时。
+
+    python benchmarks/import_profile.py
+    python benchmarks/import_profile.py --module agent --module Tools_manager --top 15 --output benchmarks/results/imports.json
+
+除导入外还测量构造 ToolManager 并生成工具描述（AgentExecutor 启动时做的事）的耗时，
+以及此时是否已经加载了 LangChain / FAISS / openai 等重型模块。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['langchain', 'langchain_community', 'faiss', 'torch', 'sentence_transformers', 'openai', 'httpx',
+                 'pandas', 'numpy']
+
+STARTUP_SNIPPET = '''
+import json, sys, time
+start = time.perf_counter()
+from Tools_manager import ToolManager
+tools = ToolManager()
+tools.get_tools()
+tools.get_tool_map()
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds,
+                  "heavy_loaded": sorted(name for name in %r if name in sys.modules)}))
+''' % (HEAVY_MODULES,)
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 的输出，返回 {模块: (自身微秒, 累计微秒)}；同名模块只取第一次。"""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = [part.strip() for part in line[len('import time:'):].split('|')]
+            timings.setdefault(name.strip(), (int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return timings
+
+
+def profile_module(module, top):
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                             cwd=REPO_ROOT, capture_output=True, text=True)
+    timings = parse_importtime(process.stderr)
+    result = {"module": module, "ok": process.returncode == 0}
+    if process.returncode != 0:
+        # 最后一行通常是 ModuleNotFoundError 等，说明缺少哪个依赖
+        errors = [line for line in process.stderr.splitlines() if not line.startswith('import time:')]
+        result["error"] = errors[-1] if errors else f"exit code {process.returncode}"
+    if module in timings:
+        result["cumulative_seconds"] = timings[module][1] / 1e6
+    slowest = sorted(timings.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    result["slowest"] = [{"module": name, "self_seconds": self_us / 1e6, "cumulative_seconds": cumulative_us / 1e6}
+                         for name, (self_us, cumulative_us) in slowest]
+    result["heavy_loaded"] = sorted(name for name in HEAVY_MODULES if name in timings)
+    return result
+
+
+def profile_startup():
+    process = subprocess.run([sys.executable, '-c', STARTUP_SNIPPET], cwd=REPO_ROOT, capture_output=True, text=True)
+    if process.returncode != 0:
+        return {"ok": False, "error": process.stderr.strip().splitlines()[-1]}
+    return dict(json.loads(process.stdout.strip().splitlines()[-1]), ok=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='导入耗时分析')
+    parser.add_argument('--module', action='append', help='要分析的模块，可重复；默认 agent 与 Tools_manager')
+    parser.add_argument('--top', type=int, default=10, help='列出累计耗时最长的前 N 个模块')
+    parser.add_argument('--output', help='结果 JSON 文件')
+    args = parser.parse_args()
+
+    report = {
+        "python": sys.version.split()[0],
+        "imports": [profile_module(module, args.top) for module in args.module or ['agent', 'Tools_manager']],
+        "tool_manager_startup": profile_startup(),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
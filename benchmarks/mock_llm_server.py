@@ -0,0 +1,188 @@
+"""
+本地的 OpenAI 兼容替身服务，用于离线基准测试。
+
+支持：
+    POST /v1/chat/completions   非流式与流式（SSE，含 stream_options.include_usage）
+    POST /llm                   与 Local_service_start 网关相同的请求/响应格式
+    GET  /                      健康检查
+
+响应由脚本决定：按顺序匹配规则，第一条 match 子串出现在请求消息中的规则生效。
+延迟由 latency（首字节前）和 chunk_latency（流式每段之间）控制。
+fail_status 不为空时所有请求（包括健康检查）都返回该状态码，用于模拟故障副本，可在运行中修改。
+
+python -m benchmarks.mock_llm_server --port 8000 --latency 0.2
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_SCRIPT = [
+    {"match": "", "response": "ok"},
+]
+
+
+class MockLLMServer:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, chunk_latency=0.0, chunk_chars=8, script=None,
+                 fail_status=None):
+        self.latency = latency
+        self.fail_status = fail_status
+        self.chunk_latency = chunk_latency
+        self.chunk_chars = chunk_chars
+        self.script = script or DEFAULT_SCRIPT
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def gateway_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/llm"
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def respond(self, text):
+        """按脚本选择响应文本。"""
+        self.count_request()
+        for rule in self.script:
+            if rule["match"] in text:
+                return rule["response"]
+        return ""
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mock-llm', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, data, status=200):
+                body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if server.fail_status:
+                    self._send_json({"status": "error"}, server.fail_status)
+                    return
+                self._send_json({"status": "ok", "requests": server.requests})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                if server.fail_status:
+                    server.count_request()
+                    self._send_json({"success": False, "error": "mock failure"}, server.fail_status)
+                elif self.path.rstrip('/').endswith('/llm'):
+                    self._gateway(payload)
+                elif self.path.rstrip('/').endswith('/chat/completions'):
+                    self._chat_completions(payload)
+                else:
+                    self._send_json({"error": f"unknown path {self.path}"}, 404)
+
+            def _gateway(self, payload):
+                text = server.respond(f"{payload.get('sys_prompt') or ''}\n{payload.get('user_input') or ''}")
+                time.sleep(server.latency)
+                self._send_json({"success": True, "result": text,
+                                 "sys_prompt": payload.get('sys_prompt'), "user_input": payload.get('user_input')})
+
+            def _chat_completions(self, payload):
+                messages = payload.get('messages', [])
+                prompt = '\n'.join(str(message.get('content', '')) for message in messages)
+                text = server.respond(prompt)
+                usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4,
+                         "total_tokens": (len(prompt) + len(text)) // 4}
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                model = payload.get('model', 'mock')
+                time.sleep(server.latency)
+
+                if not payload.get('stream'):
+                    self._send_json({
+                        "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": text}}],
+                        "usage": usage,
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+
+                def chunk(choices, **extra):
+                    return {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                            "model": model, "choices": choices, **extra}
+
+                pieces = [text[i:i + server.chunk_chars] for i in range(0, len(text), server.chunk_chars)]
+                for i, piece in enumerate(pieces):
+                    if i:
+                        time.sleep(server.chunk_latency)
+                    self._write_event(chunk([{"index": 0, "delta": {"content": piece}, "finish_reason": None}]))
+                self._write_event(chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+                if (payload.get('stream_options') or {}).get('include_usage'):
+                    self._write_event(chunk([], usage=usage))
+                self._write_raw(b'data: [DONE]\n\n')
+                self._write_raw(b'')
+
+            def _write_event(self, data):
+                self._write_raw(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8'))
+
+            def _write_raw(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenAI 兼容的本地替身服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='首字节前的延迟（秒）')
+    parser.add_argument('--chunk-latency', type=float, default=0.0, help='流式输出每段之间的延迟（秒）')
+    parser.add_argument('--script', help='响应脚本 JSON 文件：[{"match": "...", "response": "..."}]')
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script, 'r', encoding='utf-8') as f:
+            script = json.load(f)
+    server = MockLLMServer(args.host, args.port, args.latency, args.chunk_latency, script=script)
+    print(f"Mock LLM listening on {server.base_url}")
+    server._server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+回放录制的 agent 执行，对 AgentExecutor 和工具做离线压测。
+
+    # 录制：正常运行 agent，设置 AGENT_RECORD_PATH
+    AGENT_RECORD_PATH=log/agent_record.jsonl python agent.py
+    # 回放：16 并发，每条录制重复 10 遍，按原始耗时等待 LLM
+    python benchmarks/replay_load.py log/agent_record.jsonl --concurrency 16 --repeat 10 --timing original
+
+工具默认真实执行（检索需要录制时的索引位于 cache/index），--recorded-tools 则连工具结果也使用录制内容。
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from agent import AgentExecutor
+from benchmarks.run_benchmarks import percentiles
+from until import replay
+
+
+def main():
+    parser = argparse.ArgumentParser(description='回放录制的 agent 执行')
+    parser.add_argument('trace', help='AGENT_RECORD_PATH 录制的 JSONL 文件')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--timing', choices=['none', 'original'], default='none',
+                        help='original: 按录制的 LLM（和工具）耗时等待')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='等待时间的缩放系数')
+    parser.add_argument('--recorded-tools', action='store_true', help='工具返回录制的结果而不真实执行')
+    parser.add_argument('--no-stream', action='store_true', help='关闭流式解析')
+    parser.add_argument('--output', help='结果 JSON 文件')
+    args = parser.parse_args()
+
+    runs = replay.load_trace(args.trace)
+    if not runs:
+        print(f"{args.trace} 中没有录制的执行")
+        return
+
+    # 回放不访问模型服务，以本地模式构造后替换 LLM，避免需要 API key
+    executor = AgentExecutor(local=True, stream=not args.no_stream, record_path=None)
+    replay.prepare_replay(executor, args.timing, args.time_scale, args.recorded_tools)
+
+    start = time.perf_counter()
+    results = asyncio.run(replay.replay_runs(executor, runs, args.concurrency, args.repeat))
+    elapsed = time.perf_counter() - start
+
+    latencies = [result["latency"] for result in results]
+    summary = {
+        "trace": args.trace,
+        "recorded_runs": len(runs),
+        "replayed_runs": len(results),
+        "concurrency": args.concurrency,
+        "timing": args.timing,
+        "recorded_tools": args.recorded_tools,
+        "seconds": elapsed,
+        "runs_per_second": len(results) / elapsed if elapsed else None,
+        "answered": sum(result["answered"] for result in results),
+        "matches_recording": sum(result["matches_recording"] for result in results),
+        "latency": percentiles(latencies),
+        "recorded_latency": percentiles([run.latency for run in runs if run.latency is not None]),
+    }
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"summary": summary, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
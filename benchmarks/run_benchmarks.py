@@ -0,0 +1,225 @@
+"""
+离线基准测试：不需要网络、模型文件和 data/ 目录。
+
+    python -m benchmarks.run_benchmarks --sizes small medium --output benchmarks/results/latest.json
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/baseline.json
+
+依次测量 preprocess_table（冷/热缓存）、索引构建（全量/无变化的增量）、process_queries（单条延迟与批量吞吐）
+以及端到端 agent_execute（本地替身 LLM），结果写入 JSON，便于在不同提交之间比较。
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import synthetic_data
+from benchmarks.mock_llm_server import MockLLMServer
+
+QUERIES = ['2024年3月北京的食品烟酒价格指数', '上海居住类价格指数的变化趋势', '各地区医疗保健价格指数比较',
+           '交通通信价格指数最高的城市', '教育文化娱乐价格指数同比变化', '衣着价格指数的季节性变化']
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+
+    def at(p):
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    return {"mean": sum(ordered) / len(ordered), "p50": at(0.50), "p95": at(0.95), "max": ordered[-1]}
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def agent_script(queries):
+    """替身 LLM 的响应脚本：第一轮并行检索，拿到观察结果后给出最终答案，其他调用（如 split_query）返回子问题。"""
+    retrieve = {"思考": "检索本地数据", "行动": [{"name": "retriever_tool", "args": {"query": [query]}}
+                                              for query in queries[:3]]}
+    answer = {"思考": "已经得到原始问题的最终答案",
+              "行动": {"name": "Final Answer", "args": {"answer": "<h3 align=\"center\">《基准测试报告》</h3>" + "分析内容。" * 200}}}
+    return [
+        {"match": "行动: {'name': 'retriever_tool'", "response": json.dumps(answer, ensure_ascii=False)},
+        {"match": "以下为你完成本次目标的思考进程", "response": json.dumps(retrieve, ensure_ascii=False)},
+        {"match": "", "response": '\n'.join(queries)},
+    ]
+
+
+def bench_preprocess(data_dir, rows, cache_dir):
+    from until.table_data_preprocess import preprocess_table
+
+    cold, _ = timed(preprocess_table, data_dir, cache_dir)
+    warm, _ = timed(preprocess_table, data_dir, cache_dir)
+    return [
+        {"benchmark": "preprocess_table", "mode": "cold", "rows": rows, "seconds": cold, "rows_per_second": rows / cold},
+        {"benchmark": "preprocess_table", "mode": "warm", "rows": rows, "seconds": warm, "rows_per_second": rows / warm},
+    ]
+
+
+def bench_index(files, rows, index_dir):
+    from Tools_manager.Rag_tool import RAGService
+    from benchmarks.fake_embeddings import HashEmbeddings
+
+    rag = RAGService(model_path='hash-256', embedding_cls=HashEmbeddings, embedding_cache_path=None)
+    full, _ = timed(rag.initialize_vector_store, files, index_dir=index_dir)
+    noop, _ = timed(rag.initialize_vector_store, files, index_dir=index_dir)
+    return [
+        {"benchmark": "index_build", "mode": "full", "rows": rows, "seconds": full, "rows_per_second": rows / full},
+        {"benchmark": "index_build", "mode": "unchanged", "rows": rows, "seconds": noop},
+    ]
+
+
+def bench_queries(index_dir, rows, repeat):
+    from Tools_manager.Rag_tool import SimilaritySearcher
+    from benchmarks.fake_embeddings import HashEmbeddings
+
+    load, searcher = timed(SimilaritySearcher, index_dir, embedding_model=HashEmbeddings())
+    latencies = [timed(searcher.process_queries, [query])[0] for _ in range(repeat) for query in QUERIES]
+    batch, _ = timed(lambda: [searcher.process_queries(QUERIES) for _ in range(repeat)])
+    return [
+        {"benchmark": "searcher_load", "rows": rows, "seconds": load},
+        {"benchmark": "process_queries", "mode": "single", "rows": rows, "queries": len(latencies),
+         "latency": percentiles(latencies), "queries_per_second": len(latencies) / sum(latencies)},
+        {"benchmark": "process_queries", "mode": "batch", "rows": rows, "queries": len(QUERIES) * repeat,
+         "seconds": batch, "queries_per_second": len(QUERIES) * repeat / batch},
+    ]
+
+
+def bench_agent(files, table_des, rows, runs, llm_latency, chunk_latency):
+    """在当前工作目录的默认索引目录构建索引，通过替身 LLM 端到端执行 agent。"""
+    with MockLLMServer(latency=llm_latency, chunk_latency=chunk_latency, script=agent_script(QUERIES)) as server:
+        from Model_manager.API_service import CustomLLM
+        from Tools_manager.Rag_tool import RAGService, searcher_registry
+        from agent import AgentExecutor
+        from benchmarks.fake_embeddings import HashEmbeddings
+
+        RAGService(model_path='hash-256', embedding_cls=HashEmbeddings,
+                   embedding_cache_path=None).initialize_vector_store(files)
+        searcher_registry.invalidate()
+
+        # 显式传入指向替身服务的客户端，不读取 QWEN_API_KEY 等环境变量，也不录制
+        agent = AgentExecutor(llm=CustomLLM(api_key='benchmark', base_url=server.base_url), record_path=None)
+        latencies, first_actions, first_tokens = [], [], []
+        for _ in range(runs):
+            seconds, answer = timed(agent.agent_execute, '帮我写一份居民消费价格分析报告', table_des=table_des)
+            if not answer:
+                raise RuntimeError("agent_execute 未得到最终答案")
+            latencies.append(seconds)
+            first_actions.append(agent.last_run_stats.get("time_to_first_action", 0.0))
+            first_tokens.append(agent.last_run_stats.get("time_to_first_answer_token", 0.0))
+
+        return [{"benchmark": "agent_execute", "rows": rows, "runs": runs, "llm_latency": llm_latency,
+                 "llm_requests": server.requests, "latency": percentiles(latencies),
+                 "time_to_first_action": percentiles(first_actions),
+                 "time_to_first_answer_token": percentiles(first_tokens)}]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline_path):
+    """按 (benchmark, mode, rows) 对比耗时，打印相对变化。"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    def key(result):
+        return result["benchmark"], result.get("mode"), result.get("rows")
+
+    def seconds(result):
+        return result.get("seconds", result.get("latency", {}).get("p50"))
+
+    previous = {key(result): result for result in baseline["results"]}
+    for result in current["results"]:
+        old = previous.get(key(result))
+        if old is None or not seconds(old) or seconds(result) is None:
+            continue
+        change = seconds(result) / seconds(old) - 1
+        print(f"{'/'.join(str(part) for part in key(result) if part is not None):40s} "
+              f"{seconds(old):9.4f}s -> {seconds(result):9.4f}s ({change:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线基准测试')
+    parser.add_argument('--sizes', nargs='+', default=['small', 'medium'], choices=list(synthetic_data.SIZES))
+    parser.add_argument('--repeat', type=int, default=5, help='process_queries 的重复次数')
+    parser.add_argument('--agent-runs', type=int, default=3)
+    parser.add_argument('--llm-latency', type=float, default=0.05, help='替身 LLM 首字节前的延迟（秒）')
+    parser.add_argument('--chunk-latency', type=float, default=0.002, help='替身 LLM 流式输出每段之间的延迟（秒）')
+    parser.add_argument('--skip-agent', action='store_true')
+    parser.add_argument('--output', default=os.path.join(REPO_ROOT, 'benchmarks', 'results', 'latest.json'))
+    parser.add_argument('--compare', help='与之前的结果文件对比')
+    parser.add_argument('--keep-workspace', action='store_true')
+    args = parser.parse_args()
+
+    workspace = tempfile.mkdtemp(prefix='table-agent-bench-')
+    shutil.copytree(os.path.join(REPO_ROOT, 'Prompt'), os.path.join(workspace, 'Prompt'))
+    os.chdir(workspace)
+    print(f"workspace: {workspace}")
+
+    results = []
+    try:
+        for size in args.sizes:
+            rows = synthetic_data.SIZES[size]
+            data_dir = os.path.join(workspace, f'data_{size}')
+            synthetic_data.generate(data_dir, size)
+            results += bench_preprocess(data_dir, rows, os.path.join(workspace, f'preprocess_{size}'))
+
+            from until.table_data_preprocess import get_all_file_paths
+            files = [path for path in get_all_file_paths(data_dir) if path.endswith('.csv')]
+            index_dir = os.path.join(workspace, f'index_{size}')
+            results += bench_index(files, rows, index_dir)
+            results += bench_queries(index_dir, rows, args.repeat)
+            for result in results[-7:]:
+                print(json.dumps(result, ensure_ascii=False))
+
+        if not args.skip_agent:
+            size = args.sizes[0]
+            data_dir = os.path.join(workspace, f'data_{size}')
+            from until.table_data_preprocess import get_all_file_paths, preprocess_table
+            table_des = preprocess_table(data_dir, os.path.join(workspace, f'preprocess_{size}'))
+            files = [path for path in get_all_file_paths(data_dir) if path.endswith('.csv')]
+            results += bench_agent(files, table_des, synthetic_data.SIZES[size],
+                                   args.agent_runs, args.llm_latency, args.chunk_latency)
+            print(json.dumps(results[-1], ensure_ascii=False))
+    finally:
+        os.chdir(REPO_ROOT)
+        if not args.keep_workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
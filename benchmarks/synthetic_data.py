@@ -0,0 +1,64 @@
+"""
+生成与 data/ 中统计表结构相同的合成数据：两行表头（第二行为合并单元格下的子指标），
+前两列为时间和地区，其余为数值指标。
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+SIZES = {
+    "small": 1_000,
+    "medium": 20_000,
+    "large": 100_000,
+}
+
+REGIONS = ['北京', '天津', '石家庄', '太原', '呼和浩特', '沈阳', '大连', '长春', '哈尔滨', '上海', '南京', '杭州',
+           '宁波', '合肥', '福州', '厦门', '南昌', '济南', '青岛', '郑州', '武汉', '长沙', '广州', '深圳',
+           '南宁', '海口', '重庆', '成都', '贵阳', '昆明', '拉萨', '西安', '兰州', '西宁', '银川', '乌鲁木齐']
+INDICATORS = ['食品烟酒', '衣着', '居住', '生活用品及服务', '交通通信', '教育文化娱乐', '医疗保健', '其他用品及服务']
+
+
+def synthetic_frame(rows, seed=0):
+    """rows 行数据：时间、地区与各项指标。"""
+    rng = np.random.default_rng(seed)
+    months = pd.period_range('2000-01', periods=max(1, rows // len(REGIONS) + 1), freq='M')
+    index = np.arange(rows)
+    data = {
+        '时间': [f"{months[i // len(REGIONS)].year}年{months[i // len(REGIONS)].month}月" for i in index],
+        '地区': [REGIONS[i % len(REGIONS)] for i in index],
+    }
+    for indicator in INDICATORS:
+        data[indicator] = np.round(rng.normal(101, 1.5, rows), 1)
+    return pd.DataFrame(data)
+
+
+def write_xlsx(path, rows, seed=0):
+    """写入带两行表头的工作簿，对应 preprocess_table 需要合并的多行表头。"""
+    frame = synthetic_frame(rows, seed)
+    header = [['时间', '地区', '居民消费价格分类指数'] + [None] * (len(INDICATORS) - 1),
+              [None, None] + INDICATORS]
+    body = frame.astype(object).values.tolist()
+    pd.DataFrame(header + body).to_excel(path, header=False, index=False)
+    return path
+
+
+def write_csv(path, rows, seed=0):
+    """写入已经展平表头的 csv，与 preprocess_table 的输出格式一致。"""
+    frame = synthetic_frame(rows, seed)
+    frame.insert(0, '时间-地区', frame.pop('时间') + '-' + frame.pop('地区'))
+    frame.columns = [frame.columns[0]] + [f'居民消费价格分类指数-{name}' for name in INDICATORS]
+    frame.to_csv(path, index=False)
+    return path
+
+
+def generate(directory, size, formats=('xlsx', 'csv')):
+    """在 directory 下生成 size（SIZES 中的名称或行数）对应的数据文件，返回文件路径列表。"""
+    rows = SIZES.get(size, size) if isinstance(size, str) else size
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    if 'xlsx' in formats:
+        paths.append(write_xlsx(os.path.join(directory, f'synthetic_{rows}_sheet.xlsx'), rows, seed=1))
+    if 'csv' in formats:
+        paths.append(write_csv(os.path.join(directory, f'synthetic_{rows}_table.csv'), rows, seed=2))
+    return paths
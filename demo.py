@@ -5,6 +5,7 @@ import pandas as pd
 import streamlit as st
 
 from agent import AgentExecutor
+from until.action_stream import ANSWER_RESET
 from Tools_manager.Rag_tool import RAGService
 from until.table_data_preprocess import preprocess_table, get_all_file_paths
 
@@ -138,7 +139,9 @@ if __name__ == '__main__':
 
             file_list = get_all_file_paths(save_directory)
             if st.button('载入本地知识库'):
-                st.session_state.embed.initialize_vector_store(file_list)
+                report = st.session_state.embed.initialize_vector_store(file_list)
+                st.caption(f"知识库更新：新增 {len(report['added'])}，修改 {len(report['modified'])}，"
+                           f"删除 {len(report['removed'])}，未变化 {len(report['unchanged'])}")
 
                 st.session_state.table_des = preprocess_table(save_directory)
 
@@ -149,7 +152,14 @@ if __name__ == '__main__':
         submit_button = st.form_submit_button(label="🔍 提交查询", use_container_width=True)
 
     if submit_button and user_input:
-        output = st.session_state.model.agent_execute(user_input, st.session_state.table_des)
+        # 最终答案逐段渲染，完成后再写入对话记录
+        placeholder = st.empty()
+        output = ''
+        for chunk in st.session_state.model.agent_execute_stream(user_input, st.session_state.table_des):
+            # 模型响应解析失败时已经显示的部分答案作废，下一轮重新输出
+            output = '' if chunk is ANSWER_RESET else output + chunk
+            placeholder.markdown(output + '▌', unsafe_allow_html=True)
+        placeholder.empty()
 
         st.session_state.messages.append({"role": "user", "content": user_input.strip()})
         st.session_state.messages.append({"role": "assistant", "content": output})
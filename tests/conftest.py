@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+@pytest.fixture
+def repo_root(monkeypatch):
+    """AgentExecutor 按相对路径读取 Prompt/ 与写入 log/，在仓库根目录下运行。"""
+    monkeypatch.chdir(REPO_ROOT)
+    return REPO_ROOT
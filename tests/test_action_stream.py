@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from until.action_stream import ANSWER_RESET, ActionStreamParser
+
+ANSWER = '第一段\n"引号"\\路径 中文'
+RESPONSE = json.dumps({"思考": "已经得到答案", "行动": {"name": "Final Answer", "args": {"answer": ANSWER}}},
+                      ensure_ascii=False)
+TOOL_RESPONSE = json.dumps({"思考": "检索", "行动": [{"name": "retriever_tool", "args": {"query": ["a"]}},
+                                                 {"name": "add", "args": {"num_list": [1, 2]}}]},
+                           ensure_ascii=False)
+
+
+def feed_all(parser, chunks):
+    events = []
+    for chunk in chunks:
+        events += parser.feed(chunk)
+    return events
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, len(RESPONSE)])
+def test_answer_deltas_join_to_answer(size):
+    parser = ActionStreamParser()
+    events = feed_all(parser, [RESPONSE[i:i + size] for i in range(0, len(RESPONSE), size)])
+    assert ''.join(value for event, value in events if event == "answer") == ANSWER
+    assert parser.answer_streamed
+    assert parser.result()["行动"]["args"]["answer"] == ANSWER
+
+
+def test_answer_split_inside_escape_sequence():
+    text = json.dumps({"行动": {"name": "Final Answer", "args": {"answer": "aéb\\c"}}}, ensure_ascii=True)
+    cut = text.index('\\u') + 3
+    parser = ActionStreamParser()
+    events = parser.feed(text[:cut]) + parser.feed(text[cut:])
+    assert ''.join(value for event, value in events if event == "answer") == "aéb\\c"
+
+
+@pytest.mark.parametrize("size", [1, 5, len(TOOL_RESPONSE)])
+def test_action_emitted_once_when_complete(size):
+    parser = ActionStreamParser()
+    events = feed_all(parser, [TOOL_RESPONSE[i:i + size] for i in range(0, len(TOOL_RESPONSE), size)])
+    actions = [value for event, value in events if event == "action"]
+    assert actions == [json.loads(TOOL_RESPONSE)["行动"]]
+    assert not parser.answer_streamed
+
+
+def test_action_before_end_of_stream():
+    parser = ActionStreamParser()
+    head, tail = TOOL_RESPONSE[:-1], TOOL_RESPONSE[-1:]
+    assert [event for event, _ in parser.feed(head)] == ["action"]
+    assert parser.feed(tail) == []
+
+
+def test_answer_not_streamed_for_other_tools():
+    text = json.dumps({"行动": {"name": "split_query", "args": {"answer": "不是最终答案"}}}, ensure_ascii=False)
+    events = ActionStreamParser().feed(text)
+    assert [event for event, _ in events] == ["action"]
+
+
+def test_truncated_stream_fails_to_parse():
+    parser = ActionStreamParser()
+    events = parser.feed(RESPONSE[:RESPONSE.index(ANSWER[:3]) + 2])
+    assert parser.answer_streamed and all(event == "answer" for event, _ in events)
+    with pytest.raises(json.JSONDecodeError):
+        parser.result()
+
+
+def test_invalid_action_is_not_emitted():
+    parser = ActionStreamParser()
+    assert parser.feed('{"思考": "x", "行动": {"name": "add", "args": {"num_list": [1, 2}}}') == []
+    assert parser.action is None
+
+
+class ScriptedLLM:
+    """按顺序返回预先设定的流式响应，每个响应是若干文本片段。"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+
+    async def achat_stream(self, sys_prompt='', user_prompt='', **options):
+        for chunk in self.responses.pop(0):
+            yield chunk
+
+
+def chunks_of(text, size=4):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_discarded_round_resets_streamed_answer(repo_root):
+    from agent import AgentExecutor
+
+    truncated = chunks_of(RESPONSE[:RESPONSE.index(ANSWER[:3]) + 2])
+    invalid = chunks_of(RESPONSE + '多余的文本')
+    llm = ScriptedLLM([truncated, invalid, chunks_of(RESPONSE)])
+    executor = AgentExecutor(llm=llm, record_path=None)
+
+    chunks = list(executor.agent_execute_stream('问题'))
+    assert chunks.count(ANSWER_RESET) == 2
+    last_reset = len(chunks) - 1 - chunks[::-1].index(ANSWER_RESET)
+    assert ''.join(chunks[last_reset + 1:]) == ANSWER
+    assert ANSWER_RESET not in chunks[last_reset + 1:]
+
+
+def test_stream_without_failures_has_no_reset(repo_root):
+    from agent import AgentExecutor
+
+    executor = AgentExecutor(llm=ScriptedLLM([chunks_of(RESPONSE)]), record_path=None)
+    chunks = list(executor.agent_execute_stream('问题'))
+    assert ''.join(chunks) == ANSWER
@@ -0,0 +1,55 @@
+import json
+import threading
+
+import pytest
+
+from Tools_manager.tool_manager import ToolPolicy
+
+
+def response(thought, actions):
+    return json.dumps({"思考": thought, "行动": actions}, ensure_ascii=False)
+
+
+FINAL = response("完成", {"name": "Final Answer", "args": {"answer": "好"}})
+
+
+class ScriptedLLM:
+    """按顺序返回预先设定的响应，流式时整段作为一个片段。"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+
+    async def achat(self, sys_prompt='', user_prompt='', **options):
+        return self.responses.pop(0)
+
+    async def achat_stream(self, sys_prompt='', user_prompt='', **options):
+        yield self.responses.pop(0)
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_actions_in_one_turn_run_concurrently_and_keep_order(repo_root, stream):
+    from agent import AgentExecutor
+
+    # 两个工具都要等对方开始后才能返回，依次执行时栅栏会超时
+    barrier = threading.Barrier(2, timeout=5)
+
+    def wait_and_return(value):
+        barrier.wait()
+        return value
+
+    def first(value: str) -> str:
+        return wait_and_return(f"first:{value}")
+
+    def second(value: str) -> str:
+        return wait_and_return(f"second:{value}")
+
+    actions = [{"name": "second", "args": {"value": "b"}}, {"name": "first", "args": {"value": "a"}}]
+    llm = ScriptedLLM([response("并发调用", actions), FINAL])
+    executor = AgentExecutor(llm=llm, stream=stream, record_path=None)
+    executor.tools_map = {"first": first, "second": second}
+    executor.tool_policies = {name: ToolPolicy('thread', timeout=10) for name in executor.tools_map}
+
+    assert executor.agent_execute('问题') == "好"
+    scratch = executor.agent_scratch
+    assert scratch.index("观察: second:b") < scratch.index("观察: first:a")
+    assert "BrokenBarrierError" not in scratch
@@ -0,0 +1,116 @@
+import pytest
+
+gevent = pytest.importorskip("gevent")
+
+from gevent.event import Event
+
+from Model_manager.gateway import GatewayRejected, InferenceGateway, parse_timeout, prometheus_text
+
+
+class BlockingLLM:
+    """chat 在 release 之前一直挂起，记录每次上游调用；返回 {} 模拟 CustomLLM 出错。"""
+
+    def __init__(self, output=None):
+        self.calls = []
+        self.release = Event()
+        self.output = output
+
+    def chat(self, sys_prompt, user_input):
+        self.calls.append((sys_prompt, user_input))
+        self.release.wait()
+        return f"答:{user_input}" if self.output is None else self.output
+
+
+def submit(gateway, user_input, timeout=None):
+    return gevent.spawn(gateway.submit, "sys", user_input, timeout)
+
+
+def rejected_status(greenlet):
+    assert isinstance(greenlet.exception, GatewayRejected)
+    return greenlet.exception.status
+
+
+@pytest.mark.parametrize("value, expected", [(None, None), (2, 2.0), ("0.5", 0.5)])
+def test_parse_timeout_accepts_positive_seconds(value, expected):
+    assert parse_timeout(value) == expected
+
+
+@pytest.mark.parametrize("value", ["abc", [1], {}, True, 0, -1, "nan", float("inf")])
+def test_parse_timeout_rejects_bad_values_with_400(value):
+    with pytest.raises(GatewayRejected) as e:
+        parse_timeout(value)
+    assert e.value.status == 400
+
+
+def test_identical_in_flight_requests_share_one_upstream_call():
+    llm = BlockingLLM()
+    gateway = InferenceGateway(llm, max_in_flight=2, batch_size=1)
+    first, second = submit(gateway, "q"), submit(gateway, "q")
+    gevent.sleep(0.01)
+    llm.release.set()
+    gevent.joinall([first, second], timeout=2)
+
+    assert first.value == second.value == "答:q"
+    assert llm.calls == [("sys", "q")]
+    metrics = gateway.metrics()
+    assert (metrics["requests"], metrics["deduplicated"], metrics["completed"]) == (2, 1, 1)
+
+
+def test_full_queue_is_rejected_with_429():
+    llm = BlockingLLM()
+    gateway = InferenceGateway(llm, max_in_flight=1, max_queue=1, batch_size=1)
+    running = submit(gateway, "a")
+    gevent.sleep(0.01)
+    queued = submit(gateway, "b")
+    gevent.sleep(0.01)
+    with pytest.raises(GatewayRejected) as e:
+        gateway.submit("sys", "c")
+    assert e.value.status == 429
+    assert gateway.metrics()["rejected_queue_full"] == 1
+
+    llm.release.set()
+    gevent.joinall([running, queued], timeout=2)
+    assert (running.value, queued.value) == ("答:a", "答:b")
+
+
+def test_deadline_returns_504_while_workers_are_busy():
+    llm = BlockingLLM()
+    gateway = InferenceGateway(llm, max_in_flight=1, batch_size=1)
+    running = submit(gateway, "slow")
+    gevent.sleep(0.01)
+    waiting = submit(gateway, "late", timeout=0.05)
+    gevent.joinall([waiting], timeout=1)
+    # 等待方到截止时间就返回 504，不必等唯一的 worker 空闲
+    assert waiting.ready() and rejected_status(waiting) == 504
+    assert gateway.metrics()["rejected_deadline"] == 1
+
+    llm.release.set()
+    gevent.joinall([running], timeout=2)
+    gevent.sleep(0.01)
+    # 超时的请求出队后不再调用上游
+    assert llm.calls == [("sys", "slow")]
+    assert gateway.metrics()["rejected_deadline"] == 1
+
+
+def test_empty_upstream_result_counts_as_error():
+    llm = BlockingLLM(output={})
+    llm.release.set()
+    gateway = InferenceGateway(llm, batch_size=1)
+    with pytest.raises(GatewayRejected) as e:
+        gateway.submit("sys", "q")
+    assert e.value.status == 502
+    metrics = gateway.metrics()
+    assert (metrics["errors"], metrics["completed"]) == (1, 0)
+
+
+def test_prometheus_text_exposes_gateway_metrics():
+    llm = BlockingLLM()
+    llm.release.set()
+    gateway = InferenceGateway(llm, batch_size=1)
+    gateway.submit("sys", "q")
+    text = prometheus_text(gateway.metrics())
+    assert "llm_gateway_queue_depth 0" in text
+    assert "llm_gateway_in_flight 0" in text
+    assert 'llm_gateway_latency_seconds{quantile="0.99"}' in text
+    assert "llm_gateway_completed_total 1" in text
+    assert "# TYPE llm_gateway_rejected_deadline_total counter" in text
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from Model_manager.load_balancer import EndpointBalancer, http_probe
+from benchmarks.mock_llm_server import MockLLMServer
+
+URLS = ["http://a:1220/llm", "http://b:1220/llm"]
+
+
+class Probe:
+    """按副本返回预设的健康状态，记录探测过的副本。"""
+
+    def __init__(self, healthy):
+        self.healthy = dict(healthy)
+        self.calls = []
+
+    def __call__(self, url):
+        self.calls.append(url)
+        if self.healthy[url] is None:
+            raise ConnectionError(url)
+        return self.healthy[url]
+
+
+def make_balancer(probe, eject_seconds=30):
+    # health_interval=0 不启动后台线程，由测试直接调用 check_health
+    return EndpointBalancer(URLS, probe=probe, health_interval=0, eject_seconds=eject_seconds)
+
+
+def test_failed_endpoint_is_ejected():
+    balancer = make_balancer(Probe({URLS[0]: True, URLS[1]: True}))
+    a, b = balancer.endpoints
+    balancer.mark_failure(a)
+    for _ in range(10):
+        with balancer.lease() as endpoint:
+            assert endpoint is b
+    assert [e["healthy"] for e in balancer.snapshot()] == [False, True]
+
+
+def test_probe_recovers_ejected_endpoint():
+    probe = Probe({URLS[0]: True, URLS[1]: True})
+    balancer = make_balancer(probe)
+    a, _ = balancer.endpoints
+    balancer.mark_failure(a)
+
+    balancer.check_health()
+    assert probe.calls == URLS
+    assert (a.failures, a.healthy(0)) == (0, True)
+    chosen = set()
+    for _ in range(20):
+        with balancer.lease() as endpoint:
+            chosen.add(endpoint.url)
+    assert chosen == set(URLS)
+
+
+def test_probe_ejects_unhealthy_and_erroring_endpoints():
+    balancer = make_balancer(Probe({URLS[0]: False, URLS[1]: None}))
+    balancer.check_health()
+    assert [e["healthy"] for e in balancer.snapshot()] == [False, False]
+    # 连续探测失败不会延长剔除时间
+    until = [e.ejected_until for e in balancer.endpoints]
+    balancer.check_health()
+    assert [e.ejected_until for e in balancer.endpoints] == until
+
+
+def test_all_ejected_falls_back_to_least_outstanding():
+    balancer = make_balancer(Probe({URLS[0]: True, URLS[1]: True}))
+    a, b = balancer.endpoints
+    balancer.mark_failure(a)
+    balancer.mark_failure(b)
+    with balancer.lease() as first:
+        with balancer.lease() as second:
+            assert {first, second} == {a, b}
+    assert (a.outstanding, b.outstanding) == (0, 0)
+
+
+def test_exclude_skips_endpoint_already_tried():
+    balancer = make_balancer(Probe({URLS[0]: True, URLS[1]: True}))
+    a, b = balancer.endpoints
+    for _ in range(10):
+        with balancer.lease(exclude={a.url}) as endpoint:
+            assert endpoint is b
+
+
+@pytest.fixture
+def replicas():
+    """两个本地替身副本，第一个返回 503（健康检查同样失败）。"""
+    with MockLLMServer(fail_status=503) as failing, MockLLMServer() as healthy:
+        yield failing, healthy
+
+
+def test_local_llm_moves_to_healthy_replica_and_ejects_failing_one(replicas):
+    from Model_manager.Local_service import LocalLLM
+
+    failing, healthy = replicas
+    balancer = EndpointBalancer([failing.gateway_url, healthy.gateway_url], probe=http_probe, health_interval=0)
+    llm = LocalLLM([failing.gateway_url, healthy.gateway_url], cache=None, balancer=balancer)
+
+    # 副本随机选择，30 次中几乎必然有请求先落到故障副本上
+    for _ in range(30):
+        assert llm.chat('sys', '问题') == 'ok'
+    assert asyncio.run(llm.achat('sys', '问题')) == 'ok'
+
+    # 第一次失败后即被剔除，之后的请求（包括失败后的重试）都发往健康副本
+    assert failing.requests == 1
+    assert healthy.requests == 31
+    bad, good = balancer.snapshot()
+    assert (bad["healthy"], bad["failures"]) == (False, 1)
+    assert good["healthy"] and good["outstanding"] == 0
+
+    # 故障副本恢复后，健康检查把它重新加入
+    failing.fail_status = None
+    balancer.check_health()
+    assert all(endpoint["healthy"] for endpoint in balancer.snapshot())
+    for _ in range(20):
+        assert llm.chat('sys', '问题') == 'ok'
+    assert failing.requests > 1
+
+
+def test_health_check_ejects_replica_before_any_request(replicas):
+    failing, healthy = replicas
+    balancer = EndpointBalancer([failing.gateway_url, healthy.gateway_url], probe=http_probe, health_interval=0)
+    balancer.check_health()
+    assert [endpoint["healthy"] for endpoint in balancer.snapshot()] == [False, True]
+    for _ in range(10):
+        with balancer.lease() as endpoint:
+            assert endpoint.url == healthy.gateway_url
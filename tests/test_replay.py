@@ -0,0 +1,96 @@
+import asyncio
+import contextvars
+import json
+import threading
+import types
+
+import pytest
+
+from until import replay
+
+
+class EchoLLM:
+    def chat(self, sys_prompt='', user_prompt='', **options):
+        return f"echo:{user_prompt}"
+
+
+@pytest.fixture
+def tool_module(monkeypatch):
+    """一个内部调用 LLM 的工具模块，结构与 Tools_manager.split_query 相同。"""
+    module = types.ModuleType('fake_llm_tool')
+    base = EchoLLM()
+    module._get_llm = lambda: base
+    module.base = base
+    monkeypatch.setitem(__import__('sys').modules, 'fake_llm_tool', module)
+    monkeypatch.setattr(replay, 'TOOL_LLM_MODULES', [('fake_llm_tool', '_get_llm')])
+    return module
+
+
+def llm_events(path):
+    if not path.exists():
+        return []
+    return [event for event in map(json.loads, path.read_text(encoding='utf-8').splitlines())
+            if event["type"] == "llm"]
+
+
+def test_tool_llm_recorded_only_by_current_run(tool_module, tmp_path):
+    replay.install_tool_llm_dispatch()
+    replay.install_tool_llm_dispatch()
+    first = replay.TraceRecorder(str(tmp_path / 'first.jsonl'))
+    second = replay.TraceRecorder(str(tmp_path / 'second.jsonl'))
+
+    run = second.start_run('问题', '', 1)
+    llm = tool_module._get_llm()
+    assert isinstance(llm, replay.RecordingLLM) and llm.llm is tool_module.base
+    assert llm.chat('s', 'u') == 'echo:u'
+    second.end_run(run, '答案')
+
+    assert llm_events(tmp_path / 'first.jsonl') == []
+    assert len(llm_events(tmp_path / 'second.jsonl')) == 1
+    # 执行结束后恢复原客户端
+    assert tool_module._get_llm() is tool_module.base
+
+
+def test_dispatch_is_transparent_outside_runs(tool_module):
+    replay.install_tool_llm_dispatch()
+    assert tool_module._get_llm() is tool_module.base
+
+
+def test_concurrent_tool_calls_replay_by_args(tool_module, tmp_path):
+    """q1 先开始、后完成：回放时按 q1、q2 的顺序调用，各自取回自己的工具结果和工具内部的 LLM 响应。"""
+    replay.install_tool_llm_dispatch()
+    q2_done = threading.Event()
+
+    def lookup(query):
+        if query == 'q1':
+            assert q2_done.wait(5)
+        answer = tool_module._get_llm().chat('s', query)
+        if query == 'q2':
+            q2_done.set()
+        return f"result:{answer}"
+
+    path = tmp_path / 'record.jsonl'
+    recorder = replay.TraceRecorder(str(path))
+    recorded = replay.recording_tools({"lookup": lookup}, recorder)
+
+    async def record():
+        run = recorder.start_run('问题', '', 1)
+        try:
+            return await asyncio.gather(asyncio.to_thread(recorded["lookup"], query='q1'),
+                                        asyncio.to_thread(recorded["lookup"], query='q2'))
+        finally:
+            recorder.end_run(run, '答案')
+
+    assert asyncio.run(record()) == ["result:echo:q1", "result:echo:q2"]
+    [run] = replay.load_trace(str(path))
+
+    def replay_in_start_order(tools):
+        replay._cursor.set(replay.ReplayCursor(run))
+        replay._tool_llm.set(lambda _: replay.ReplayLLM())
+        return [tools["lookup"](query='q1'), tools["lookup"](query='q2')]
+
+    expected = ["result:echo:q1", "result:echo:q2"]
+    assert contextvars.copy_context().run(replay_in_start_order, replay.replay_tools({"lookup": lookup})) == expected
+    # 真实执行工具时，工具内部的 LLM 响应按所属的工具调用取回
+    live = replay.source_tracking_tools({"lookup": lookup})
+    assert contextvars.copy_context().run(replay_in_start_order, live) == expected
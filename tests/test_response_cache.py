@@ -0,0 +1,52 @@
+import json
+
+from Model_manager.response_cache import ResponseCache
+
+ANSWER = {"思考": "完成", "行动": {"name": "Final Answer", "args": {"answer": "报告"}}}
+
+
+class CachingLLM:
+    """按 CustomLLM 的缓存约定工作的替身：use_cache=False 不读写缓存，validate 不通过的响应不写入缓存。"""
+
+    def __init__(self, cache, responses):
+        self.cache = cache
+        self.responses = list(responses)
+        self.calls = []
+
+    async def achat_stream(self, sys_prompt='', user_prompt='', validate=None, use_cache=True):
+        self.calls.append(use_cache)
+        key = self.cache.make_key('fake', 0.2, [{"role": "system", "content": sys_prompt},
+                                                {"role": "user", "content": user_prompt}])
+        cached = self.cache.get(key) if use_cache else None
+        if cached is not None:
+            yield cached
+            return
+        response = self.responses.pop(0)
+        if use_cache and response and (validate is None or validate(response)):
+            self.cache.set(key, response)
+        yield response
+
+
+def test_invalid_response_is_not_cached_and_retry_bypasses_cache(repo_root, tmp_path):
+    from agent import AgentExecutor
+
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite'))
+    llm = CachingLLM(cache, ['{"思考": "截断', json.dumps(ANSWER, ensure_ascii=False)])
+    executor = AgentExecutor(llm=llm, record_path=None)
+
+    assert executor.agent_execute('问题') == "报告"
+    # 第一轮响应无效且未写入缓存，第二轮以相同提示词重试时绕过缓存
+    assert llm.calls == [True, False]
+    assert cache.stats()["entries"] == 0
+
+
+def test_valid_response_is_cached(repo_root, tmp_path):
+    from agent import AgentExecutor
+
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite'))
+    first = CachingLLM(cache, [json.dumps(ANSWER, ensure_ascii=False)])
+    assert AgentExecutor(llm=first, record_path=None).agent_execute('问题') == "报告"
+
+    second = CachingLLM(cache, [])
+    assert AgentExecutor(llm=second, record_path=None).agent_execute('问题') == "报告"
+    assert second.calls == [True]
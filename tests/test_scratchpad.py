@@ -0,0 +1,32 @@
+from Memory_manger.scratchpad import Scratchpad, ScratchStep
+
+
+def make_step(i):
+    return ScratchStep(f"第{i}轮", [(f"retriever_tool({{'query': ['q{i}']}})", "观察" * 100)])
+
+
+def test_prefix_is_stable_until_compaction():
+    pad = Scratchpad(token_budget=100000)
+    previous = ''
+    for i in range(5):
+        pad.add(make_step(i))
+        assert pad.render().startswith(previous)
+        previous = pad.render()
+
+
+def test_each_step_is_rewritten_at_most_twice():
+    pad = Scratchpad(token_budget=1000, keep_recent=2, observation_tokens=50, block_steps=1)
+    rewrites = {}
+    previous = []
+    for i in range(8):
+        pad.add(make_step(i))
+        texts = [entry[0] for entry in pad._entries]
+        for index, text in enumerate(previous):
+            if texts[index] != text:
+                rewrites[index] = rewrites.get(index, 0) + 1
+        previous = texts
+
+    assert rewrites and max(rewrites.values()) <= 2
+    assert pad.tokens() <= pad.token_budget
+    # 最近的轮次保持原样
+    assert pad.render().endswith(make_step(7).render())
@@ -0,0 +1,30 @@
+from Tools_manager.shard_merge import merge_top_k
+
+
+class Doc:
+    def __init__(self, page_content):
+        self.page_content = page_content
+
+
+def shard(*rows):
+    """一个分片对各 query 的结果，row 为 [(文本, 得分)]。"""
+    return [[(Doc(text), score) for text, score in row] for row in rows]
+
+
+def test_keeps_global_top_k_across_shards():
+    shard_hits = [
+        shard([("a1", 0.9), ("a2", 0.5)], [("x1", 0.2)]),
+        shard([("b1", 0.8), ("b2", 0.7)], []),
+        shard([("c1", 0.95)], [("y1", 0.6), ("y2", 0.1)]),
+    ]
+    assert merge_top_k(shard_hits, 2, 3) == [["c1", "a1", "b1"], ["y1", "x1", "y2"]]
+
+
+def test_ties_keep_shard_order_and_newlines_are_flattened():
+    shard_hits = [shard([("first\nline", 0.5)]), shard([("second", 0.5), ("third", 0.5)])]
+    assert merge_top_k(shard_hits, 1, 2) == [["first, line", "second"]]
+
+
+def test_fewer_hits_than_k_and_empty_shards():
+    assert merge_top_k(iter([shard([]), shard([("only", 0.3)])]), 1, 5) == [["only"]]
+    assert merge_top_k([], 2, 3) == [[], []]
@@ -0,0 +1,120 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+
+from until.table_data_preprocess import get_row_data_types, structure_headers
+
+
+def baseline_structure_headers(df, start_row=1, start_col=1):
+    """
+    向量化之前的逐行实现（原样保留，只修正左侧继承时递减错变量的问题：
+    原实现递减 ix_col，左侧相邻单元格也为空时无法终止）。
+    """
+    start_row -= 1
+    start_col -= 1
+
+    header_end_row = None
+
+    for row_number in range(start_row, len(df) - 1):
+        current_row_types = get_row_data_types(df, row_number, start_col)
+        next_row_types = get_row_data_types(df, row_number + 1, start_col)
+        if current_row_types and next_row_types and current_row_types == next_row_types:
+            header_end_row = max(row_number - 1, 0)
+            break
+
+    if header_end_row is None:
+        header_end_row = row_number
+
+    column_headers = [df.iloc[list(range(header_end_row + 1)), i].tolist() for i in range(len(df.columns))]
+    new_column_headers = []
+    for ix_col, col_header in enumerate(column_headers):
+        new_col_header = []
+        cur_cell = ''
+        for ix_row, cell in enumerate(col_header):
+            if pd.isna(cell) or cell.strip() == '':
+                if cur_cell != '':
+                    col_header[ix_row] = cur_cell
+                else:
+                    ix_col_tmp = ix_col - 1
+                    while ix_col_tmp >= 0:
+                        if pd.isna(column_headers[ix_col_tmp][ix_row]) or column_headers[ix_col_tmp][
+                            ix_row].strip() == '':
+                            ix_col_tmp -= 1
+                        else:
+                            col_header[ix_row] = column_headers[ix_col_tmp][ix_row]
+                            new_col_header.append(column_headers[ix_col_tmp][ix_row])
+                            break
+            else:
+                cur_cell = cell
+                new_col_header.append(cell)
+        new_column_headers.append(new_col_header)
+
+    flat_headers = ['-'.join([i.strip() for i in item if i.strip()]) for item in new_column_headers]
+
+    return flat_headers, header_end_row
+
+
+def sheet(rows):
+    """与 pd.read_excel(header=None) 相同的 object 列。"""
+    return pd.DataFrame(rows, dtype=object)
+
+
+DAY = pd.Timestamp('2024-03-01')
+
+SHEETS = {
+    # 两行表头：年份横向合并（左侧继承，计入表头），地区纵向合并（向下继承，不计入表头）
+    "merged_multi_row": [
+        ['地区', '2023年', None, '2024年', None],
+        [None, '一季度', '二季度', '一季度', '二季度'],
+        ['北京', 1.0, 2.0, 3.0, 4.0],
+        ['上海', 5.0, 6.0, 7.0, 8.0],
+    ],
+    # 只含空白的单元格、连续向左继承，数值 / 日期 / 空值混合的内容列
+    "mixed_types": [
+        ['时间', '指标', '  ', None, '备注'],
+        [None, '数值', '比例', '排名', None],
+        [DAY, 1, 0.5, 3, np.nan],
+        [DAY + pd.Timedelta(days=1), 2, 0.25, 1, np.nan],
+        [DAY + pd.Timedelta(days=2), 3, np.nan, 2, '修订'],
+    ],
+    # 三行表头，中间一行向下继承后再向左继承
+    "three_header_rows": [
+        ['大类', None, None],
+        ['小类', None, '其他'],
+        ['a', 'b', 'c'],
+        [1, 2, 3],
+        [4, 5, 6],
+    ],
+    # 没有两行类型相同，表头末尾默认为倒数第二行
+    "no_boundary": [
+        ['名称', '数量'],
+        ['小计', None],
+        [1, 2.5],
+    ],
+}
+
+
+@pytest.mark.parametrize("name", list(SHEETS))
+def test_matches_baseline(name):
+    expected = baseline_structure_headers(sheet(SHEETS[name]))
+    assert structure_headers(sheet(SHEETS[name])) == expected
+
+
+def test_expected_headers():
+    headers, end = structure_headers(sheet(SHEETS["merged_multi_row"]))
+    assert end == 1
+    assert headers == ['地区', '2023年-一季度', '2023年-二季度', '2024年-一季度', '2024年-二季度']
+
+    headers, end = structure_headers(sheet(SHEETS["mixed_types"]))
+    assert end == 1
+    assert headers == ['时间', '指标-数值', '指标-比例', '指标-排名', '备注']
+
+    headers, end = structure_headers(sheet(SHEETS["no_boundary"]))
+    assert (headers, end) == (['名称-小计', '数量'], 1)
+
+
+def test_matches_baseline_on_long_sheet():
+    rows = [['地区', '指标', None], [None, '本期', '上期']]
+    rows += [[f'城市{i}', float(i), np.nan if i % 7 == 5 else float(i) / 2] for i in range(500)]
+    assert structure_headers(sheet(rows)) == baseline_structure_headers(sheet(rows))
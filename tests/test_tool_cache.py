@@ -0,0 +1,107 @@
+import asyncio
+
+from Tools_manager.tool_manager import ToolPolicy
+from until.tool_cache import ToolCache
+
+ITEM_POLICY = ToolPolicy(cacheable=True, item_arg='query')
+WHOLE_POLICY = ToolPolicy(cacheable=True)
+
+
+class Retriever:
+    """按 query 列表逐项返回结果，记录每次真正执行时的参数。"""
+
+    def __init__(self, aligned=True):
+        self.calls = []
+        self.aligned = aligned
+
+    def __call__(self, args):
+        self.calls.append(args["query"])
+        results = [f"doc:{query.strip()}" for query in args["query"]]
+        return results if self.aligned else '\n'.join(results)
+
+
+def test_per_item_reuse_keeps_order_and_dedups():
+    cache, tool = ToolCache(), Retriever()
+    assert cache.call('retriever_tool', {"query": ["a", "b"]}, ITEM_POLICY, tool) == ["doc:a", "doc:b"]
+    result = cache.call('retriever_tool', {"query": ["b ", "c", "a", "c"]}, ITEM_POLICY, tool)
+    assert result == ["doc:b", "doc:c", "doc:a", "doc:c"]
+    assert tool.calls == [["a", "b"], ["c"]]
+    assert (cache.hits, cache.misses) == (2, 4)
+    assert cache.drain_notes() == ["retriever_tool 复用了 2/4 项已有结果"]
+    assert cache.drain_notes() == []
+
+
+def test_full_hit_does_not_call_tool():
+    cache, tool = ToolCache(), Retriever()
+    cache.call('retriever_tool', {"query": ["a", "b"]}, ITEM_POLICY, tool)
+    assert cache.call('retriever_tool', {"query": ["b", "a"]}, ITEM_POLICY, tool) == ["doc:b", "doc:a"]
+    assert tool.calls == [["a", "b"]]
+
+
+def test_unaligned_result_falls_back_to_full_arguments():
+    cache = ToolCache()
+    cache.call('retriever_tool', {"query": ["a"]}, ITEM_POLICY, Retriever())
+
+    tool = Retriever(aligned=False)
+    result = cache.call('retriever_tool', {"query": ["a", "b"]}, ITEM_POLICY, tool)
+    assert result == "doc:a\ndoc:b"
+    assert tool.calls == [["b"], ["a", "b"]]
+
+
+def test_unaligned_result_without_hits_is_used_directly():
+    cache, tool = ToolCache(), Retriever(aligned=False)
+    assert cache.call('retriever_tool', {"query": ["a", "b"]}, ITEM_POLICY, tool) == "doc:a\ndoc:b"
+    assert tool.calls == [["a", "b"]]
+
+
+def test_scalar_argument_does_not_collide_with_item_entries():
+    cache, tool = ToolCache(), Retriever()
+    cache.call('retriever_tool', {"query": ["a"]}, ITEM_POLICY, tool)
+    assert cache.call('retriever_tool', {"query": "a"}, ITEM_POLICY, tool) == ["doc:a"]
+    assert tool.calls == [["a"], "a"]
+
+
+def test_whole_argument_cache_normalizes_whitespace():
+    cache, calls = ToolCache(), []
+
+    def split_query(args):
+        calls.append(args)
+        return "1.x"
+
+    assert cache.call('split_query', {"query": "q", "data_str": "d  e"}, WHOLE_POLICY, split_query) == "1.x"
+    assert cache.call('split_query', {"data_str": " d e", "query": "q"}, WHOLE_POLICY, split_query) == "1.x"
+    assert len(calls) == 1
+    assert cache.drain_notes() == ["split_query 复用了相同参数的结果"]
+
+
+def test_empty_results_and_errors_are_not_cached():
+    cache, calls = ToolCache(), []
+
+    def flaky(args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("timeout")
+        return [''] if len(calls) == 2 else ["doc"]
+
+    try:
+        cache.call('retriever_tool', {"query": ["a"]}, ITEM_POLICY, flaky)
+    except RuntimeError:
+        pass
+    assert cache.call('retriever_tool', {"query": ["a"]}, ITEM_POLICY, flaky) == ['']
+    assert cache.call('retriever_tool', {"query": ["a"]}, ITEM_POLICY, flaky) == ["doc"]
+    assert cache.call('retriever_tool', {"query": ["a"]}, ITEM_POLICY, flaky) == ["doc"]
+    assert len(calls) == 3
+
+
+def test_async_call():
+    cache, tool = ToolCache(), Retriever()
+
+    async def run(args):
+        return tool(args)
+
+    async def main():
+        await cache.acall('retriever_tool', {"query": ["a"]}, ITEM_POLICY, run)
+        return await cache.acall('retriever_tool', {"query": ["a", "b"]}, ITEM_POLICY, run)
+
+    assert asyncio.run(main()) == ["doc:a", "doc:b"]
+    assert tool.calls == [["a"], ["b"]]
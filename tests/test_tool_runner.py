@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import pytest
+
+from Tools_manager.tool_manager import ToolEntry, ToolPolicy
+from until.tool_runner import ToolRunner, ToolTimeout, cap_result
+
+EXPONENTIAL = ToolEntry('exponential', 'Tools_manager.exponential')
+
+
+@pytest.fixture
+def runner():
+    runner = ToolRunner(thread_workers=4, process_workers=1)
+    yield runner
+    runner.close()
+
+
+def test_process_timeout_kills_only_the_overrunning_worker(runner):
+    policy = ToolPolicy('process', timeout=0.5, max_result_chars=100)
+    assert runner.run('exponential', EXPONENTIAL, {'base': 2, 'exponent': 10}, policy) == 1024
+    pool = runner._process_pool()
+    worker = pool._idle[0]
+
+    start = time.monotonic()
+    with pytest.raises(ToolTimeout):
+        runner.run('exponential', EXPONENTIAL, {'base': 7, 'exponent': 10 ** 9}, policy)
+    assert time.monotonic() - start < 5
+    assert not worker.process.is_alive()
+    assert pool._idle == []
+
+    # 下一次调用换一个新进程执行
+    assert runner.run('exponential', EXPONENTIAL, {'base': 3, 'exponent': 3}, policy) == 27
+    assert pool._idle[0].process.pid != worker.process.pid
+
+
+def test_process_mode_async_timeout(runner):
+    policy = ToolPolicy('process', timeout=0.5)
+
+    async def main():
+        with pytest.raises(ToolTimeout):
+            await runner.arun('exponential', EXPONENTIAL, {'base': 7, 'exponent': 10 ** 9}, policy)
+        return await runner.arun('exponential', EXPONENTIAL, {'base': 2, 'exponent': 5}, policy)
+
+    assert asyncio.run(main()) == 32
+
+
+def test_huge_int_result_is_summarized(runner):
+    policy = ToolPolicy('process', timeout=5, max_result_chars=1000)
+    result = runner.run('exponential', EXPONENTIAL, {'base': 2, 'exponent': 100000}, policy)
+    assert result.startswith('9.990021e+30102')
+    assert cap_result(2 ** 100000, None).startswith('9.990021e+30102')
+
+
+def test_long_result_is_truncated():
+    assert cap_result('x' * 50, 10) == 'x' * 10 + '...(省略40字)'
+    assert cap_result([1, 2], 10) == [1, 2]
+
+
+def test_tool_error_is_raised(runner):
+    policy = ToolPolicy('process', timeout=5)
+    with pytest.raises(RuntimeError, match='unexpected keyword'):
+        runner.run('exponential', EXPONENTIAL, {'bad': 1}, policy)
+
+
+def test_wrapped_function_falls_back_to_thread(runner):
+    policy = ToolPolicy('process', timeout=0.2)
+
+    def wrapped(**kwargs):
+        time.sleep(1)
+
+    assert runner.effective_mode(wrapped, policy) == 'thread'
+    assert runner.effective_mode(EXPONENTIAL, policy) == 'process'
+    with pytest.raises(ToolTimeout):
+        runner.run('wrapped', wrapped, {}, policy)
+
+
+def test_inline_tool_does_not_block_event_loop(runner):
+    policy = ToolPolicy('inline')
+
+    def slow():
+        time.sleep(0.3)
+        return 'done'
+
+    async def main():
+        start = time.monotonic()
+        results = await asyncio.gather(*(runner.arun('slow', slow, {}, policy) for _ in range(3)))
+        return results, time.monotonic() - start
+
+    results, elapsed = asyncio.run(main())
+    assert results == ['done'] * 3
+    assert elapsed < 0.8
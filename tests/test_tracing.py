@@ -0,0 +1,20 @@
+import json
+
+from until import tracing
+
+
+def test_trace_file_rotates_at_max_bytes(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracer = tracing.Tracer(str(path), max_bytes=400)
+    for i in range(20):
+        span = tracing.Span("tool.call", index=i)
+        span.duration = 0.01
+        tracer.record(span)
+
+    assert path.stat().st_size < 400
+    backup = tmp_path / "trace.jsonl.1"
+    assert backup.exists() and backup.stat().st_size < 400
+    last = json.loads(path.read_text(encoding='utf-8').splitlines()[-1])
+    assert last["attrs"]["index"] == 19
+    # 轮转不影响累计的指标
+    assert 'agent_span_total{span="tool.call",status="ok"} 20' in tracer.prometheus_text()
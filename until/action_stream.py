@@ -0,0 +1,133 @@
+import json
+
+ACTION_KEY = "行动"
+FINAL_ANSWER = "Final Answer"
+
+# 流式答案的撤回标记：已经输出的 answer 所在的响应最终解析失败、整轮被丢弃时发出，接收方应清空此前收到的答案文本
+ANSWER_RESET = object()
+
+
+class ActionStreamParser:
+    """
+    增量解析模型的流式输出（{"思考": ..., "行动": {...}}）。
+    每次 feed 一段文本，返回新产生的事件：
+        ("action", value)   "行动" 的值在语法上完整时立即产出，工具可以在模型输出剩余文本前开始执行；
+        ("answer", text)    "行动" 为 Final Answer 时，"answer" 字符串的增量文本。
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.action = None
+        self.answer_streamed = False
+
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._action_start = None
+        self._name = None
+        self._answer_start = None
+        self._answer_emitted = 0
+
+    def _path(self):
+        """当前位置所在的键路径，如 ["行动", "args", "answer"]"""
+        return [frame["key"] for frame in self._stack]
+
+    def feed(self, text):
+        self.buffer += text
+        events = []
+        while self._pos < len(self.buffer):
+            self._scan(self.buffer[self._pos], events)
+            self._pos += 1
+        if self._answer_start is not None:
+            self._emit_answer(len(self.buffer), events)
+        return events
+
+    def _scan(self, char, events):
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == '\\':
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                self._close_string(events)
+            return
+
+        frame = self._stack[-1] if self._stack else None
+        if char == '"':
+            self._in_string = True
+            self._string_start = self._pos
+            if self._is_answer_value(frame):
+                self._answer_start = self._pos + 1
+                self._answer_emitted = self._answer_start
+        elif char in '{[':
+            self._start_value(frame)
+            self._stack.append({"type": char, "key": None, "expect_key": char == '{'})
+        elif char in '}]':
+            if self._stack:
+                self._stack.pop()
+            if self._action_start is not None and len(self._stack) == 1:
+                self._complete_action(self._pos + 1, events)
+        elif char == ':':
+            if frame is not None:
+                frame["expect_key"] = False
+        elif char == ',':
+            if frame is not None and frame["type"] == '{':
+                frame["expect_key"] = True
+
+    def _start_value(self, frame):
+        """记录 "行动" 值（对象或列表）的起始位置"""
+        if (self._action_start is None and self.action is None and frame is not None
+                and len(self._stack) == 1 and frame["key"] == ACTION_KEY and not frame["expect_key"]):
+            self._action_start = self._pos
+
+    def _is_answer_value(self, frame):
+        return (frame is not None and not frame["expect_key"] and self._name == FINAL_ANSWER
+                and self._path() == [ACTION_KEY, "args", "answer"])
+
+    def _close_string(self, events):
+        frame = self._stack[-1] if self._stack else None
+        raw = self.buffer[self._string_start:self._pos + 1]
+        if frame is not None and frame["type"] == '{' and frame["expect_key"]:
+            frame["key"] = json.loads(raw)
+            return
+
+        if self._path() == [ACTION_KEY, "name"]:
+            self._name = json.loads(raw)
+        if self._answer_start is not None:
+            self._emit_answer(self._pos, events)
+            self._answer_start = None
+
+    def _emit_answer(self, end, events):
+        """解码 answer 字符串中已经到达的部分，不在转义序列中间截断"""
+        cut = end
+        if self._in_string and self._answer_start is not None:
+            tail = self.buffer[self._answer_emitted:cut]
+            backslash = tail.rfind('\\')
+            if backslash != -1 and len(tail) - backslash <= 6:
+                cut = self._answer_emitted + backslash
+        if cut <= self._answer_emitted:
+            return
+        try:
+            text = json.loads('"' + self.buffer[self._answer_emitted:cut] + '"')
+        except json.JSONDecodeError:
+            return
+        self._answer_emitted = cut
+        if text:
+            self.answer_streamed = True
+            events.append(("answer", text))
+
+    def _complete_action(self, end, events):
+        try:
+            self.action = json.loads(self.buffer[self._action_start:end])
+        except json.JSONDecodeError:
+            self.action = None
+        self._action_start = None
+        if self.action is not None:
+            events.append(("action", self.action))
+
+    def result(self):
+        """流结束后解析完整响应，失败时抛出 json.JSONDecodeError"""
+        return json.loads(self.buffer)
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+PROFILE_CHUNK_ROWS = 100000
+PROFILE_CHAR_BUDGET = 2000
+TOP_N = 20
+SAMPLE_SIZE = 20
+SKETCH_SIZE = 1024
+
+
+class ColumnProfile:
+    """
+    流式列画像，按块更新，内存只与参数有关、与行数无关：
+    近似基数（KMV 草图）、高频值（有界计数器）、数值/日期列的极值、均匀随机样例。
+    不同值较少时同时保留完整的去重列表，描述与原来逐一列出的格式一致。
+    """
+
+    def __init__(self, top_n=TOP_N, sample_size=SAMPLE_SIZE, sketch_size=SKETCH_SIZE, seed=0):
+        self.top_n = top_n
+        self.sample_size = sample_size
+        self.sketch_size = sketch_size
+
+        self.rows = 0
+        self.kind = None
+        self.minimum = None
+        self.maximum = None
+
+        self._distinct = {}
+        self._sketch = np.empty(0, dtype=np.uint64)
+        self._counters = {}
+        self._sample = pd.Series(dtype=object)
+        self._sample_keys = np.empty(0)
+        self._rng = np.random.default_rng(seed)
+
+    @staticmethod
+    def _detect_kind(values):
+        if pd.api.types.is_numeric_dtype(values):
+            return 'numeric'
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return 'date'
+        head = values.head(100)
+        parsed = pd.to_datetime(head.astype(str), errors='coerce')
+        if parsed.notna().mean() >= 0.9 and not pd.to_numeric(head, errors='coerce').notna().any():
+            return 'date'
+        return 'text'
+
+    def update(self, series):
+        self.rows += len(series)
+        values = series.dropna()
+        if values.empty:
+            return
+        if self.kind is None:
+            self.kind = self._detect_kind(values)
+
+        self._update_range(values)
+        self._update_distinct(values)
+        self._update_sketch(values)
+        self._update_counters(values)
+        self._update_sample(values)
+
+    def _update_range(self, values):
+        if self.kind == 'numeric':
+            bounds = pd.to_numeric(values, errors='coerce').dropna()
+        elif self.kind == 'date':
+            bounds = pd.to_datetime(values.astype(str), errors='coerce').dropna()
+        else:
+            return
+        if bounds.empty:
+            return
+        low, high = bounds.min(), bounds.max()
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+
+    def _update_distinct(self, values):
+        if self._distinct is None:
+            return
+        self._distinct.update(dict.fromkeys(values.unique()))
+        if len(self._distinct) > self.sketch_size:
+            self._distinct = None
+
+    def _update_sketch(self, values):
+        """KMV：保留最小的 sketch_size 个哈希值用于估计基数"""
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+        self._sketch = np.union1d(self._sketch, hashes)[:self.sketch_size]
+
+    def _update_counters(self, values):
+        """每块先精确计数，再与全局计数器合并，只保留 top_n 的若干倍个计数器"""
+        capacity = self.top_n * 10
+        for value, count in values.value_counts().head(capacity).items():
+            self._counters[value] = self._counters.get(value, 0) + int(count)
+        if len(self._counters) > capacity:
+            kept = sorted(self._counters.items(), key=lambda item: item[1], reverse=True)[:capacity]
+            self._counters = dict(kept)
+
+    def _update_sample(self, values):
+        """为每行分配随机键并保留键最小的 sample_size 行，相当于对全列均匀抽样"""
+        keys = self._rng.random(len(values))
+        candidates = pd.concat([self._sample, values.reset_index(drop=True)], ignore_index=True)
+        all_keys = np.concatenate([self._sample_keys, keys])
+        order = np.argsort(all_keys)[:self.sample_size]
+        self._sample = candidates.iloc[order].reset_index(drop=True)
+        self._sample_keys = all_keys[order]
+
+    def cardinality(self):
+        if len(self._sketch) < self.sketch_size:
+            return len(self._sketch)
+        return int((self.sketch_size - 1) * 2.0 ** 64 / float(self._sketch[-1]))
+
+    def top_values(self):
+        return sorted(self._counters.items(), key=lambda item: item[1], reverse=True)[:self.top_n]
+
+    def summary(self, budget=PROFILE_CHAR_BUDGET):
+        """生成不超过 budget 个字符的列描述"""
+        if self._distinct is not None and self.kind == 'text':
+            listed = ';'.join(value for value in self._distinct if isinstance(value, str))
+            if len(listed) <= budget:
+                return listed
+
+        text = f"约{self.cardinality()}个不同值，共{self.rows}行"
+        if self.minimum is not None:
+            text += f"; 范围: {self.minimum} ~ {self.maximum}"
+        text = _append_items(text, "; 高频值: ", [f"{value}({count})" for value, count in self.top_values()], budget)
+        text = _append_items(text, "; 样例: ", [str(value) for value in self._sample], budget)
+        return text[:budget]
+
+
+def _append_items(text, label, items, budget):
+    """在预算内尽量追加列表项"""
+    if not items or len(text) + len(label) + len(items[0]) > budget:
+        return text
+    text += label + items[0]
+    for item in items[1:]:
+        if len(text) + 1 + len(item) > budget:
+            break
+        text += ';' + item
+    return text
+
+
+def profile_column(csv_path, column, budget=PROFILE_CHAR_BUDGET, chunk_rows=PROFILE_CHUNK_ROWS, **kwargs):
+    """分块读取 csv 的单列并生成列描述"""
+    profile = ColumnProfile(**kwargs)
+    for chunk in pd.read_csv(csv_path, usecols=[column], chunksize=chunk_rows):
+        profile.update(chunk[column])
+    return profile.summary(budget)
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class DiskCache:
+    """
+    基于 SQLite 的持久化键值缓存，按总字节数做 LRU 淘汰，可选 TTL（秒）。
+    同一个文件可以被多个进程共享，单个实例可在多线程间共享。
+    """
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024, ttl=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB, size INTEGER, created REAL, accessed REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._conn.commit()
+
+    def _expired(self, created, now):
+        return self.ttl is not None and created + self.ttl < now
+
+    def get_many(self, keys):
+        """批量读取，返回命中的 {key: value}."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        with self._lock:
+            expired = []
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value, created FROM entries WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, value, created in rows:
+                    if self._expired(created, now):
+                        expired.append((key,))
+                    else:
+                        found[key] = value
+
+            if found:
+                self._conn.executemany("UPDATE entries SET accessed = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+            if expired:
+                self._conn.executemany("DELETE FROM entries WHERE key = ?", expired)
+            self._conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set_many(self, items):
+        """批量写入 {key: bytes}，写入后按容量淘汰最久未访问的条目."""
+        now = time.time()
+        rows = [(key, value, len(value), now, now) for key, value in items.items()]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def _evict(self):
+        total = self._total_bytes()
+        if total <= self.max_bytes:
+            return
+        cursor = self._conn.execute("SELECT key, size FROM entries ORDER BY accessed")
+        evicted = []
+        for key, size in cursor:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+    def _total_bytes(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def stats(self):
+        """命中率与占用空间，用于评估缓存容量."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            total = self._total_bytes()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,387 @@
+"""
+agent 执行的录制与回放。
+
+录制：AgentExecutor(record_path=...)（或设置 AGENT_RECORD_PATH 环境变量）后，每次 agent_execute 的
+LLM 请求/响应（含耗时、首 token 时间）和工具调用（参数、结果、耗时）按执行分组追加写入 JSONL 文件。
+
+回放：ReplayLLM 按录制顺序返回各次 LLM 响应，不访问网络；工具可以真实执行（用于压测工具和检索），
+也可以返回录制的结果。同一轮中并发的工具调用完成顺序不固定，录制的工具结果按参数匹配，
+工具内部的 LLM 调用按所属的工具调用（工具名加参数）分组，序号在调用开始时分配。可选按原始耗时等待，并以指定并发重复执行，模拟 N 倍的线上流量：
+
+    python benchmarks/replay_load.py log/agent_record.jsonl --concurrency 16 --repeat 10 --timing original
+"""
+import asyncio
+import contextvars
+import functools
+import importlib
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+
+from until.tool_cache import ToolCache
+
+RECORD_PATH = os.getenv('AGENT_RECORD_PATH')
+AGENT_SOURCE = "agent"
+STREAM_CHUNKS = 16
+
+# 当前录制中的执行 id、当前回放的游标，以及发起 LLM 调用的来源（agent 主循环或某个工具内部）
+_run_id = contextvars.ContextVar('replay_run_id', default=None)
+_cursor = contextvars.ContextVar('replay_cursor', default=None)
+_source = contextvars.ContextVar('replay_source', default=AGENT_SOURCE)
+# 当前执行中工具内部 LLM 的替换方式：wrap(获取原客户端的函数) -> 本次使用的客户端；None 表示使用原客户端
+_tool_llm = contextvars.ContextVar('replay_tool_llm', default=None)
+
+# 内部会调用 LLM 的工具模块及其获取客户端的函数，录制和回放时按执行替换
+TOOL_LLM_MODULES = [('Tools_manager.split_query', '_get_llm')]
+
+
+class ReplayExhausted(Exception):
+    """回放时请求的 LLM 响应或工具结果超出了录制内容，说明执行路径与录制时不同。"""
+
+
+def tool_source(name, args):
+    """工具内部 LLM 调用的来源：工具名加规范化后的参数，同一轮中并发的同名工具调用各自独立计序。"""
+    return f"tool:{ToolCache.key(name, args)}"
+
+
+def _response_text(response):
+    return response if isinstance(response, str) else json.dumps(response, ensure_ascii=False)
+
+
+class TraceRecorder:
+    def __init__(self, path=RECORD_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._sequences = defaultdict(int)
+
+    def _write(self, event):
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+    def _next_seq(self, key):
+        with self._lock:
+            self._sequences[key] += 1
+            return self._sequences[key] - 1
+
+    def start_run(self, query, table_des, max_request_time):
+        """开始录制一次执行；执行期间工具内部的 LLM 调用也记入本录制器，结束后恢复。"""
+        run_id = uuid.uuid4().hex
+        self._write({"type": "run_start", "run": run_id, "time": time.time(), "query": query,
+                     "table_des": table_des, "max_request_time": max_request_time})
+        tokens = (_run_id.set(run_id), _tool_llm.set(lambda get_llm: RecordingLLM(get_llm(), self)))
+        return run_id, tokens, time.perf_counter()
+
+    def end_run(self, run, answer):
+        run_id, (run_token, tool_llm_token), start = run
+        _tool_llm.reset(tool_llm_token)
+        _run_id.reset(run_token)
+        self._write({"type": "run_end", "run": run_id, "answer": answer, "latency": time.perf_counter() - start})
+
+    def llm_seq(self):
+        """在调用开始时分配序号，回放按调用开始的顺序取响应。"""
+        return self._next_seq((_run_id.get(), _source.get()))
+
+    def tool_seq(self, name):
+        return self._next_seq((_run_id.get(), f"tool:{name}"))
+
+    def record_llm(self, seq, sys_prompt, user_prompt, response, latency, ttft=None, stream=False):
+        self._write({"type": "llm", "run": _run_id.get(), "source": _source.get(), "seq": seq,
+                     "stream": stream, "sys_prompt": sys_prompt, "user_prompt": user_prompt,
+                     "response": response, "latency": latency, "ttft": ttft})
+
+    def record_tool(self, seq, name, args, result, latency):
+        self._write({"type": "tool", "run": _run_id.get(), "name": name, "seq": seq,
+                     "args": args, "result": result, "latency": latency})
+
+
+class RecordingLLM:
+    """包装真实 LLM，把每次调用写入 TraceRecorder，接口与被包装的 LLM 一致。"""
+
+    def __init__(self, llm, recorder):
+        self.llm = llm
+        self.recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    def chat(self, sys_prompt='', user_prompt='', **options):
+        seq, start = self.recorder.llm_seq(), time.perf_counter()
+        response = self.llm.chat(sys_prompt, user_prompt, **options)
+        self.recorder.record_llm(seq, sys_prompt, user_prompt, response, time.perf_counter() - start)
+        return response
+
+    async def achat(self, sys_prompt='', user_prompt='', **options):
+        seq, start = self.recorder.llm_seq(), time.perf_counter()
+        response = await self.llm.achat(sys_prompt, user_prompt, **options)
+        self.recorder.record_llm(seq, sys_prompt, user_prompt, response, time.perf_counter() - start)
+        return response
+
+    async def achat_stream(self, sys_prompt='', user_prompt='', **options):
+        seq, start = self.recorder.llm_seq(), time.perf_counter()
+        ttft = None
+        chunks = []
+        async for chunk in self.llm.achat_stream(sys_prompt, user_prompt, **options):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            chunks.append(chunk)
+            yield chunk
+        self.recorder.record_llm(seq, sys_prompt, user_prompt, ''.join(chunks), time.perf_counter() - start,
+                                 ttft=ttft, stream=True)
+
+
+def _wrap_tool(name, func, call):
+    """call(name, func, kwargs) 执行或代替工具；工具内部的 LLM 调用记在 tool_source(name, kwargs) 来源下。"""
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(**kwargs):
+            token = _source.set(tool_source(name, kwargs))
+            try:
+                return await call(name, func, kwargs)
+            finally:
+                _source.reset(token)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(**kwargs):
+        token = _source.set(tool_source(name, kwargs))
+        try:
+            return call(name, func, kwargs)
+        finally:
+            _source.reset(token)
+    return wrapper
+
+
+def recording_tools(tools_map, recorder):
+    def call(name, func, kwargs):
+        seq, start = recorder.tool_seq(name), time.perf_counter()
+        result = func(**kwargs)
+        if inspect.isawaitable(result):
+            return _record_awaited(seq, name, kwargs, result, start)
+        recorder.record_tool(seq, name, kwargs, result, time.perf_counter() - start)
+        return result
+
+    async def _record_awaited(seq, name, kwargs, awaitable, start):
+        result = await awaitable
+        recorder.record_tool(seq, name, kwargs, result, time.perf_counter() - start)
+        return result
+
+    return {name: _wrap_tool(name, func, call) for name, func in tools_map.items()}
+
+
+def install_tool_llm_dispatch():
+    """
+    把工具模块获取 LLM 客户端的函数换成按当前执行分派的版本（只安装一次）：
+    当前上下文设置了 _tool_llm 时返回替换后的客户端，否则调用原函数，录制和回放结束后不留下任何包装。
+    回放时替换函数不调用原函数，不会创建真实客户端。
+    """
+    for module_name, getter in TOOL_LLM_MODULES:
+        module = importlib.import_module(module_name)
+        original = getattr(module, getter)
+        if getattr(original, '_replay_dispatch', False):
+            continue
+
+        @functools.wraps(original)
+        def dispatch(original=original):
+            wrap = _tool_llm.get()
+            return original() if wrap is None else wrap(original)
+
+        dispatch._replay_dispatch = True
+        setattr(module, getter, dispatch)
+
+
+def enable_recording(executor, path=RECORD_PATH):
+    """为 AgentExecutor 开启录制。"""
+    recorder = TraceRecorder(path)
+    executor.recorder = recorder
+    executor.llm = RecordingLLM(executor.llm, recorder)
+    executor.tools_map = recording_tools(executor.tools_map, recorder)
+    install_tool_llm_dispatch()
+    return recorder
+
+
+class RecordedRun:
+    def __init__(self, start):
+        self.run_id = start["run"]
+        self.query = start["query"]
+        self.table_des = start["table_des"]
+        self.max_request_time = start["max_request_time"]
+        self.answer = None
+        self.latency = None
+        self.llm_calls = defaultdict(list)
+        self.tool_calls = defaultdict(list)
+
+
+def load_trace(path):
+    """读取录制文件，返回按开始顺序排列的 RecordedRun 列表（未正常结束的执行也包含在内）。"""
+    runs = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            event = json.loads(line)
+            if event["type"] == "run_start":
+                runs[event["run"]] = RecordedRun(event)
+                continue
+            run = runs.get(event["run"])
+            if run is None:
+                continue
+            if event["type"] == "run_end":
+                run.answer, run.latency = event["answer"], event["latency"]
+            elif event["type"] == "llm":
+                run.llm_calls[event["source"]].append(event)
+            elif event["type"] == "tool":
+                run.tool_calls[event["name"]].append(event)
+    for run in runs.values():
+        for calls in list(run.llm_calls.values()) + list(run.tool_calls.values()):
+            calls.sort(key=lambda event: event["seq"])
+    return list(runs.values())
+
+
+class ReplayCursor:
+    """
+    一次回放执行的进度：每个来源的 LLM 响应按录制顺序依次取出；
+    工具结果取参数相同的最早一条，没有参数相同的记录时（执行路径已经不同）取最早的一条。
+    """
+
+    def __init__(self, run):
+        self.run = run
+        self._llm = {source: deque(calls) for source, calls in run.llm_calls.items()}
+        self._tools = {name: deque(calls) for name, calls in run.tool_calls.items()}
+        self._lock = threading.Lock()
+
+    def next_llm(self, source):
+        with self._lock:
+            calls = self._llm.get(source)
+            if not calls:
+                raise ReplayExhausted(f"录制 {self.run.run_id} 中来源 {source} 的 LLM 响应已用完")
+            return calls.popleft()
+
+    def next_tool(self, name, args):
+        key = ToolCache.key(name, args)
+        with self._lock:
+            calls = self._tools.get(name)
+            if not calls:
+                raise ReplayExhausted(f"录制 {self.run.run_id} 中工具 {name} 的结果已用完")
+            for event in calls:
+                if ToolCache.key(name, event["args"]) == key:
+                    calls.remove(event)
+                    return event
+            return calls.popleft()
+
+
+class ReplayLLM:
+    """
+    按录制顺序返回 LLM 响应。timing="original" 时按录制的耗时（乘以 time_scale）等待，
+    流式调用先等待首 token 时间，再把剩余文本分段均匀输出。
+    """
+
+    def __init__(self, timing='none', time_scale=1.0):
+        self.timing = timing
+        self.time_scale = time_scale
+
+    def _next(self):
+        cursor = _cursor.get()
+        if cursor is None:
+            raise ReplayExhausted("当前上下文不在回放中")
+        return cursor.next_llm(_source.get())
+
+    def _delay(self, seconds):
+        return (seconds or 0.0) * self.time_scale if self.timing == 'original' else 0.0
+
+    # options（validate、use_cache 等缓存选项）对回放没有意义，忽略
+    def chat(self, sys_prompt='', user_prompt='', **options):
+        event = self._next()
+        time.sleep(self._delay(event["latency"]))
+        return event["response"]
+
+    async def achat(self, sys_prompt='', user_prompt='', **options):
+        event = self._next()
+        await asyncio.sleep(self._delay(event["latency"]))
+        return event["response"]
+
+    async def achat_stream(self, sys_prompt='', user_prompt='', **options):
+        event = self._next()
+        text = _response_text(event["response"])
+        ttft = event.get("ttft") if event.get("ttft") is not None else event["latency"]
+        await asyncio.sleep(self._delay(ttft))
+        size = max(1, -(-len(text) // STREAM_CHUNKS))
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        interval = self._delay(max(0.0, event["latency"] - ttft)) / max(1, len(pieces) - 1)
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(interval)
+            yield piece
+
+
+def replay_tools(tools_map, timing='none', time_scale=1.0):
+    """工具不真实执行，按录制顺序返回结果。"""
+    def delay(event):
+        return event["latency"] * time_scale if timing == 'original' else 0.0
+
+    def call(name, func, kwargs):
+        cursor = _cursor.get()
+        if cursor is None:
+            raise ReplayExhausted("当前上下文不在回放中")
+        event = cursor.next_tool(name, kwargs)
+        if inspect.iscoroutinefunction(func):
+            async def result():
+                await asyncio.sleep(delay(event))
+                return event["result"]
+            return result()
+        time.sleep(delay(event))
+        return event["result"]
+
+    return {name: _wrap_tool(name, func, call) for name, func in tools_map.items()}
+
+
+def source_tracking_tools(tools_map):
+    """真实执行工具，只标记工具内部 LLM 调用的来源，使其取到对应的录制响应。"""
+    def call(name, func, kwargs):
+        return func(**kwargs)
+
+    return {name: _wrap_tool(name, func, call) for name, func in tools_map.items()}
+
+
+def prepare_replay(executor, timing='none', time_scale=1.0, use_recorded_tools=False):
+    """把 AgentExecutor 切换为回放模式：LLM 由录制内容代替，工具内部的 LLM 在 replay_runs 的每次执行中替换。"""
+    llm = ReplayLLM(timing, time_scale)
+    executor.llm = llm
+    if use_recorded_tools:
+        executor.tools_map = replay_tools(executor.tools_map, timing, time_scale)
+    else:
+        executor.tools_map = source_tracking_tools(executor.tools_map)
+    install_tool_llm_dispatch()
+    return executor
+
+
+async def replay_runs(executor, runs, concurrency=1, repeat=1):
+    """
+    以 concurrency 的并发回放 runs 中的每次执行 repeat 遍，返回每次回放的结果：
+    耗时、是否得到答案、答案是否与录制时一致。
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def replay_one(run):
+        async with semaphore:
+            # 每个 replay_one 是独立的任务，上下文变量只在本次回放中生效
+            _cursor.set(ReplayCursor(run))
+            _tool_llm.set(lambda _: executor.llm)
+            start = time.perf_counter()
+            try:
+                answer = await executor.aagent_execute(run.query, run.table_des, run.max_request_time)
+            except Exception as e:
+                logging.error(f"回放 {run.run_id} 出错: {e}")
+                answer = None
+            return {"run": run.run_id, "latency": time.perf_counter() - start,
+                    "recorded_latency": run.latency, "answered": bool(answer),
+                    "matches_recording": answer == run.answer}
+
+    return await asyncio.gather(*[replay_one(run) for _ in range(repeat) for run in runs])
@@ -1,7 +1,19 @@
+import concurrent.futures
+import hashlib
+import json
 import os
+import shutil
 
+import numpy as np
 import pandas as pd
 
+from until.column_profile import PROFILE_CHAR_BUDGET, profile_column
+
+HEADER_SCAN_ROWS = 200
+PREPROCESS_CACHE_DIR = 'cache/preprocess'
+
+_cell_type = np.frompyfunc(type, 1, 1)
+
 
 def get_row_data_types(df, row_number, start_col):
     """ 获取某一行中各个单元格的非空数据类型 """
@@ -17,47 +29,56 @@ def get_row_data_types(df, row_number, start_col):
     return types
 
 
+def get_type_matrix(df, start_row, end_row, start_col):
+    """ 计算 [start_row, end_row) 行中各单元格的数据类型矩阵，空值记为 None """
+    values = df.iloc[start_row:end_row, start_col:].to_numpy(dtype=object)
+    types = _cell_type(values)
+    types[pd.isna(values)] = None
+    return types
+
+
+def find_header_end_row(df, start_row=0, start_col=0, scan_rows=HEADER_SCAN_ROWS):
+    """
+    找到第一对类型完全相同的相邻行，其上一行即为表头末尾。
+    每次只对 scan_rows 行计算类型矩阵，表头通常在前几行即可确定，未找到时再继续向下扫描。
+    """
+    begin = start_row
+    while begin < len(df) - 1:
+        end = min(begin + scan_rows, len(df))
+        types = get_type_matrix(df, begin, end, start_col)
+        if types.shape[1] == 0:
+            return None
+        same_as_next = (types[:-1] == types[1:]).all(axis=1)
+        matches = np.flatnonzero(same_as_next)
+        if matches.size:
+            return max(begin + int(matches[0]) - 1, 0)
+        begin = end - 1
+    return None
+
+
 def structure_headers(df, start_row=1, start_col=1):
     start_row -= 1  # 调整为 0-based 索引
     start_col -= 1  # 调整为 0-based 索引
 
-    header_end_row = None
+    header_end_row = find_header_end_row(df, start_row, start_col)
+    if header_end_row is None:
+        header_end_row = max(len(df) - 2, 0)  # 如果没有找到合适的结束行，则默认为最后一行是内容，倒是第二行是表头末尾
 
-    for row_number in range(start_row, len(df) - 1):
-        current_row_types = get_row_data_types(df, row_number, start_col)
-        next_row_types = get_row_data_types(df, row_number + 1, start_col)
-        if current_row_types and next_row_types and current_row_types == next_row_types:
-            header_end_row = max(row_number - 1, 0)
-            break
+    # 合并单元格填充：空单元格优先沿列向下继承上方的值（不计入表头），
+    # 该列上方没有值时再沿行继承左侧的值（计入表头）
+    block = df.iloc[:header_end_row + 1, :].to_numpy(dtype=object)
+    text = np.where(pd.isna(block), '', block).astype(str)
+    empty = np.char.strip(text) == ''
 
-    if header_end_row is None:
-        header_end_row = row_number  # 如果没有找到合适的结束行，则默认为最后一行是内容，倒是第二行是表头末尾
-
-    column_headers = [df.iloc[list(range(header_end_row + 1)), i].tolist() for i in range(len(df.columns))]
-    new_column_headers = []
-    for ix_col, col_header in enumerate(column_headers):
-        new_col_header = []
-        cur_cell = ''
-        for ix_row, cell in enumerate(col_header):
-            if pd.isna(cell) or cell.strip() == '':
-                if cur_cell != '':
-                    col_header[ix_row] = cur_cell
-                else:
-                    ix_col_tmp = ix_col - 1
-                    while ix_col_tmp >= 0:
-                        if pd.isna(column_headers[ix_col_tmp][ix_row]) or column_headers[ix_col_tmp][
-                            ix_row].strip() == '':
-                            ix_col -= 1
-                        else:
-                            col_header[ix_row] = column_headers[ix_col_tmp][ix_row]
-                            new_col_header.append(column_headers[ix_col_tmp][ix_row])
-                            break
-            else:
-                cur_cell = cell
-                new_col_header.append(cell)
-        new_column_headers.append(new_col_header)
-
-    flat_headers = ['-'.join([i.strip() for i in item if i.strip()]) for item in new_column_headers]
+    cells = pd.DataFrame(np.where(empty, None, text))
+    down_filled = cells.ffill(axis=0)
+    filled = down_filled.ffill(axis=1)
+
+    include = ~empty | (down_filled.isna() & filled.notna()).to_numpy()
+    values = np.where(empty, filled.to_numpy(), text)
+
+    flat_headers = ['-'.join([i.strip() for i in values[include[:, col], col] if i.strip()])
+                    for col in range(values.shape[1])]
 
     return flat_headers, header_end_row
 
@@ -100,9 +121,114 @@ def get_all_file_paths(directory):
     return file_paths
 
 
-def preprocess_table(input_dir):
+def file_hash(path, block_size=1 << 20):
+    """按块计算文件内容哈希，作为预处理缓存的键"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_cache(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_cache(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _restore_workbook(xlsx_path, csv_path, cache_dir=PREPROCESS_CACHE_DIR):
+    """工作簿已转换过时从缓存恢复 csv 并返回 (True, None)，否则返回 (False, None)。"""
+    key = file_hash(xlsx_path)
+    record = _read_cache(os.path.join(cache_dir, f'{key}.json'))
+    cached_csv = os.path.join(cache_dir, f'{key}.csv')
+    if record is None or (record["csv_hash"] and not os.path.exists(cached_csv)):
+        return False, None
+    if record["csv_hash"] and not (os.path.exists(csv_path) and file_hash(csv_path) == record["csv_hash"]):
+        shutil.copyfile(cached_csv, csv_path)
+    return True, None
+
+
+def convert_workbook(xlsx_path, csv_path, cache_dir=PREPROCESS_CACHE_DIR):
+    """
+    xlsx 转 csv，结果按 xlsx 内容哈希缓存：未变化的工作簿直接复用缓存的 csv，不再调用 read_excel。
+    """
+    if _restore_workbook(xlsx_path, csv_path, cache_dir)[0]:
+        return
+
+    key = file_hash(xlsx_path)
+    record_path = os.path.join(cache_dir, f'{key}.json')
+    cached_csv = os.path.join(cache_dir, f'{key}.csv')
+    headers, _ = update_new_headers_csv(xlsx_path, csv_path, col_header_ix_list=[0, 1])
+    csv_hash = None
+    if headers and os.path.exists(csv_path):
+        shutil.copyfile(csv_path, f"{cached_csv}.{os.getpid()}.tmp")
+        os.replace(f"{cached_csv}.{os.getpid()}.tmp", cached_csv)
+        csv_hash = file_hash(csv_path)
+    _write_cache(record_path, {"source": xlsx_path, "csv_hash": csv_hash})
+
+
+def _cached_description(csv_path, cache_dir=PREPROCESS_CACHE_DIR, char_budget=PROFILE_CHAR_BUDGET):
+    """返回 (是否命中, (表头, 关键列))。"""
+    fragment = _read_cache(os.path.join(cache_dir, f'{file_hash(csv_path)}.des.json'))
+    if fragment is not None and fragment.get("char_budget") == char_budget:
+        return True, (fragment["header"], fragment["index"])
+    return False, None
+
+
+def describe_csv(csv_path, cache_dir=PREPROCESS_CACHE_DIR, char_budget=PROFILE_CHAR_BUDGET):
+    """
+    计算单个 csv 的表头与关键列描述，结果按 csv 内容哈希缓存。
+    关键列分块读取并做有界画像，描述长度不超过 char_budget，不随表格行数增长。
+    """
+    hit, cached = _cached_description(csv_path, cache_dir, char_budget)
+    if hit:
+        return cached
+
+    fragment_path = os.path.join(cache_dir, f'{file_hash(csv_path)}.des.json')
+    columns = pd.read_csv(csv_path, nrows=0).columns
+    header = '； '.join([col.replace(' ', '') for col in list(columns)])
+    key_header = columns[:1]
+    index = key_header[0] + ': ' + profile_column(csv_path, key_header[0], char_budget)
+    _write_cache(fragment_path, {"header": header, "index": index, "char_budget": char_budget})
+    return header, index
+
+
+def _run_jobs(func, jobs, max_workers=None, lookup=None):
+    """
+    lookup(*job) 返回 (是否命中缓存, 结果)，命中的任务在当前进程直接取结果；
+    剩余多个任务时才启动进程池并行处理，只剩一个时直接在当前进程执行。结果按 jobs 的顺序返回。
+    """
+    results = [None] * len(jobs)
+    pending = []
+    for i, job in enumerate(jobs):
+        hit, value = lookup(*job) if lookup is not None else (False, None)
+        if hit:
+            results[i] = value
+        else:
+            pending.append(i)
+
+    if len(pending) <= 1:
+        for i in pending:
+            results[i] = func(*jobs[i])
+        return results
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for i, value in zip(pending, executor.map(func, *zip(*[jobs[i] for i in pending]))):
+            results[i] = value
+    return results
+
+
+def preprocess_table(input_dir, cache_dir=PREPROCESS_CACHE_DIR, max_workers=None, char_budget=PROFILE_CHAR_BUDGET):
     """
     对文件夹下的数据文件预处理，并返回关键字段（文件名、表头和关键列）
+    每个文件的转换和描述在进程池中并行执行，并按文件内容哈希缓存在 cache_dir，未变化的文件直接跳过
     example:
     input_dir: 36大中城市居民消费价格分类指数(上年同月＝100)(2016-)
     output:表格名称：2023年第二季度累计各地区建筑业总产值和竣工产值.csv
@@ -110,27 +236,22 @@ def preprocess_table(input_dir):
           关键列：
           时间-地区: 2023年第二季度-广西壮族自治区;2023年第二季度-浙江省;2023年第二季度-河南省
     """
+    os.makedirs(cache_dir, exist_ok=True)
+
+    workbooks = []
     for filepath, _, filenames in os.walk(input_dir):
         for filename in filenames:
             if filename.endswith('xlsx'):
-                # print(os.path.join(filepath, filename))
-                update_new_headers_csv(os.path.join(filepath, filename),
-                                       os.path.join(filepath, filename.split('.')[0] + '.csv'),
-                                       col_header_ix_list=[0, 1])
-    header_list = []
-    title_list = []
-    index_list = []
-    for filename in os.listdir(input_dir):
-        if filename.endswith('.csv'):
-            df = pd.read_csv(os.path.join(input_dir, filename))
-            header = '； '.join([col.replace(' ', '') for col in list(df.columns)])
-            header_list.append(header)
-            title_list.append(filename)
-            key_header = df.columns[:1]
-            index_data = [key_header[0], [s for s in set(list(df[key_header[0]])) if isinstance(s, str)]]
-            index = index_data[0] + ': ' + ';'.join(index_data[1])
-            index_list.append(index)
+                workbooks.append((os.path.join(filepath, filename),
+                                  os.path.join(filepath, filename.split('.')[0] + '.csv'),
+                                  cache_dir))
+    _run_jobs(convert_workbook, workbooks, max_workers, lookup=_restore_workbook)
+
+    title_list = [filename for filename in os.listdir(input_dir) if filename.endswith('.csv')]
+    fragments = _run_jobs(describe_csv,
+                          [(os.path.join(input_dir, filename), cache_dir, char_budget) for filename in title_list],
+                          max_workers, lookup=_cached_description)
     data_str = '\n'.join(
-        [f'表格名称：{filename}\n表头：{header}\n关键列：\n{index}\n' for header, filename, index in
-         zip(header_list, title_list, index_list)])
+        [f'表格名称：{filename}\n表头：{header}\n关键列：\n{index}\n' for (header, index), filename in
+         zip(fragments, title_list)])
     return data_str
@@ -0,0 +1,120 @@
+"""
+一次 agent 执行（会话）内的工具结果缓存。
+
+只缓存 ToolPolicy.cacheable 的工具，键为工具名加规范化后的参数（字符串去掉多余空白，字典按键排序）。
+声明了 item_arg 的工具按列表中的每一项缓存：retriever_tool(query=[q1, q2, q3]) 中 q1、q2 已检索过时，
+只用 [q3] 调用工具，再按原顺序拼回结果。逐项的键带 ":item:" 前缀，与整个调用的键（如 query="q1"）互不冲突。
+出错、超时和空结果不缓存。命中说明由 AgentExecutor 写入日志，不进入提示词。
+"""
+import contextvars
+import json
+
+# 当前会话的缓存，由 AgentExecutor 在每次执行开始时设置；工具任务创建时复制上下文，可以读到同一个缓存
+current = contextvars.ContextVar('tool_cache', default=None)
+
+_MISSING = object()
+
+
+def normalize(value):
+    if isinstance(value, str):
+        return ' '.join(value.split())
+    if isinstance(value, dict):
+        return {str(key): normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    return value
+
+
+class _Lookup:
+    """一次调用的查找结果：各键对应的缓存值，以及需要真正执行时的参数。"""
+
+    def __init__(self, keys, values, call_args, items=None):
+        self.keys = keys
+        self.values = values
+        self.call_args = call_args
+        # 逐项缓存时，call_args 中需要计算的项对应的键
+        self.items = items
+
+    @property
+    def hits(self):
+        return sum(value is not _MISSING for value in self.values)
+
+
+class ToolCache:
+    def __init__(self):
+        self._results = {}
+        self._notes = []
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(tool_name, args):
+        return tool_name + ':' + json.dumps(normalize(args), sort_keys=True, ensure_ascii=False, default=str)
+
+    @classmethod
+    def item_key(cls, tool_name, args, item_arg, item):
+        """列表参数中单独一项的键：其余参数加上这一项。"""
+        return cls.key(tool_name + ':item', dict(args, **{item_arg: item}))
+
+    def _lookup(self, tool_name, args, policy):
+        items = args.get(policy.item_arg) if policy.item_arg else None
+        if not isinstance(items, list):
+            key = self.key(tool_name, args)
+            value = self._results.get(key, _MISSING)
+            return _Lookup([key], [value], args if value is _MISSING else None)
+
+        keys = [self.item_key(tool_name, args, policy.item_arg, item) for item in items]
+        values = [self._results.get(key, _MISSING) for key in keys]
+        # 同一次调用中重复的项只计算一次
+        missing = {}
+        for key, item, value in zip(keys, items, values):
+            if value is _MISSING and key not in missing:
+                missing[key] = item
+        call_args = dict(args, **{policy.item_arg: list(missing.values())}) if missing else None
+        return _Lookup(keys, values, call_args, list(missing))
+
+    def _store(self, tool_name, lookup, result):
+        """保存新结果并按原顺序组装返回值；结果无法与请求的项对应时返回 _MISSING，由调用方用完整参数重新执行。"""
+        if lookup.items is None:
+            if lookup.call_args is not None:
+                self.misses += 1
+                if result:
+                    self._results[lookup.keys[0]] = result
+                return result
+            self.hits += 1
+            self._notes.append(f"{tool_name} 复用了相同参数的结果")
+            return lookup.values[0]
+
+        fresh = {}
+        if lookup.call_args is not None:
+            if not isinstance(result, list) or len(result) != len(lookup.items):
+                # 没有命中也没有重复项时，本次调用用的就是完整参数
+                return result if len(lookup.items) == len(lookup.keys) else _MISSING
+            fresh = dict(zip(lookup.items, result))
+            self._results.update((key, value) for key, value in fresh.items() if value)
+
+        hits = lookup.hits
+        self.hits += hits
+        self.misses += len(lookup.keys) - hits
+        if hits:
+            self._notes.append(f"{tool_name} 复用了 {hits}/{len(lookup.keys)} 项已有结果")
+        return [fresh[key] if value is _MISSING else value for key, value in zip(lookup.keys, lookup.values)]
+
+    def call(self, tool_name, args, policy, run):
+        """run(args) 执行工具并返回未截断的结果。"""
+        lookup = self._lookup(tool_name, args, policy)
+        result = run(lookup.call_args) if lookup.call_args is not None else None
+        assembled = self._store(tool_name, lookup, result)
+        return run(args) if assembled is _MISSING else assembled
+
+    async def acall(self, tool_name, args, policy, run):
+        """call 的异步版本，run(args) 返回协程。"""
+        lookup = self._lookup(tool_name, args, policy)
+        result = await run(lookup.call_args) if lookup.call_args is not None else None
+        assembled = self._store(tool_name, lookup, result)
+        return await run(args) if assembled is _MISSING else assembled
+
+    def drain_notes(self):
+        """取出自上次调用以来的缓存命中说明，由调用方写入日志。"""
+        notes, self._notes = self._notes, []
+        return notes
@@ -0,0 +1,210 @@
+"""
+按 ToolPolicy 执行工具：inline 不限时地直接执行（异步接口中放到默认线程池，不阻塞事件循环），只适合加减乘这类瞬间完成的工具；
+thread 提交到线程池，超时后放弃等待（线程无法被强制终止）；
+process 在常驻的子进程中执行，超时后终止该进程并在下次调用时重新创建。
+结果超过 max_result_chars 时截断，process 模式在子进程中完成截断，避免把超大结果传回主进程。
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import importlib
+import inspect
+import math
+import multiprocessing
+import os
+import threading
+
+from Tools_manager.tool_manager import ToolEntry
+
+TOOL_THREAD_WORKERS = int(os.getenv('TOOL_THREAD_WORKERS', 8))
+TOOL_PROCESS_WORKERS = int(os.getenv('TOOL_PROCESS_WORKERS', 2))
+# 为空时使用平台默认的启动方式（Linux 为 fork）
+TOOL_PROCESS_START_METHOD = os.getenv('TOOL_PROCESS_START_METHOD') or None
+
+
+class ToolTimeout(Exception):
+    """工具执行超过策略规定的时间。"""
+
+
+def describe_int(value):
+    """超过解释器整数转字符串位数上限（默认 4300 位）的整数，用科学计数法和位数描述量级。"""
+    exponent = math.floor(math.log10(abs(value)))
+    mantissa = 10 ** (math.log10(abs(value)) - exponent)
+    sign = '-' if value < 0 else ''
+    return f"{sign}{mantissa:.6f}e+{exponent}（{exponent + 1}位整数，数值过大，只保留量级）"
+
+
+def cap_result(result, max_chars):
+    """结果转为文本后超过 max_chars 字时截断并注明省略的字数，未超出时原样返回；无法转为文本的大整数返回量级描述。"""
+    try:
+        text = result if isinstance(result, str) else str(result)
+    except ValueError:
+        if not isinstance(result, int):
+            raise
+        return describe_int(result)
+    if max_chars is None or len(text) <= max_chars:
+        return result
+    return f"{text[:max_chars]}...(省略{len(text) - max_chars}字)"
+
+
+def _worker_main(conn):
+    """子进程循环：接收 (模块, 函数名, 参数, 最大字数)，返回 (是否成功, 结果或错误信息)。"""
+    while True:
+        try:
+            module, name, kwargs, max_chars = conn.recv()
+        except EOFError:
+            break
+        try:
+            func = getattr(importlib.import_module(module), name)
+            reply = (True, cap_result(func(**kwargs), max_chars))
+        except Exception as e:
+            reply = (False, str(e))
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # 结果无法序列化
+            conn.send((False, str(e)))
+
+
+class _ProcessWorker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), name='tool-worker', daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def call(self, job, timeout):
+        self.conn.send(job)
+        if not self.conn.poll(timeout):
+            raise ToolTimeout()
+        return self.conn.recv()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class ProcessToolPool:
+    """最多 workers 个常驻子进程，超时的进程被终止，其他进程中的调用不受影响。"""
+
+    def __init__(self, workers=TOOL_PROCESS_WORKERS, start_method=TOOL_PROCESS_START_METHOD):
+        self._context = multiprocessing.get_context(start_method)
+        self._slots = threading.BoundedSemaphore(workers)
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def run(self, module, name, kwargs, timeout=None, max_result_chars=None):
+        with self._slots:
+            with self._lock:
+                worker = self._idle.pop() if self._idle else None
+            if worker is not None and not worker.process.is_alive():
+                worker.kill()
+                worker = None
+            if worker is None:
+                worker = _ProcessWorker(self._context)
+
+            try:
+                ok, value = worker.call((module, name, kwargs, max_result_chars), timeout)
+            except ToolTimeout:
+                worker.kill()
+                raise ToolTimeout(f"工具 {name} 执行超过 {timeout} 秒，已终止")
+            except (EOFError, OSError) as e:
+                worker.kill()
+                raise RuntimeError(f"工具 {name} 的执行进程异常退出: {e!r}")
+
+            with self._lock:
+                self._idle.append(worker)
+
+        if not ok:
+            raise RuntimeError(value)
+        return value
+
+    def close(self):
+        with self._lock:
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            worker.kill()
+
+
+class ToolRunner:
+    """
+    按策略执行工具函数，超时抛出 ToolTimeout，工具本身的异常原样抛出。
+    process 模式只用于 ToolManager 注册的 ToolEntry（子进程按模块名和函数名导入）；
+    被替换或包装过的函数（如 until.replay 的录制/回放）退回 thread 模式，超时与截断规则不变。
+    """
+
+    def __init__(self, thread_workers=TOOL_THREAD_WORKERS, process_workers=TOOL_PROCESS_WORKERS):
+        self._threads = concurrent.futures.ThreadPoolExecutor(max_workers=thread_workers, thread_name_prefix='tool')
+        self._process_workers = process_workers
+        self._processes = None
+        self._lock = threading.Lock()
+
+    def _process_pool(self):
+        with self._lock:
+            if self._processes is None:
+                self._processes = ProcessToolPool(self._process_workers)
+            return self._processes
+
+    @staticmethod
+    def effective_mode(func, policy):
+        """实际使用的执行方式：不是 ToolEntry 的函数无法在子进程中按名称导入，process 退回 thread。"""
+        if policy.mode == 'process' and not isinstance(func, ToolEntry):
+            return 'thread'
+        return policy.mode
+
+    def run(self, name, func, kwargs, policy, cap=True):
+        """cap 为 False 时返回未截断的结果（缓存需要按项拆分原始结果，由调用方截断）。"""
+        max_chars = policy.max_result_chars if cap else None
+        mode = self.effective_mode(func, policy)
+        if mode == 'process':
+            return self._process_pool().run(func.module, func.name, kwargs, policy.timeout, max_chars)
+
+        if mode == 'thread':
+            # 复制上下文，线程中的 tracing span 与回放游标与调用方一致
+            future = self._threads.submit(contextvars.copy_context().run, functools.partial(func, **kwargs))
+            try:
+                result = future.result(policy.timeout)
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                raise ToolTimeout(f"工具 {name} 执行超过 {policy.timeout} 秒，已放弃等待")
+        else:
+            result = func(**kwargs)
+        return cap_result(result, max_chars)
+
+    async def arun(self, name, func, kwargs, policy, cap=True):
+        """run 的异步版本；协程工具在当前事件循环中执行，超时后取消。"""
+        max_chars = policy.max_result_chars if cap else None
+        if inspect.iscoroutinefunction(func):
+            try:
+                result = await asyncio.wait_for(func(**kwargs), policy.timeout)
+            except asyncio.TimeoutError:
+                raise ToolTimeout(f"工具 {name} 执行超过 {policy.timeout} 秒，已取消")
+            return cap_result(result, max_chars)
+
+        mode = self.effective_mode(func, policy)
+        if mode == 'process':
+            return await asyncio.to_thread(self._process_pool().run, func.module, func.name, kwargs,
+                                           policy.timeout, max_chars)
+
+        if mode == 'thread':
+            loop = asyncio.get_running_loop()
+            call = functools.partial(contextvars.copy_context().run, functools.partial(func, **kwargs))
+            try:
+                result = await asyncio.wait_for(loop.run_in_executor(self._threads, call), policy.timeout)
+            except asyncio.TimeoutError:
+                raise ToolTimeout(f"工具 {name} 执行超过 {policy.timeout} 秒，已放弃等待")
+        else:
+            # inline 不限时，但也不能阻塞事件循环上的其他 agent 执行
+            result = await asyncio.to_thread(func, **kwargs)
+        return cap_result(result, max_chars)
+
+    def close(self):
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.close()
+
+
+default_runner = ToolRunner()
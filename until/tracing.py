@@ -0,0 +1,193 @@
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# 默认关闭，设置 AGENT_TRACE=1 开启追踪
+TRACE_ENABLED = os.getenv('AGENT_TRACE', '0') == '1'
+TRACE_PATH = os.getenv('AGENT_TRACE_PATH', 'log/trace.jsonl')
+# trace 文件超过该字节数时改名为 <path>.1（覆盖上一个），再写入新文件；0 表示不限
+TRACE_MAX_BYTES = int(os.getenv('AGENT_TRACE_MAX_BYTES', 50 * 1024 * 1024))
+METRICS_PATH = os.getenv('AGENT_METRICS_PATH', 'log/metrics.prom')
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """
+    一次被追踪的操作。attrs 中的数值属性（token 数、重试次数、结果大小等）会汇总到 Prometheus 指标中。
+    父子关系通过 contextvars 传递，asyncio 任务和 asyncio.to_thread 中创建的 span 会挂在调用方之下。
+    """
+
+    def __init__(self, name, parent=None, **attrs):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = attrs
+        self.status = "ok"
+        self.start = time.time()
+        self.duration = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def incr(self, key, value=1):
+        self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    def set(self, **attrs):
+        pass
+
+    def incr(self, key, value=1):
+        pass
+
+
+class Tracer:
+    """
+    把结束的 span 追加写入 JSONL 文件，同时累计按 span 名称分组的耗时直方图和数值属性之和。
+    文件超过 max_bytes 时轮转，磁盘上最多保留当前文件和一个 .1 备份。
+    """
+
+    def __init__(self, path=TRACE_PATH, max_bytes=TRACE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._file = None
+        self._histograms = {}
+        self._counts = {}
+        self._sums = {}
+
+    def record(self, span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            size = self._file.tell()
+            if self.max_bytes and size and size + len(line.encode('utf-8')) >= self.max_bytes:
+                self._rotate()
+            self._file.write(line + '\n')
+            self._file.flush()
+
+            buckets, total = self._histograms.get(span.name, ([0] * len(DURATION_BUCKETS), 0.0))
+            index = bisect.bisect_left(DURATION_BUCKETS, span.duration)
+            if index < len(buckets):
+                buckets[index] += 1
+            self._histograms[span.name] = (buckets, total + span.duration)
+
+            key = (span.name, span.status)
+            self._counts[key] = self._counts.get(key, 0) + 1
+            for attr, value in span.attrs.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    key = (span.name, attr)
+                    self._sums[key] = self._sums.get(key, 0) + value
+
+    def _rotate(self):
+        self._file.close()
+        os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def prometheus_text(self):
+        """Prometheus 文本格式的指标。"""
+        lines = ["# TYPE agent_span_duration_seconds histogram"]
+        with self._lock:
+            for name, (buckets, total) in sorted(self._histograms.items()):
+                count = sum(c for (span, _), c in self._counts.items() if span == name)
+                cumulative = 0
+                for bound, bucket in zip(DURATION_BUCKETS, buckets):
+                    cumulative += bucket
+                    lines.append(f'agent_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'agent_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {count}')
+                lines.append(f'agent_span_duration_seconds_sum{{span="{name}"}} {total}')
+                lines.append(f'agent_span_duration_seconds_count{{span="{name}"}} {count}')
+
+            lines.append("# TYPE agent_span_total counter")
+            for (name, status), count in sorted(self._counts.items()):
+                lines.append(f'agent_span_total{{span="{name}",status="{status}"}} {count}')
+
+            lines.append("# TYPE agent_span_attribute_total counter")
+            for (name, attr), value in sorted(self._sums.items()):
+                lines.append(f'agent_span_attribute_total{{span="{name}",attr="{attr}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def dump_prometheus(self, path=METRICS_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+
+tracer = Tracer()
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    追踪一段代码：
+        with span("tool.call", tool=name) as s:
+            ...
+            s.set(result_size=len(result))
+    异常会记录为 status="error" 后继续抛出。
+    """
+    if not TRACE_ENABLED:
+        yield _NoopSpan()
+        return
+
+    current = Span(name, _current_span.get(), **attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration = time.time() - current.start
+        _current_span.reset(token)
+        tracer.record(current)
+
+
+def start_span(name, **attrs):
+    """创建 span 但不设为当前 span，用于跨越多次 yield 的流式调用，结束时调用 end_span。"""
+    if not TRACE_ENABLED:
+        return _NoopSpan()
+    return Span(name, _current_span.get(), **attrs)
+
+
+def end_span(current, error=None):
+    if not isinstance(current, Span):
+        return
+    if error is not None:
+        current.status = "error"
+        current.attrs["error"] = f"{type(error).__name__}: {error}"
+    current.duration = time.time() - current.start
+    tracer.record(current)
+
+
+def current_span():
+    """当前所在的 span，不在任何 span 中时返回一个忽略所有操作的对象。"""
+    return _current_span.get() or _NoopSpan()